@@ -1,14 +1,28 @@
 """
 Database connections and query functions for Vayo API.
 Read-only access to vayo_clean.db, elliman_mls.db, se_listings.db.
+
+Reads go through a per-database ConnectionPool (see pool.py); only the
+watchlist/alert writers open their own short-lived read-write connections.
 """
 
+import base64
+import json
 import sqlite3
 import os
+import threading
 from collections import defaultdict
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
+from vayo.address import CANDIDATES, has_address_index, search_address_index, fetch_ranked
+from vayo.complaint_stats import read_complaint_stats
+from vayo.scores import scores_version
+from vayo.scoring import score_one
+
+from .pool import ConnectionPool, MAX_CONNECTIONS
+
 DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 DB_PATHS = {
@@ -24,21 +38,27 @@ def _cutoff_iso():
     return (datetime.now() - timedelta(days=LOOKBACK_MONTHS * 30)).strftime("%Y-%m-%d")
 
 
-def get_db(name: str = "main") -> sqlite3.Connection:
-    path = DB_PATHS[name]
-    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    return conn
+POOLS = {name: ConnectionPool(path) for name, path in DB_PATHS.items()}
+
+
+def get_db(name: str = "main"):
+    """Borrow a pooled read-only connection: ``with get_db("se") as db: ...``"""
+    return POOLS[name].connection()
 
 
 @contextmanager
 def get_main_db():
-    conn = get_db("main")
-    try:
+    with get_db("main") as conn:
         yield conn
-    finally:
-        conn.close()
+
+
+def close_pools():
+    for pool in POOLS.values():
+        pool.close()
+
+
+def pool_stats() -> dict:
+    return {name: pool.stats() for name, pool in POOLS.items()}
 
 
 # ── Building queries ─────────────────────────────────────────────────────
@@ -52,11 +72,20 @@ def get_building(bbl: int) -> dict | None:
 
 
 def search_buildings_by_address(query: str, limit: int = 20) -> list[dict]:
+    cols = """bbl, address, zipcode, borough, year_built, num_floors,
+              units_residential, units_total, owner_name, avg_unit_sqft,
+              building_class"""
     with get_main_db() as db:
+        if has_address_index(db, "building_addr"):
+            bbls = search_address_index(db, "building_addr", query, limit)
+            rows = fetch_ranked(
+                db, f"SELECT bbl AS _rid, {cols} FROM buildings WHERE bbl IN ({{ids}})", bbls,
+            )
+            return [{k: r[k] for k in r.keys() if k != "_rid"} for r in rows]
+
+        # No index, or the table changed since it was built: scan.
         rows = db.execute(
-            """SELECT bbl, address, zipcode, borough, year_built, num_floors,
-                      units_residential, units_total, owner_name, avg_unit_sqft,
-                      building_class
+            f"""SELECT {cols}
                FROM buildings
                WHERE address LIKE ? AND units_residential > 0
                ORDER BY units_residential DESC
@@ -76,8 +105,13 @@ def search_buildings_filtered(
     offset: int = 0,
     sort_by: str = "gem_score",
     sort_dir: str = "desc",
+    cursor: str | None = None,
 ) -> dict:
-    """Search buildings with filters. Uses building_scores table if available."""
+    """Search buildings with filters. Uses building_scores table if available.
+
+    Pass the previous page's ``next_cursor`` as ``cursor`` to page by keyset
+    instead of OFFSET; ``offset`` is still honored when no cursor is given.
+    """
     with get_main_db() as db:
         # Check if building_scores table exists
         has_scores = db.execute(
@@ -87,7 +121,7 @@ def search_buildings_filtered(
         if has_scores:
             return _search_with_scores(
                 db, borough, zipcode, min_units, min_gem,
-                rent_stabilized_only, limit, offset, sort_by, sort_dir,
+                rent_stabilized_only, limit, offset, sort_by, sort_dir, cursor,
             )
         else:
             return _search_without_scores(
@@ -96,16 +130,62 @@ def search_buildings_filtered(
             )
 
 
+SCORE_SORTS = {"gem_score", "avail_score", "combined"}
+BUILDING_SORTS = {"units_residential", "year_built"}
+
+_COUNT_CACHE_SIZE = 512
+_count_cache: dict[tuple, int] = {}
+_count_cache_lock = threading.Lock()
+
+
+def _encode_cursor(sort_by: str, direction: str, value, bbl: int) -> str:
+    raw = json.dumps([sort_by, direction, value, bbl], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort_by: str, direction: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        c_sort, c_dir, value, bbl = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("malformed cursor")
+    if (c_sort, c_dir) != (sort_by, direction):
+        raise ValueError("cursor was issued for a different sort order")
+    return value, int(bbl)
+
+
+def _cached_count(db, count_q: str, params: list) -> int:
+    """COUNT(*) for a filter, cached until building_scores is rewritten."""
+    key = (scores_version(db), count_q, tuple(params))
+    if key[0] is not None:
+        with _count_cache_lock:
+            if key in _count_cache:
+                return _count_cache[key]
+    total = db.execute(count_q, params).fetchone()[0]
+    if key[0] is not None:
+        with _count_cache_lock:
+            if len(_count_cache) >= _COUNT_CACHE_SIZE:
+                _count_cache.pop(next(iter(_count_cache)))
+            _count_cache[key] = total
+    return total
+
+
 def _search_with_scores(db, borough, zipcode, min_units, min_gem,
-                         rent_stabilized_only, limit, offset, sort_by, sort_dir):
+                         rent_stabilized_only, limit, offset, sort_by, sort_dir,
+                         cursor=None):
+    # Filter on the copies in building_scores when present, so the
+    # (borough|zipcode, score) indexes drive the scan.
+    score_cols = {r[1] for r in db.execute("PRAGMA table_info(building_scores)")}
+    loc = "s" if "borough" in score_cols else "b"
+
     where = ["b.units_residential >= ?", "b.residential_area > 0"]
     params: list = [min_units]
 
     if borough:
-        where.append("b.borough = ?")
+        where.append(f"{loc}.borough = ?")
         params.append(borough.upper()[:2])
     if zipcode:
-        where.append("b.zipcode = ?")
+        where.append(f"{loc}.zipcode = ?")
         params.append(zipcode)
     if min_gem is not None:
         where.append("s.gem_score >= ?")
@@ -113,32 +193,52 @@ def _search_with_scores(db, borough, zipcode, min_units, min_gem,
     if rent_stabilized_only:
         where.append("s.rent_stabilized = 1")
 
-    allowed_sorts = {"gem_score", "avail_score", "combined", "units_residential", "year_built"}
-    if sort_by not in allowed_sorts:
+    if sort_by not in SCORE_SORTS | BUILDING_SORTS:
         sort_by = "gem_score"
     direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
+    if sort_by in SCORE_SORTS:
+        sort_expr = f"s.{sort_by}"
+    else:
+        # NULLs sort as 0 so the keyset comparison below stays total.
+        sort_expr = f"COALESCE(b.{sort_by}, 0)"
 
     count_q = f"""
         SELECT COUNT(*) FROM buildings b
         JOIN building_scores s ON b.bbl = s.bbl
         WHERE {' AND '.join(where)}
     """
-    total = db.execute(count_q, params).fetchone()[0]
+    total = _cached_count(db, count_q, params)
+
+    page_where = list(where)
+    page_params = list(params)
+    if cursor:
+        value, after_bbl = _decode_cursor(cursor, sort_by, direction)
+        op = "<" if direction == "DESC" else ">"
+        page_where.append(f"({sort_expr}, s.bbl) {op} (?, ?)")
+        page_params.extend([value, after_bbl])
+        offset = 0
 
     q = f"""
         SELECT b.bbl, b.address, b.zipcode, b.borough, b.year_built, b.num_floors,
                b.units_residential, b.owner_name, b.avg_unit_sqft, b.building_class,
                s.gem_score, s.avail_score, s.combined, s.signal_count,
-               s.convergence, s.rent_stabilized, s.stab_units, s.signals
+               s.convergence, s.rent_stabilized, s.stab_units, s.signals,
+               {sort_expr} AS _sort_key
         FROM buildings b
         JOIN building_scores s ON b.bbl = s.bbl
-        WHERE {' AND '.join(where)}
-        ORDER BY s.{sort_by} {direction}
+        WHERE {' AND '.join(page_where)}
+        ORDER BY {sort_expr} {direction}, s.bbl {direction}
         LIMIT ? OFFSET ?
     """
-    params.extend([limit, offset])
-    rows = db.execute(q, params).fetchall()
-    return {"total": total, "buildings": [dict(r) for r in rows]}
+    page_params.extend([limit, offset])
+    rows = db.execute(q, page_params).fetchall()
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort_by, direction, last["_sort_key"], last["bbl"])
+    buildings = [{k: r[k] for k in r.keys() if k != "_sort_key"} for r in rows]
+    return {"total": total, "buildings": buildings, "next_cursor": next_cursor}
 
 
 def _search_without_scores(db, borough, zipcode, min_units,
@@ -164,7 +264,7 @@ def _search_without_scores(db, borough, zipcode, min_units,
     params.extend([limit, offset])
     rows = db.execute(q, params).fetchall()
     total = len(rows)  # approximate
-    return {"total": total, "buildings": [dict(r) for r in rows]}
+    return {"total": total, "buildings": [dict(r) for r in rows], "next_cursor": None}
 
 
 # ── Building detail queries ──────────────────────────────────────────────
@@ -182,6 +282,11 @@ def get_complaints(bbl: int, limit: int = 100, offset: int = 0) -> list[dict]:
 
 def get_complaint_stats(bbl: int) -> dict:
     with get_main_db() as db:
+        stats = read_complaint_stats(db, bbl)
+        if stats is not None:
+            return stats
+
+        # No rollup in this DB: aggregate live.
         total = db.execute(
             "SELECT COUNT(*) FROM hpd_complaints WHERE bbl = ?", [bbl]
         ).fetchone()[0]
@@ -197,10 +302,17 @@ def get_complaint_stats(bbl: int) -> dict:
                GROUP BY category ORDER BY cnt DESC LIMIT 10""",
             [bbl],
         ).fetchall()
+        by_severity = db.execute(
+            """SELECT severity, COUNT(*) as cnt
+               FROM hpd_complaints WHERE bbl = ?
+               GROUP BY severity ORDER BY cnt DESC""",
+            [bbl],
+        ).fetchall()
         return {
             "total": total,
             "by_year": [dict(r) for r in by_year],
             "by_category": [dict(r) for r in by_category],
+            "by_severity": [dict(r) for r in by_severity],
         }
 
 
@@ -311,7 +423,19 @@ def get_service_requests(bbl: int, limit: int = 50) -> list[dict]:
 # ── Scoring ──────────────────────────────────────────────────────────────
 
 def get_building_score(bbl: int) -> dict | None:
+    """Fresh scores for one building, computed from the source tables (and
+    cached until they change). Buildings the scorer skips fall back to the
+    last batch run's building_scores row."""
     with get_main_db() as db:
+        try:
+            fresh = score_one(db, bbl, _cutoff_iso())
+        except sqlite3.OperationalError:
+            fresh = None
+        if fresh is not None:
+            score = dict(fresh)
+            # Same shape as a building_scores row
+            score["signals"] = json.dumps(score["signals"]) if score["signals"] else None
+            return score
         has_scores = db.execute(
             "SELECT name FROM sqlite_master WHERE type='table' AND name='building_scores'"
         ).fetchone()
@@ -334,11 +458,6 @@ def get_elliman_listings(
     limit: int = 50,
     offset: int = 0,
 ) -> list[dict]:
-    try:
-        db = get_db("elliman")
-    except Exception:
-        return []
-
     where = ["1=1"]
     params: list = []
 
@@ -358,39 +477,52 @@ def get_elliman_listings(
         where.append("listing_type = ?")
         params.append(listing_type)
 
-    rows = db.execute(
-        f"""SELECT core_listing_id, address, unit, city, zip, neighborhood,
-                   borough, latitude, longitude, list_price, bedrooms,
-                   bathrooms_total, living_area_sqft, listing_type,
-                   listing_status, list_date, home_type
-            FROM listings
-            WHERE {' AND '.join(where)}
-            ORDER BY list_date DESC
-            LIMIT ? OFFSET ?""",
-        params + [limit, offset],
-    ).fetchall()
-    db.close()
+    try:
+        with get_db("elliman") as db:
+            rows = db.execute(
+                f"""SELECT core_listing_id, address, unit, city, zip, neighborhood,
+                           borough, latitude, longitude, list_price, bedrooms,
+                           bathrooms_total, living_area_sqft, listing_type,
+                           listing_status, list_date, home_type
+                    FROM listings
+                    WHERE {' AND '.join(where)}
+                    ORDER BY list_date DESC
+                    LIMIT ? OFFSET ?""",
+                params + [limit, offset],
+            ).fetchall()
+    except sqlite3.OperationalError:
+        return []
     return [dict(r) for r in rows]
 
 
 def get_elliman_listings_for_building(address: str) -> list[dict]:
     """Find Elliman listings matching a building address."""
+    cols = """core_listing_id, address, unit, list_price, close_price,
+              bedrooms, bathrooms_total, living_area_sqft, listing_type,
+              listing_status, list_date, close_date, price_per_sqft,
+              public_remarks"""
     try:
-        db = get_db("elliman")
-    except Exception:
+        with get_db("elliman") as db:
+            if has_address_index(db, "listing_addr"):
+                ids = search_address_index(db, "listing_addr", address, limit=CANDIDATES)
+                if not ids:
+                    return []
+                rows = db.execute(
+                    f"""SELECT {cols} FROM listings
+                        WHERE rowid IN ({','.join('?' * len(ids))})
+                        ORDER BY list_date DESC LIMIT 50""",
+                    ids,
+                ).fetchall()
+            else:
+                rows = db.execute(
+                    f"""SELECT {cols}
+                       FROM listings
+                       WHERE address LIKE ?
+                       ORDER BY list_date DESC LIMIT 50""",
+                    [f"%{address.upper()}%"],
+                ).fetchall()
+    except sqlite3.OperationalError:
         return []
-
-    rows = db.execute(
-        """SELECT core_listing_id, address, unit, list_price, close_price,
-                  bedrooms, bathrooms_total, living_area_sqft, listing_type,
-                  listing_status, list_date, close_date, price_per_sqft,
-                  public_remarks
-           FROM listings
-           WHERE address LIKE ?
-           ORDER BY list_date DESC LIMIT 50""",
-        [f"%{address.upper()}%"],
-    ).fetchall()
-    db.close()
     return [dict(r) for r in rows]
 
 
@@ -398,20 +530,25 @@ def get_elliman_listings_for_building(address: str) -> list[dict]:
 
 def get_se_building(address: str) -> dict | None:
     """Find a StreetEasy building by address match."""
+    cols = """slug, address, total_units, stories, year_built,
+              neighborhood, building_type, pet_policy, amenities"""
     try:
-        db = get_db("se")
-    except Exception:
+        with get_db("se") as db:
+            if has_address_index(db, "se_building_addr"):
+                ids = search_address_index(db, "se_building_addr", address, limit=1)
+                row = db.execute(
+                    f"SELECT {cols} FROM buildings WHERE rowid = ?", ids
+                ).fetchone() if ids else None
+            else:
+                row = db.execute(
+                    f"""SELECT {cols}
+                       FROM buildings
+                       WHERE address LIKE ? AND status = 'ok'
+                       LIMIT 1""",
+                    [f"%{address}%"],
+                ).fetchone()
+    except sqlite3.OperationalError:
         return None
-
-    row = db.execute(
-        """SELECT slug, address, total_units, stories, year_built,
-                  neighborhood, building_type, pet_policy, amenities
-           FROM buildings
-           WHERE address LIKE ? AND status = 'ok'
-           LIMIT 1""",
-        [f"%{address}%"],
-    ).fetchone()
-    db.close()
     if row:
         return dict(row)
     return None
@@ -419,22 +556,94 @@ def get_se_building(address: str) -> dict | None:
 
 def get_se_units(slug: str) -> list[dict]:
     try:
-        db = get_db("se")
-    except Exception:
+        with get_db("se") as db:
+            rows = db.execute(
+                """SELECT unit, listing_type, date, price, price_numeric,
+                          status, beds, baths, sqft, availability
+                   FROM unit_summary
+                   WHERE building_slug = ?
+                   ORDER BY date DESC""",
+                [slug],
+            ).fetchall()
+    except sqlite3.OperationalError:
         return []
-
-    rows = db.execute(
-        """SELECT unit, listing_type, date, price, price_numeric,
-                  status, beds, baths, sqft, availability
-           FROM unit_summary
-           WHERE building_slug = ?
-           ORDER BY date DESC""",
-        [slug],
-    ).fetchall()
-    db.close()
     return [dict(r) for r in rows]
 
 
+def get_building_listings(bbl: int, building: dict | None = None) -> dict | None:
+    """Elliman + StreetEasy listings for a building, matched by address."""
+    building = building or get_building(bbl)
+    if not building:
+        return None
+
+    address = building.get("address", "")
+    elliman = get_elliman_listings_for_building(address) if address else []
+
+    se_building = get_se_building(address) if address else None
+    se_units = []
+    if se_building:
+        se_units = get_se_units(se_building["slug"])
+
+    return {
+        "elliman": elliman,
+        "streeteasy": {"building": se_building, "units": se_units},
+    }
+
+
+# ── Dossier ("Building Carfax") ──────────────────────────────────────────
+
+# Each section is one independent query; the dossier runs them side by side
+# on pooled connections. Threads beyond the pool cap just wait for a slot.
+DOSSIER_SECTIONS = {
+    "score": get_building_score,
+    "complaint_stats": get_complaint_stats,
+    "complaints": get_complaints,
+    "sales": get_sales,
+    "permits": get_permits,
+    "violations": get_violations,
+    "contacts": get_contacts,
+    "litigation": get_litigation,
+    "evictions": get_evictions,
+    "rent_stab": get_rent_stabilization,
+    "dob_complaints": get_dob_complaints,
+    "service_requests": get_service_requests,
+    "listings": get_building_listings,
+}
+
+_dossier_executor = ThreadPoolExecutor(
+    max_workers=MAX_CONNECTIONS, thread_name_prefix="dossier"
+)
+
+
+def get_building_dossier(bbl: int, sections: list[str] | None = None) -> dict | None:
+    """Building record plus the requested detail sections in one payload.
+
+    Returns None if the building doesn't exist. ``sections`` defaults to
+    every section in DOSSIER_SECTIONS; unknown names raise ValueError.
+    """
+    wanted = list(DOSSIER_SECTIONS) if sections is None else list(dict.fromkeys(sections))
+    unknown = [s for s in wanted if s not in DOSSIER_SECTIONS]
+    if unknown:
+        raise ValueError(f"unknown dossier sections: {', '.join(unknown)}")
+
+    building = get_building(bbl)
+    if not building:
+        return None
+
+    futures = {}
+    for name in wanted:
+        fn = DOSSIER_SECTIONS[name]
+        if fn is get_building_listings:
+            futures[name] = _dossier_executor.submit(fn, bbl, building)
+        else:
+            futures[name] = _dossier_executor.submit(fn, bbl)
+
+    dossier = {"building": building}
+    for name, fut in futures.items():
+        dossier[name] = fut.result()
+    return dossier
+
+
 # ── Watchlist ────────────────────────────────────────────────────────────
 
 def _ensure_watchlist_tables(db):
@@ -0,0 +1,182 @@
+"""
+Read-only SQLite connection pool for the Vayo API.
+
+Each database (main, elliman, se) gets one pool. Connections are opened
+read-only, tuned for large sequential reads (mmap + big page cache), and
+kept alive between requests so the schema and hot pages stay loaded.
+
+A worker thread gets back the connection it used last whenever that
+connection is idle, so the same thread keeps hitting a warm cache. The
+number of open connections per database is capped; callers block until
+a slot frees up.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+MMAP_SIZE = 8 * 1024 ** 3          # map up to 8 GB of the file
+CACHE_SIZE_KB = 256 * 1024         # 256 MB page cache per connection
+MAX_CONNECTIONS = 8
+ACQUIRE_TIMEOUT = 30.0             # seconds to wait for a free slot
+HEALTH_CHECK_INTERVAL = 60.0       # re-validate idle connections after this
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection frees up within the acquire timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "inode", "checked_at")
+
+    def __init__(self, conn: sqlite3.Connection, inode: int | None):
+        self.conn = conn
+        self.inode = inode
+        self.checked_at = time.monotonic()
+
+
+def _file_inode(path: str) -> int | None:
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return None
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived read-only connections to one database."""
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = MAX_CONNECTIONS,
+        mmap_size: int = MMAP_SIZE,
+        cache_size_kb: int = CACHE_SIZE_KB,
+        timeout: float = ACQUIRE_TIMEOUT,
+        health_check_interval: float = HEALTH_CHECK_INTERVAL,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._idle: list[_PooledConnection] = []
+        self._local = threading.local()
+        self._open = 0
+
+    # ── Connection lifecycle ────────────────────────────────────────────
+
+    def _connect(self) -> _PooledConnection:
+        conn = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only=1")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return _PooledConnection(conn, _file_inode(self.path))
+
+    def _healthy(self, pc: _PooledConnection) -> bool:
+        """Cheap liveness check, run only on connections idle for a while.
+
+        Also catches the database file being swapped out underneath us
+        (a rebuild replaces vayo_clean.db), in which case the old handle
+        would keep serving the deleted file.
+        """
+        if time.monotonic() - pc.checked_at < self.health_check_interval:
+            return True
+        if _file_inode(self.path) != pc.inode:
+            return False
+        try:
+            pc.conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        pc.checked_at = time.monotonic()
+        return True
+
+    def _discard(self, pc: _PooledConnection):
+        try:
+            pc.conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._open -= 1
+
+    def _take_idle(self) -> _PooledConnection | None:
+        preferred = getattr(self._local, "last", None)
+        with self._lock:
+            if preferred is not None and preferred in self._idle:
+                self._idle.remove(preferred)
+                return preferred
+            if self._idle:
+                return self._idle.pop()
+        return None
+
+    def _checkout(self) -> _PooledConnection:
+        while True:
+            pc = self._take_idle()
+            if pc is None:
+                break
+            if self._healthy(pc):
+                return pc
+            self._discard(pc)
+
+        with self._lock:
+            self._open += 1
+        try:
+            return self._connect()
+        except BaseException:
+            with self._lock:
+                self._open -= 1
+            raise
+
+    def _checkin(self, pc: _PooledConnection):
+        if pc.conn.in_transaction:
+            pc.conn.rollback()
+        self._local.last = pc
+        with self._lock:
+            self._idle.append(pc)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(
+                f"no free connection to {os.path.basename(self.path)} "
+                f"after {self.timeout:.0f}s ({self.max_size} in use)"
+            )
+        try:
+            pc = self._checkout()
+            try:
+                yield pc.conn
+            except sqlite3.DatabaseError:
+                # Might be a bad query, might be a wedged handle (replaced
+                # file, I/O error). Force a health check on next checkout.
+                pc.checked_at = float("-inf")
+                raise
+            finally:
+                self._checkin(pc)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close every idle connection (called on shutdown)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pc in idle:
+            self._discard(pc)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "open": self._open,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+            }
@@ -3,9 +3,10 @@ Vayo API — FastAPI server for NYC building data.
 
 Routes:
   /api/buildings/search?q=...         Address search
-  /api/buildings?borough=&zip=&...    Filtered building list
+  /api/buildings?borough=&zip=&...    Filtered building list (keyset: &cursor=next_cursor)
   /api/buildings/{bbl}                Building detail
-  /api/buildings/{bbl}/score          Building scores
+  /api/buildings/{bbl}/dossier        Detail + any sections in one call
+  /api/buildings/{bbl}/score          Building scores (computed on demand)
   /api/buildings/{bbl}/complaints     HPD complaints
   /api/buildings/{bbl}/complaint-stats Complaint statistics
   /api/buildings/{bbl}/sales          ACRIS sales
@@ -19,6 +20,7 @@ Routes:
   /api/listings                       Elliman MLS listings
   /api/watchlist                      Watchlist CRUD
   /api/alerts                         Alert feed
+  /api/health                         DB connection pool status
 
 Start: uvicorn api.server:app --reload --port 8000
 """
@@ -39,6 +41,16 @@ app.add_middleware(
 )
 
 
+@app.on_event("shutdown")
+def close_db_pools():
+    db.close_pools()
+
+
+@app.get("/api/health")
+def health():
+    return {"ok": True, "pools": db.pool_stats()}
+
+
 # ── Building Search ──────────────────────────────────────────────────────
 
 @app.get("/api/buildings/search")
@@ -58,18 +70,23 @@ def list_buildings(
     offset: int = 0,
     sort: str = "gem_score",
     dir: str = "desc",
+    cursor: str | None = None,
 ):
-    return db.search_buildings_filtered(
-        borough=borough,
-        zipcode=zip,
-        min_units=min_units,
-        min_gem=min_gem,
-        rent_stabilized_only=rent_stabilized,
-        limit=limit,
-        offset=offset,
-        sort_by=sort,
-        sort_dir=dir,
-    )
+    try:
+        return db.search_buildings_filtered(
+            borough=borough,
+            zipcode=zip,
+            min_units=min_units,
+            min_gem=min_gem,
+            rent_stabilized_only=rent_stabilized,
+            limit=limit,
+            offset=offset,
+            sort_by=sort,
+            sort_dir=dir,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ── Building Detail ──────────────────────────────────────────────────────
@@ -82,6 +99,19 @@ def get_building(bbl: int):
     return building
 
 
+@app.get("/api/buildings/{bbl}/dossier")
+def get_building_dossier(bbl: int, sections: str | None = None):
+    """Building plus detail sections, e.g. ?sections=score,complaint_stats"""
+    wanted = [s.strip() for s in sections.split(",") if s.strip()] if sections else None
+    try:
+        dossier = db.get_building_dossier(bbl, wanted)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not dossier:
+        raise HTTPException(status_code=404, detail="Building not found")
+    return dossier
+
+
 @app.get("/api/buildings/{bbl}/score")
 def get_building_score(bbl: int):
     score = db.get_building_score(bbl)
@@ -151,22 +181,10 @@ def get_311(bbl: int, limit: int = 50):
 @app.get("/api/buildings/{bbl}/listings")
 def get_listings_for_building(bbl: int):
     """Get Elliman + StreetEasy listings for a building."""
-    building = db.get_building(bbl)
-    if not building:
+    listings = db.get_building_listings(bbl)
+    if listings is None:
         raise HTTPException(status_code=404, detail="Building not found")
-
-    address = building.get("address", "")
-    elliman = db.get_elliman_listings_for_building(address) if address else []
-
-    se_building = db.get_se_building(address) if address else None
-    se_units = []
-    if se_building:
-        se_units = db.get_se_units(se_building["slug"])
-
-    return {
-        "elliman": elliman,
-        "streeteasy": {"building": se_building, "units": se_units},
-    }
+    return listings
 
 
 # ── Elliman MLS ──────────────────────────────────────────────────────────
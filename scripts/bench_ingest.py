@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Offline ingestion benchmark: runs pull_datasets.py (cached and --stream),
+pull_acris_partitioned.py and pull_fresh_data.py against the local Socrata
+stand-in (vayo.mock_socrata) and reports throughput, retries and resume
+correctness.
+
+Each puller runs in three scenarios, each in a fresh scratch directory:
+
+  clean    no faults; its rows/sec is the number to watch
+  faults   a share of 429s, 503s and truncated bodies; the pull must still
+           produce exactly the records a clean pull does
+  resume   an outage part-way through, then a rerun (with --resume for
+           pull_datasets and --stream; pull_acris_partitioned resumes from its plan and
+           caches). pull_fresh_data has no resume: its failed run must leave
+           the tables as they were, and the rerun must match a clean run
+
+Pulls use the scripts' own functions, with their cache/DB paths pointed at
+the scratch directory and their pages shrunk to --batch rows. Requests go
+through vayo.socrata as in production, but with --rate (default: unlimited)
+and short backoffs, so a benchmark takes a minute, not a night.
+
+Usage:
+    python3 scripts/bench_ingest.py
+    python3 scripts/bench_ingest.py --rows 200000 --latency 0.2 --rate 4
+    python3 scripts/bench_ingest.py --only datasets --verbose
+    python3 scripts/bench_ingest.py --save bench.json
+    python3 scripts/bench_ingest.py --baseline bench.json     # exit 1 on a regression
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import vayo.socrata as socrata
+from vayo.batchcache import BatchCache, iter_tree
+from vayo.datasets import ANY_BBL, dataset_row
+from vayo.ingest import staged, staged_rows
+from vayo.mock_socrata import MockSocrata
+
+SCRIPTS = Path(__file__).resolve().parent
+PULLERS = ['datasets', 'stream', 'partitioned', 'fresh_data']
+SCENARIOS = ['clean', 'faults', 'resume']
+FAULTS = {'throttle': 0.05, 'errors': 0.05, 'truncate': 0.03, 'retry_after': 0.05}
+TOLERANCE = 0.2          # rows/sec below baseline × (1 - TOLERANCE) is a regression
+
+
+def load_script(name):
+    spec = importlib.util.spec_from_file_location(name, SCRIPTS / f"{name}.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def digest(rows):
+    """Order-independent fingerprint of a list of records or row tuples."""
+    h = hashlib.sha1()
+    for line in sorted(json.dumps(r, sort_keys=True) for r in rows):
+        h.update(line.encode())
+    return h.hexdigest()
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Pullers: setup(scratch) points a script at a scratch dir, run(resume)
+# pulls and returns False if the pull failed, check() returns a list of
+# problems with what's on disk.
+# ══════════════════════════════════════════════════════════════════════════
+
+class DatasetsPuller:
+    script = 'pull_datasets'
+
+    def __init__(self, server, batch):
+        self.server = server
+        self.mod = load_script(self.script)
+        self.mod.BATCH = batch
+
+    def setup(self, scratch):
+        self.mod.CACHE_DIR = scratch / 'data_cache'
+        self.mod.OUT_DB = scratch / 'vayo_clean.db'
+
+    def run(self, resume=False):
+        asyncio.run(self.mod.pull_all(self.mod.DATASETS, resume))
+        return True
+
+    def check(self):
+        bad = []
+        for name, config in self.mod.DATASETS.items():
+            got = list(BatchCache(self.mod.CACHE_DIR / name))
+            want = self.server.expected(config['url'], {'$select': config['select'],
+                                                        '$order': config['order']})
+            if got != want:
+                bad.append(f"{name}: {len(got):,} cached, {len(want):,} expected")
+        return bad
+
+
+class StreamPuller(DatasetsPuller):
+    """pull_datasets.py --stream: pages normalized straight into
+    data_staging.db. Checked against the row builders applied to a clean
+    pull's records."""
+
+    def setup(self, scratch):
+        super().setup(scratch)
+        self.mod.STAGING_DB = scratch / 'data_staging.db'
+
+    def run(self, resume=False):
+        asyncio.run(self.mod.stream_all(self.mod.DATASETS, resume, keep_cache=False))
+        return True
+
+    def check(self):
+        bad = []
+        for name, config in self.mod.DATASETS.items():
+            if not staged(self.mod.STAGING_DB, name):
+                bad.append(f"{name}: not staged")
+                continue
+            got = [list(r) for r in staged_rows(self.mod.STAGING_DB, name)]
+            want = [list(r) for r in (dataset_row(name, rec, ANY_BBL) for rec in
+                                      self.server.expected(config['url'], {
+                                          '$select': config['select'],
+                                          '$order': config['order']}))
+                    if r is not None]
+            if got != want:
+                bad.append(f"{name}: {len(got):,} staged, {len(want):,} expected")
+        return bad
+
+
+class PartitionedPuller:
+    script = 'pull_acris_partitioned'
+
+    def __init__(self, server, batch):
+        self.server = server
+        self.mod = load_script(self.script)
+        self.mod.BATCH = batch
+        self.mod.CHUNK_ROWS = max(batch, server.rows // 8)
+        self.endpoints = [
+            ('legals', self.mod.LEGALS_BASE, self.mod.LEGALS_SELECT, self.mod.LEGALS_SEEDS, 5),
+            ('parties', self.mod.PARTIES_BASE, self.mod.PARTIES_SELECT, self.mod.PARTIES_SEEDS, 6),
+        ]
+
+    def setup(self, scratch):
+        self.mod.CACHE_DIR = scratch / 'acris_cache'
+
+    def run(self, resume=False):
+        for endpoint in self.endpoints:
+            asyncio.run(self.mod.pull_endpoint(*endpoint))
+        return True
+
+    def check(self):
+        bad = []
+        for name, url, select, _, _ in self.endpoints:
+            got = list(iter_tree(self.mod.CACHE_DIR / f"{name}_parts"))
+            want = self.server.expected(url, {'$select': select})
+            if len(got) != len(want) or digest(got) != digest(want):
+                bad.append(f"{name}: {len(got):,} cached, {len(want):,} expected")
+        return bad
+
+
+class FreshDataPuller:
+    script = 'pull_fresh_data'
+    TABLES = ('dob_permits', 'acris_transactions')
+
+    def __init__(self, server, batch):
+        self.server = server
+        self.mod = load_script(self.script)
+        self.mod.BATCH = batch
+        self.reference = None       # table digests of a clean run
+
+    def setup(self, scratch):
+        """A scratch vayo_clean.db holding the tables pull_fresh_data
+        replaces, and buildings for ~70% of the BBLs the mock serves."""
+        self.mod.DB = str(scratch / 'vayo_clean.db')
+        legals = self.server.dataset('8h5j-fqxa')
+        permits = self.server.dataset('w9ak-ipjd')
+        bbls = {int(b) for b in permits.column('bbl')}
+        bbls.update(int(f"{b}{int(bl):05d}{int(lt):04d}") for b, bl, lt in
+                    zip(legals.column('borough'), legals.column('block'), legals.column('lot')))
+        db = sqlite3.connect(self.mod.DB)
+        db.executescript("""
+            CREATE TABLE buildings (bbl INTEGER PRIMARY KEY);
+            CREATE TABLE dob_permits (
+                bbl INTEGER, job_type TEXT, job_description TEXT,
+                job_status_description TEXT, latest_action_date TEXT,
+                initial_cost TEXT, existing_dwelling_units TEXT,
+                proposed_dwelling_units TEXT
+            );
+            CREATE TABLE acris_transactions (
+                document_id TEXT, bbl INTEGER, unit TEXT, doc_type TEXT,
+                document_date TEXT, recorded_datetime TEXT, document_amt REAL,
+                party_seller TEXT, party_buyer TEXT
+            );
+        """)
+        db.executemany("INSERT INTO buildings VALUES (?)",
+                       ((b,) for b in sorted(bbls) if b % 10 < 7))
+        db.commit()
+        db.close()
+
+    def run(self, resume=False):
+        db = sqlite3.connect(self.mod.DB)
+        try:
+            with self.mod.SyncClient() as client:
+                self.mod.pull_dob_now(db, client)
+                self.mod.pull_acris(db, client)
+            return True
+        except socrata.FetchError:
+            return False
+        finally:
+            db.close()      # uncommitted work rolls back, as when the script dies
+
+    def tables(self):
+        db = sqlite3.connect(self.mod.DB)
+        try:
+            return {t: digest(db.execute(f"SELECT * FROM {t}").fetchall()) for t in self.TABLES}
+        finally:
+            db.close()
+
+    def check(self):
+        tables = self.tables()
+        if self.reference is None:
+            self.reference = tables
+        return [f"{t} differs from a clean run" for t in self.TABLES
+                if tables[t] != self.reference[t]]
+
+
+PULLER_CLASSES = {'datasets': DatasetsPuller, 'stream': StreamPuller,
+                  'partitioned': PartitionedPuller,
+                  'fresh_data': FreshDataPuller}
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Scenarios
+# ══════════════════════════════════════════════════════════════════════════
+
+def timed(server, fn):
+    server.reset_stats()
+    t = time.time()
+    ok = fn()
+    return ok, time.time() - t, dict(server.stats)
+
+
+def scenario(server, puller, name, clean_requests):
+    """Run one scenario; returns (seconds, server stats, problems)."""
+    problems = []
+    if name == 'clean':
+        ok, secs, stats = timed(server, puller.run)
+    elif name == 'faults':
+        server.faults.update(FAULTS)
+        try:
+            ok, secs, stats = timed(server, puller.run)
+        finally:
+            server.clear_faults()
+    else:
+        if isinstance(puller, FreshDataPuller):
+            puller.run()                # the tables a failed refresh must leave alone
+        server.faults['outage_after'] = max(1, clean_requests // 2)
+        try:
+            first_ok, secs, stats = timed(server, puller.run)
+        finally:
+            server.clear_faults()
+        if isinstance(puller, FreshDataPuller):
+            if first_ok:
+                problems.append("the outage didn't stop the run")
+            problems += [f"after the failed run: {p}" for p in puller.check()]
+        ok, more_secs, more = timed(server, lambda: puller.run(resume=True))
+        secs += more_secs
+        stats = {k: stats[k] + more[k] for k in stats}
+    if not ok:
+        problems.append("pull failed")
+    problems += puller.check()
+    return secs, stats, problems
+
+
+def bench(args):
+    socrata.RATE = args.rate
+    socrata.BACKOFF = 0.01
+    socrata.BACKOFF_CAP = 0.05
+    socrata.RATE_LIMIT_WAIT = 0.05
+
+    results = []
+    with MockSocrata(rows=args.rows, latency=args.latency) as server:
+        os.environ['SOCRATA_BASE'] = server.url
+        for key in args.only or PULLERS:
+            puller = PULLER_CLASSES[key](server, args.batch)
+            clean_requests = None
+            # An untimed pull first, so the mock has built its columns and
+            # query results before anything is measured.
+            for name in ['warmup'] + SCENARIOS:
+                scratch = Path(tempfile.mkdtemp(prefix=f"bench_{key}_"))
+                try:
+                    puller.setup(scratch)
+                    out = None if args.verbose else io.StringIO()
+                    with contextlib.redirect_stdout(out or sys.stdout):
+                        if name == 'warmup':
+                            puller.run()
+                            continue
+                        secs, stats, problems = scenario(server, puller, name, clean_requests)
+                finally:
+                    shutil.rmtree(scratch, ignore_errors=True)
+                if name == 'clean':
+                    clean_requests = stats['requests']
+                result = {'puller': key, 'scenario': name, 'seconds': round(secs, 2),
+                          'rows_per_sec': round(stats['rows'] / secs) if secs else 0,
+                          **stats, 'problems': problems}
+                results.append(result)
+                report(result)
+    return results
+
+
+def report(r):
+    status = 'ok' if not r['problems'] else 'FAIL: ' + '; '.join(r['problems'])
+    print(f"  {r['puller']:<12} {r['scenario']:<7} {r['rows']:>10,} rows {r['seconds']:>7.1f}s "
+          f"{r['rows_per_sec']:>9,}/s  req {r['requests']:>5} 429 {r['throttled']:>3} "
+          f"5xx {r['errors']:>3} cut {r['truncated']:>3}  {status}", flush=True)
+
+
+def regressions(results, baseline, tolerance):
+    base = {(r['puller'], r['scenario']): r for r in baseline}
+    found = []
+    for r in results:
+        b = base.get((r['puller'], r['scenario']))
+        if r['scenario'] != 'clean' or not b:
+            continue
+        if r['rows_per_sec'] < b['rows_per_sec'] * (1 - tolerance):
+            found.append(f"{r['puller']}: {r['rows_per_sec']:,} rows/s vs "
+                         f"{b['rows_per_sec']:,} baseline")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion benchmark")
+    parser.add_argument('--rows', type=int, default=60_000, help="rows per mock dataset")
+    parser.add_argument('--batch', type=int, default=5_000, help="page size ($limit)")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per mock request")
+    parser.add_argument('--rate', type=float, default=0, help="client requests/sec (0: unlimited)")
+    parser.add_argument('--only', action='append', choices=PULLERS)
+    parser.add_argument('--save', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare clean rows/sec with this saved run")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--verbose', action='store_true', help="show the pullers' output")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print(f"  INGESTION BENCHMARK ({args.rows:,} rows/dataset, pages of {args.batch:,}, "
+          f"{args.latency * 1000:.0f}ms latency)")
+    print("=" * 70)
+    results = bench(args)
+
+    failed = [f"{r['puller']}/{r['scenario']}" for r in results if r['problems']]
+    slow = []
+    if args.baseline:
+        with open(args.baseline) as fh:
+            slow = regressions(results, json.load(fh), args.tolerance)
+    if args.save:
+        with open(args.save, 'w') as fh:
+            json.dump(results, fh, indent=1)
+        print(f"\n  Saved {args.save}")
+
+    for line in failed:
+        print(f"  INCORRECT: {line}")
+    for line in slow:
+        print(f"  REGRESSION: {line}")
+    if failed or slow:
+        sys.exit(1)
+    print("\n  All pulls correct.")
+
+
+if __name__ == '__main__':
+    main()
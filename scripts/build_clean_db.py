@@ -9,11 +9,18 @@ Output: vayo_clean.db with properly joined tables
 """
 
 import sqlite3
+import sys
 import time
-import json
 from collections import defaultdict
+from operator import itemgetter
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.address import normalize_addr
+from vayo.batchcache import iter_tree
+from vayo.bulkload import BulkLoad
+from vayo.extsort import ExternalSort, merge_join
+
 BIG_DB = "/Users/pjump/Desktop/projects/vayo/stuy-scrape-csv/stuytown.db"
 OUT_DB = "/Users/pjump/Desktop/projects/vayo/vayo_clean.db"
 
@@ -24,9 +31,7 @@ if os.path.exists(OUT_DB):
 big = sqlite3.connect(BIG_DB)
 big.row_factory = sqlite3.Row
 out = sqlite3.connect(OUT_DB)
-out.execute("PRAGMA journal_mode=WAL")
-out.execute("PRAGMA synchronous=NORMAL")
-out.execute("PRAGMA cache_size=-500000")  # 500MB cache
+load = BulkLoad(out)  # no journal while loading; indexes built at the end
 
 t0 = time.time()
 
@@ -34,6 +39,7 @@ t0 = time.time()
 # 1. PLUTO — the foundation
 # ============================================================================
 print("=== 1. PLUTO buildings ===")
+load.phase("PLUTO buildings")
 out.execute("""
     CREATE TABLE buildings (
         bbl INTEGER PRIMARY KEY,
@@ -71,6 +77,7 @@ print(f"  {count} buildings")
 # 2. BIN → BBL mapping (critical for joining HPD, complaints, ECB, DOB)
 # ============================================================================
 print("\n=== 2. BIN → BBL mapping ===")
+load.phase("BIN → BBL mapping")
 bin_to_bbl = {}
 for row in big.execute("SELECT bin, bbl FROM buildings WHERE bin IS NOT NULL AND bbl IS NOT NULL"):
     try:
@@ -90,13 +97,14 @@ print(f"  {len(bin_to_bbl)} BIN→BBL mappings (matching PLUTO)")
 # Save mapping table
 out.execute("CREATE TABLE bin_map (bin TEXT PRIMARY KEY, bbl INTEGER)")
 out.executemany("INSERT INTO bin_map VALUES (?,?)", bin_to_bbl.items())
-out.execute("CREATE INDEX idx_bm_bbl ON bin_map(bbl)")
+load.index("CREATE INDEX idx_bm_bbl ON bin_map(bbl)")
 out.commit()
 
 # ============================================================================
 # 3. ACRIS — stream from full cache files, link to PLUTO
 # ============================================================================
 print("\n=== 3. ACRIS transactions (from full cache) ===")
+load.phase("ACRIS transactions (from full cache)")
 
 ACRIS_CACHE = "/Users/pjump/Desktop/projects/vayo/acris_cache/full"
 TARGET_DOC_TYPES = {
@@ -109,10 +117,8 @@ TARGET_DOC_TYPES = {
 JUNK_UNITS = {'N/A', 'NA', '0', '00', '000', '-', '.', 'NONE', 'X', 'XX', 'TIMES', 'APT', 'UNIT'}
 
 def iter_cache_dir(path):
-    """Iterate over all batch_*.json files in a directory (flat or nested)."""
-    for f in sorted(Path(path).glob('**/batch_*.json')):
-        with open(f) as fh:
-            yield from json.load(fh)
+    """Iterate over all batches in a directory (flat or nested)."""
+    yield from iter_tree(path)
 
 # Build boro_block → PLUTO BBL mapping for condo lots
 pluto_by_block = defaultdict(list)
@@ -139,9 +145,15 @@ out.execute("""
     )
 """)
 
+# The three feeds are far too big to hold as dicts (22.5M legals alone), so
+# each is sorted by document_id into runs on disk and the sorted streams are
+# merge-joined one document at a time.
+by_doc = itemgetter(0)
+SORT_DIR = os.path.dirname(OUT_DB)
+
 # --- Step 1: Stream master → filter to target doc types ---
 print("  Step 1: Streaming master records...")
-master_docs = {}  # {doc_id: (doc_type, document_amt, document_date, recorded_datetime)}
+master_docs = ExternalSort(by_doc, tmpdir=SORT_DIR)  # (doc_id, doc_type, document_amt, document_date, recorded_datetime)
 master_total = 0
 for rec in iter_cache_dir(f"{ACRIS_CACHE}/master"):
     master_total += 1
@@ -150,23 +162,23 @@ for rec in iter_cache_dir(f"{ACRIS_CACHE}/master"):
             amt = float(rec['document_amt']) if rec['document_amt'] else 0
         except (ValueError, TypeError):
             amt = 0
-        master_docs[rec['document_id']] = (
-            rec['doc_type'], amt,
+        master_docs.add((
+            rec['document_id'], rec['doc_type'], amt,
             rec['document_date'], rec['recorded_datetime']
-        )
+        ))
     if master_total % 5_000_000 == 0:
-        print(f"    scanned {master_total:,} master, kept {len(master_docs):,}")
-print(f"    Done: {master_total:,} master scanned → {len(master_docs):,} target docs")
+        print(f"    scanned {master_total:,} master, kept {master_docs.count:,}")
+print(f"    Done: {master_total:,} master scanned → {master_docs.count:,} target records")
 
-# --- Step 2: Stream legals → match to master + PLUTO → doc_bbl ---
+# --- Step 2: Stream legals → match to PLUTO ---
+# Every legal that resolves to a PLUTO building is kept; the join drops the
+# ones whose document isn't a target type.
 print("  Step 2: Streaming legals records...")
-doc_bbl = {}  # {doc_id: (bbl, unit)}
+doc_bbl = ExternalSort(by_doc, tmpdir=SORT_DIR)  # (doc_id, bbl, unit)
 legals_total = 0
 for rec in iter_cache_dir(f"{ACRIS_CACHE}/legals_parts"):
     legals_total += 1
     doc_id = rec['document_id']
-    if doc_id not in master_docs:
-        continue
     # Construct BBL
     try:
         boro = str(int(rec['borough']))
@@ -191,51 +203,45 @@ for rec in iter_cache_dir(f"{ACRIS_CACHE}/legals_parts"):
         unit = (rec.get('unit') or '').strip()
         if unit.upper() in JUNK_UNITS:
             unit = ''
-        doc_bbl[doc_id] = (matched_bbl, unit)
+        doc_bbl.add((doc_id, matched_bbl, unit))
 
     if legals_total % 5_000_000 == 0:
-        print(f"    scanned {legals_total:,} legals, matched {len(doc_bbl):,}")
-print(f"    Done: {legals_total:,} legals scanned → {len(doc_bbl):,} matched to PLUTO")
+        print(f"    scanned {legals_total:,} legals, matched {doc_bbl.count:,}")
+print(f"    Done: {legals_total:,} legals scanned → {doc_bbl.count:,} matched to PLUTO")
 
-# --- Step 3: Stream parties → only for matched doc_ids ---
+# --- Step 3: Stream parties → named parties only ---
 print("  Step 3: Streaming parties records...")
-doc_parties = defaultdict(lambda: {'sellers': [], 'buyers': []})
+doc_parties = ExternalSort(by_doc, tmpdir=SORT_DIR)  # (doc_id, party_type, name)
 parties_total = 0
-parties_kept = 0
 for rec in iter_cache_dir(f"{ACRIS_CACHE}/parties_parts"):
     parties_total += 1
-    doc_id = rec['document_id']
-    if doc_id not in doc_bbl:
-        continue
     if not rec.get('name'):
         continue
-    parties_kept += 1
-    bucket = doc_parties[doc_id]
-    if rec['party_type'] == '1':
-        if len(bucket['sellers']) < 3:
-            bucket['sellers'].append(rec['name'])
-    else:
-        if len(bucket['buyers']) < 3:
-            bucket['buyers'].append(rec['name'])
+    doc_parties.add((rec['document_id'], rec['party_type'], rec['name']))
     if parties_total % 10_000_000 == 0:
-        print(f"    scanned {parties_total:,} parties, kept {parties_kept:,}")
-print(f"    Done: {parties_total:,} parties scanned → {len(doc_parties):,} docs with parties")
+        print(f"    scanned {parties_total:,} parties, kept {doc_parties.count:,}")
+print(f"    Done: {parties_total:,} parties scanned → {doc_parties.count:,} named")
 
-# --- Step 4: Join and insert ---
+# --- Step 4: Merge-join and insert ---
+# Per document: the last target master record and the last matched legal
+# win, as they would overwriting a dict, plus the first 3 sellers and buyers.
 print("  Step 4: Joining and inserting...")
 acris_count = 0
+with_parties = 0
 batch = []
-for doc_id, (bbl, unit) in doc_bbl.items():
-    doc_type, amt, doc_date, rec_dt = master_docs[doc_id]
-    parties = doc_parties.get(doc_id, {'sellers': [], 'buyers': []})
-    sellers = '; '.join(parties['sellers'])[:200]
-    buyers = '; '.join(parties['buyers'])[:200]
+for doc_id, (masters, legals, parties) in merge_join(by_doc, master_docs, doc_bbl, doc_parties):
+    if not masters or not legals:
+        continue
+    _, doc_type, amt, doc_date, rec_dt = masters[-1]
+    _, bbl, unit = legals[-1]
+    with_parties += bool(parties)
+    sellers = '; '.join([name for _, pt, name in parties if pt == '1'][:3])[:200]
+    buyers = '; '.join([name for _, pt, name in parties if pt != '1'][:3])[:200]
 
     batch.append((doc_id, bbl, unit, doc_type, doc_date, rec_dt, amt, sellers, buyers))
 
     if len(batch) >= 50000:
         out.executemany("INSERT INTO acris_transactions VALUES (?,?,?,?,?,?,?,?,?)", batch)
-        out.commit()
         acris_count += len(batch)
         print(f"    {acris_count:,} transactions inserted...")
         batch = []
@@ -244,20 +250,23 @@ if batch:
     out.executemany("INSERT INTO acris_transactions VALUES (?,?,?,?,?,?,?,?,?)", batch)
     out.commit()
     acris_count += len(batch)
+print(f"    {with_parties:,} docs with parties")
 
-out.execute("CREATE INDEX idx_acris_bbl ON acris_transactions(bbl)")
-out.execute("CREATE INDEX idx_acris_type ON acris_transactions(doc_type)")
-out.execute("CREATE INDEX idx_acris_date ON acris_transactions(recorded_datetime)")
+load.index("CREATE INDEX idx_acris_bbl ON acris_transactions(bbl)")
+load.index("CREATE INDEX idx_acris_type ON acris_transactions(doc_type)")
+load.index("CREATE INDEX idx_acris_date ON acris_transactions(recorded_datetime)")
 out.commit()
 print(f"  {acris_count:,} ACRIS transactions matched to PLUTO buildings")
 
-# Free memory
-del master_docs, doc_bbl, doc_parties
+# Remove the sorted runs
+for sorter in (master_docs, doc_bbl, doc_parties):
+    sorter.close()
 
 # ============================================================================
 # 4. HPD Complaints (by BIN → BBL)
 # ============================================================================
 print("\n=== 4. HPD Complaints ===")
+load.phase("HPD Complaints")
 out.execute("""
     CREATE TABLE complaints (
         bbl INTEGER, unit TEXT, major_category TEXT, minor_category TEXT,
@@ -279,7 +288,6 @@ for row in big.execute("""
                       row['type']))
         if len(batch) >= 50000:
             out.executemany("INSERT INTO complaints VALUES (?,?,?,?,?,?,?)", batch)
-            out.commit()
             comp_count += len(batch)
             batch = []
 
@@ -288,8 +296,8 @@ if batch:
     out.commit()
     comp_count += len(batch)
 
-out.execute("CREATE INDEX idx_comp_bbl ON complaints(bbl)")
-out.execute("CREATE INDEX idx_comp_date ON complaints(received_date)")
+load.index("CREATE INDEX idx_comp_bbl ON complaints(bbl)")
+load.index("CREATE INDEX idx_comp_date ON complaints(received_date)")
 out.commit()
 print(f"  {comp_count:,} complaints matched")
 
@@ -297,6 +305,7 @@ print(f"  {comp_count:,} complaints matched")
 # 5. 311 (BBL already clean)
 # ============================================================================
 print("\n=== 5. 311 Complaints ===")
+load.phase("311 Complaints")
 out.execute("""
     CREATE TABLE complaints_311 (
         bbl INTEGER, complaint_type TEXT, descriptor TEXT,
@@ -317,7 +326,6 @@ for row in big.execute("""
                       row['created_date'], row['incident_address']))
         if len(batch) >= 50000:
             out.executemany("INSERT INTO complaints_311 VALUES (?,?,?,?,?)", batch)
-            out.commit()
             count_311 += len(batch)
             batch = []
 
@@ -326,8 +334,8 @@ if batch:
     out.commit()
     count_311 += len(batch)
 
-out.execute("CREATE INDEX idx_311_bbl ON complaints_311(bbl)")
-out.execute("CREATE INDEX idx_311_type ON complaints_311(complaint_type)")
+load.index("CREATE INDEX idx_311_bbl ON complaints_311(bbl)")
+load.index("CREATE INDEX idx_311_type ON complaints_311(complaint_type)")
 out.commit()
 print(f"  {count_311:,} 311 complaints matched")
 
@@ -335,6 +343,7 @@ print(f"  {count_311:,} 311 complaints matched")
 # 6. ECB Violations (BIN → BBL)
 # ============================================================================
 print("\n=== 6. ECB Violations ===")
+load.phase("ECB Violations")
 out.execute("""
     CREATE TABLE ecb_violations (
         bbl INTEGER, severity TEXT, violation_type TEXT,
@@ -358,7 +367,6 @@ for row in big.execute("""
                       row['balance_due']))
         if len(batch) >= 50000:
             out.executemany("INSERT INTO ecb_violations VALUES (?,?,?,?,?,?,?,?)", batch)
-            out.commit()
             ecb_count += len(batch)
             batch = []
 
@@ -367,7 +375,7 @@ if batch:
     out.commit()
     ecb_count += len(batch)
 
-out.execute("CREATE INDEX idx_ecb_bbl ON ecb_violations(bbl)")
+load.index("CREATE INDEX idx_ecb_bbl ON ecb_violations(bbl)")
 out.commit()
 print(f"  {ecb_count:,} ECB violations matched")
 
@@ -375,6 +383,7 @@ print(f"  {ecb_count:,} ECB violations matched")
 # 7. HPD Contacts (registrations → BIN → BBL)
 # ============================================================================
 print("\n=== 7. HPD Contacts ===")
+load.phase("HPD Contacts")
 out.execute("""
     CREATE TABLE building_contacts (
         bbl INTEGER, contact_type TEXT, corporation_name TEXT,
@@ -398,7 +407,6 @@ for row in big.execute("""
                       row['lastregistrationdate']))
         if len(batch) >= 50000:
             out.executemany("INSERT INTO building_contacts VALUES (?,?,?,?,?,?)", batch)
-            out.commit()
             contact_count += len(batch)
             batch = []
 
@@ -407,8 +415,8 @@ if batch:
     out.commit()
     contact_count += len(batch)
 
-out.execute("CREATE INDEX idx_bc_bbl ON building_contacts(bbl)")
-out.execute("CREATE INDEX idx_bc_type ON building_contacts(contact_type)")
+load.index("CREATE INDEX idx_bc_bbl ON building_contacts(bbl)")
+load.index("CREATE INDEX idx_bc_type ON building_contacts(contact_type)")
 out.commit()
 print(f"  {contact_count:,} building contacts matched")
 
@@ -416,6 +424,7 @@ print(f"  {contact_count:,} building contacts matched")
 # 8. HPD Litigation
 # ============================================================================
 print("\n=== 8. HPD Litigation ===")
+load.phase("HPD Litigation")
 out.execute("""
     CREATE TABLE hpd_litigation (
         bbl INTEGER, casetype TEXT, caseopendate TEXT,
@@ -436,7 +445,7 @@ if batch:
     out.executemany("INSERT INTO hpd_litigation VALUES (?,?,?,?)", batch)
     lit_count = len(batch)
 
-out.execute("CREATE INDEX idx_lit_bbl ON hpd_litigation(bbl)")
+load.index("CREATE INDEX idx_lit_bbl ON hpd_litigation(bbl)")
 out.commit()
 print(f"  {lit_count:,} litigation records matched")
 
@@ -444,6 +453,7 @@ print(f"  {lit_count:,} litigation records matched")
 # 9. DOB Permits (BIN → BBL)
 # ============================================================================
 print("\n=== 9. DOB Permits ===")
+load.phase("DOB Permits")
 out.execute("""
     CREATE TABLE dob_permits (
         bbl INTEGER, job_type TEXT, job_description TEXT,
@@ -469,7 +479,6 @@ for row in big.execute("""
                       row['proposed_dwelling_units']))
         if len(batch) >= 50000:
             out.executemany("INSERT INTO dob_permits VALUES (?,?,?,?,?,?,?,?)", batch)
-            out.commit()
             permit_count += len(batch)
             batch = []
 
@@ -478,7 +487,7 @@ if batch:
     out.commit()
     permit_count += len(batch)
 
-out.execute("CREATE INDEX idx_perm_bbl ON dob_permits(bbl)")
+load.index("CREATE INDEX idx_perm_bbl ON dob_permits(bbl)")
 out.commit()
 print(f"  {permit_count:,} DOB permits matched")
 
@@ -486,6 +495,7 @@ print(f"  {permit_count:,} DOB permits matched")
 # 10. DOB Complaints (has BBL directly)
 # ============================================================================
 print("\n=== 10. DOB Complaints ===")
+load.phase("DOB Complaints")
 out.execute("""
     CREATE TABLE dob_complaints (
         bbl INTEGER, unit TEXT, complaint_category TEXT,
@@ -506,7 +516,6 @@ for row in big.execute("""
                       row['raw_description']))
         if len(batch) >= 50000:
             out.executemany("INSERT INTO dob_complaints VALUES (?,?,?,?,?,?)", batch)
-            out.commit()
             dobc_count += len(batch)
             batch = []
 
@@ -515,7 +524,7 @@ if batch:
     out.commit()
     dobc_count += len(batch)
 
-out.execute("CREATE INDEX idx_dobc_bbl ON dob_complaints(bbl)")
+load.index("CREATE INDEX idx_dobc_bbl ON dob_complaints(bbl)")
 out.commit()
 print(f"  {dobc_count:,} DOB complaints matched")
 
@@ -523,6 +532,7 @@ print(f"  {dobc_count:,} DOB complaints matched")
 # 11. Marshal Evictions
 # ============================================================================
 print("\n=== 11. Marshal Evictions ===")
+load.phase("Marshal Evictions")
 out.execute("""
     CREATE TABLE marshal_evictions (
         eviction_address TEXT, executed_date TEXT, borough TEXT,
@@ -542,6 +552,7 @@ print(f"  {evict_count:,} residential evictions loaded (address-only, no BBL)")
 # 12. StreetEasy slug → BBL mapping
 # ============================================================================
 print("\n=== 12. StreetEasy slug → BBL mapping ===")
+load.phase("StreetEasy slug → BBL mapping")
 
 SE_SLUGS_FILE = "/Users/pjump/Desktop/projects/vayo/se_sitemaps/all_buildings.txt"
 
@@ -613,20 +624,6 @@ NYC_CITIES = {
     'richmondtown': 'SI', 'oakwood': 'SI', 'grasmere': 'SI',
 }
 
-def normalize_addr(addr):
-    """Normalize address for matching: uppercase, abbreviate street types."""
-    if not addr:
-        return ''
-    a = addr.upper().strip()
-    a = a.replace('_', '-')
-    # Abbreviate common suffixes
-    for full, abbr in [(' AVENUE', ' AVE'), (' STREET', ' ST'), (' BOULEVARD', ' BLVD'),
-                       (' DRIVE', ' DR'), (' PLACE', ' PL'), (' ROAD', ' RD'),
-                       (' COURT', ' CT'), (' LANE', ' LN'), (' TERRACE', ' TERR'),
-                       (' PARKWAY', ' PKWY'), (' SQUARE', ' SQ'), (' CRESCENT', ' CRES')]:
-        a = a.replace(full, abbr)
-    return a
-
 # Build PLUTO address lookup
 pluto_addr_lookup = {}
 for row in out.execute("SELECT bbl, address, borough FROM buildings"):
@@ -679,17 +676,19 @@ if os.path.exists(SE_SLUGS_FILE):
 
                 if len(batch) >= 50000:
                     out.executemany("INSERT OR IGNORE INTO se_buildings VALUES (?,?,?,?)", batch)
-                    out.commit()
                     batch = []
 
 if batch:
     out.executemany("INSERT OR IGNORE INTO se_buildings VALUES (?,?,?,?)", batch)
     out.commit()
 
-out.execute("CREATE INDEX idx_se_bbl ON se_buildings(bbl)")
+load.index("CREATE INDEX idx_se_bbl ON se_buildings(bbl)")
 out.commit()
 print(f"  {se_total:,} NYC slugs parsed, {se_matched:,} matched to PLUTO ({100*se_matched/max(se_total,1):.1f}%)")
 
+print("\n=== Indexes + ANALYZE ===")
+load.finish()
+
 # ============================================================================
 # FINAL REPORT
 # ============================================================================
@@ -706,6 +705,7 @@ for table in ['buildings', 'acris_transactions', 'complaints', 'complaints_311',
 size_mb = os.path.getsize(OUT_DB) / (1024 * 1024)
 print(f"\n  Database size: {size_mb:.0f} MB")
 print(f"  Total time: {time.time()-t0:.1f}s")
+load.report()
 
 big.close()
 out.close()
@@ -11,8 +11,13 @@ Run AFTER build_clean_db.py (needs vayo_clean.db to exist).
 
 import sqlite3
 import json
+import sys
 import time
 import os
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.bulkload import BulkLoad
 
 BIG_DB = "/Users/pjump/Desktop/projects/vayo/stuy-scrape-csv/stuytown.db"
 CLEAN_DB = "/Users/pjump/Desktop/projects/vayo/vayo_clean.db"
@@ -189,9 +194,7 @@ print("\n=== Step 4: Build all_nyc_units database ===")
 t2 = time.time()
 
 new = sqlite3.connect(NEW_DB)
-new.execute("PRAGMA journal_mode=WAL")
-new.execute("PRAGMA synchronous=NORMAL")
-new.execute("PRAGMA cache_size=-200000")
+load = BulkLoad(new)  # no journal while loading; indexes built at the end
 
 new.execute("""
     CREATE TABLE all_nyc_units (
@@ -213,6 +216,7 @@ new.execute("""
 
 # Insert discovered units
 print("  Inserting discovered units...")
+load.phase("discovered units")
 batch = []
 for (bbl_str, unit_number), (sources, confidence, ownership, address) in discovered.items():
     bbl_int = int(bbl_str)
@@ -227,7 +231,6 @@ for (bbl_str, unit_number), (sources, confidence, ownership, address) in discove
     ))
     if len(batch) >= 50000:
         new.executemany("INSERT OR IGNORE INTO all_nyc_units VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", batch)
-        new.commit()
         batch = []
 
 if batch:
@@ -239,6 +242,7 @@ print(f"  Inserted {disc_inserted:,} discovered units")
 
 # Insert placeholders
 print("  Generating placeholders...")
+load.phase("placeholders")
 batch = []
 total_ph = 0
 
@@ -257,7 +261,6 @@ for bbl, prow, disc, gap in gaps:
 
         if len(batch) >= 50000:
             new.executemany("INSERT INTO all_nyc_units VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)", batch)
-            new.commit()
             print(f"    ... {total_ph:,} placeholders")
             batch = []
 
@@ -269,15 +272,15 @@ print(f"  Total placeholders: {total_ph:,}")
 print(f"  Data insert took {time.time()-t2:.1f}s")
 
 # Create indexes
-print("\n=== Step 5: Indexes ===")
+print("\n=== Step 5: Indexes + ANALYZE ===")
 t3 = time.time()
-new.execute("CREATE INDEX idx_bbl ON all_nyc_units(bbl)")
-new.execute("CREATE INDEX idx_borough ON all_nyc_units(borough)")
-new.execute("CREATE INDEX idx_zip ON all_nyc_units(zipcode)")
-new.execute("CREATE INDEX idx_ph ON all_nyc_units(is_placeholder)")
-new.execute("CREATE INDEX idx_bldgclass ON all_nyc_units(bldgclass)")
-new.commit()
-print(f"  Indexes took {time.time()-t3:.1f}s")
+load.index("CREATE INDEX idx_bbl ON all_nyc_units(bbl)")
+load.index("CREATE INDEX idx_borough ON all_nyc_units(borough)")
+load.index("CREATE INDEX idx_zip ON all_nyc_units(zipcode)")
+load.index("CREATE INDEX idx_ph ON all_nyc_units(is_placeholder)")
+load.index("CREATE INDEX idx_bldgclass ON all_nyc_units(bldgclass)")
+load.finish()
+print(f"  Indexes + ANALYZE took {time.time()-t3:.1f}s")
 
 # Final report
 print("\n" + "=" * 52)
@@ -316,6 +319,7 @@ for row in new.execute("""
 """):
     print(f"  {row[0]:20s} {row[1]:>10,}")
 
+load.report()
 new.close()
 
 # File size
@@ -10,157 +10,93 @@ Data sources:
     Contains: buildings, HPD complaints, 311, ECB, DOB, contacts, etc.
   - ACRIS cache files from pull_acris_full.py (if available)
     Falls back to ACRIS data from old DB
+  - pull_datasets.py output: the staging tables of a --stream pull
+    (data_staging.db, rows already normalized) or the data_cache/ batches,
+    whichever is newer; --datasets-from-cache always reads data_cache/
+
+Each table is built by a stage function, declared in STAGES with the
+stages it needs first. With --jobs N, each stage runs in a worker process
+and writes its own shard DB under build_shards/. Stages that read the old
+DB and caches are independent; sales, bin_map and hpd_violations also need
+the finished buildings table's BBLs, which the parent hands them. As each
+shard finishes it is ATTACHed and copied into vayo_clean.db with INSERT ...
+SELECT, together with its indexes. buildings (with its FTS address index)
+runs on the output connection in the parent, alongside the workers.
+
+Loading uses vayo.bulkload's profile: no journal or fsyncs, one transaction
+per table, and CREATE INDEX deferred to the end of the build (or, with
+--jobs, to the end of each worker's stage). The database is then ANALYZEd,
+and per-phase timings are reported. The event tables the API reads per
+building are clustered: rewritten in (bbl, date) order once loaded, and
+indexed on (bbl, date), so one building's history is a short range scan.
 
 Usage:
-    python3 scripts/build_vayo_db.py [--acris-from-cache] [--acris-from-old]
+    python3 scripts/build_vayo_db.py [--acris-from-cache] [--acris-from-old] [--jobs 8]
+                                     [--datasets-from-cache]
 """
 
 import sqlite3
-import json
+import multiprocessing
 import time
 import os
 import sys
 import shutil
 from collections import defaultdict
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.address import INDEXES, build_address_index
+from vayo.batchcache import MANIFEST, BatchCache
+from vayo.bulkload import BulkLoad, peak_rss_mb
+from vayo.datasets import (DATASETS, cache_watermark, dataset_row, insert_sql,
+                           make_bbl, normalize_date, parse_float, parse_int,
+                           set_watermark)
+from vayo.complaint_stats import refresh_complaint_stats
+from vayo.ingest import staged, staged_rows
+from vayo.sr_types import refresh_sr_types
+
 PROJECT = Path("/Users/pjump/Desktop/projects/vayo")
 OUT_DB = PROJECT / "vayo_clean.db"
 OLD_DB = PROJECT / "vayo_old.db"
 ACRIS_CACHE = PROJECT / "acris_cache" / "full"
 DATA_CACHE = PROJECT / "data_cache"
+STAGING_DB = PROJECT / "data_staging.db"
+SHARD_DIR = PROJECT / "build_shards"
 
 TARGET_DOC_TYPES = {'DEED', 'MTGE', 'SAT', 'AGMT', 'LPNS', 'AL&R'}
 
 
-def parse_float(val):
-    """Safely parse a float from any value."""
-    if val is None:
-        return 0.0
-    try:
-        return float(val)
-    except (ValueError, TypeError):
-        return 0.0
-
-
-def parse_int(val):
-    """Safely parse an int from any value."""
-    if val is None:
-        return 0
-    try:
-        return int(float(val))
-    except (ValueError, TypeError):
-        return 0
-
-
-def normalize_date(val):
-    """Normalize various date formats to ISO YYYY-MM-DD."""
-    if not val:
-        return None
-    val = str(val).strip()
-    # Already ISO
-    if len(val) >= 10 and val[4] == '-':
-        return val[:10]
-    # YYYYMMDD format (ECB violations use this)
-    if len(val) == 8 and val.isdigit():
-        return f"{val[:4]}-{val[4:6]}-{val[6:8]}"
-    # MM/DD/YYYY
-    if '/' in val:
-        parts = val.split('/')
-        if len(parts) == 3:
-            m, d, y = parts
-            if len(y) == 4:
-                return f"{y}-{m.zfill(2)}-{d.zfill(2)}"
-    return val[:10] if len(val) >= 10 else val
-
-
-def make_bbl(boro, block, lot):
-    """Construct BBL from boro, block, lot strings."""
-    try:
-        b = str(int(boro))
-        bl = str(int(block)).zfill(5)
-        lt = str(int(lot)).zfill(4)
-        return int(f"{b}{bl}{lt}")
-    except (ValueError, TypeError):
-        return None
-
-
 def iter_acris_cache(name):
     """Iterate over cached ACRIS batch files."""
-    cache_dir = ACRIS_CACHE / name
-    if not cache_dir.exists():
-        return
-    for f in sorted(cache_dir.glob('batch_*.json')):
-        with open(f) as fh:
-            yield from json.load(fh)
-
-
-def iter_data_cache(name):
-    """Iterate over cached dataset batch files."""
-    cache_dir = DATA_CACHE / name
-    if not cache_dir.exists():
-        return
-    for f in sorted(cache_dir.glob('batch_*.json')):
-        with open(f) as fh:
-            yield from json.load(fh)
+    yield from BatchCache(ACRIS_CACHE / name)
 
 
 def batch_insert(db, sql, rows, batch_size=50000, label=""):
-    """Insert rows in batches with progress."""
+    """Insert rows in batches with progress, as one transaction."""
     total = 0
     batch = []
     for row in rows:
         batch.append(row)
         if len(batch) >= batch_size:
             db.executemany(sql, batch)
-            db.commit()
             total += len(batch)
             if label:
                 print(f"    {label}: {total:,}...", flush=True)
             batch = []
     if batch:
         db.executemany(sql, batch)
-        db.commit()
         total += len(batch)
+    db.commit()
     return total
 
 
-def main():
-    args = set(sys.argv[1:])
-    use_cache = '--acris-from-cache' in args or ACRIS_CACHE.exists()
-    force_old = '--acris-from-old' in args
-
-    t0 = time.time()
+# ══════════════════════════════════════════════════════════════════════════
+# 1. BUILDINGS — the foundation
+# ══════════════════════════════════════════════════════════════════════════
 
-    # ── Prepare files ─────────────────────────────────────────────────────
-    if OLD_DB.exists():
-        print(f"Using existing {OLD_DB.name} as source")
-        if OUT_DB.exists():
-            os.remove(str(OUT_DB))
-    elif OUT_DB.exists():
-        print(f"Renaming {OUT_DB.name} → {OLD_DB.name}")
-        shutil.move(str(OUT_DB), str(OLD_DB))
-    else:
-        print(f"ERROR: Neither {OUT_DB} nor {OLD_DB} found. Nothing to rebuild from.")
-        sys.exit(1)
-
-    old = sqlite3.connect(str(OLD_DB))
-    old.row_factory = sqlite3.Row
-
-    out = sqlite3.connect(str(OUT_DB))
-    out.execute("PRAGMA journal_mode=WAL")
-    out.execute("PRAGMA synchronous=NORMAL")
-    out.execute("PRAGMA cache_size=-500000")
-
-    print()
-    print("=" * 70)
-    print("  VAYO DATABASE BUILD")
-    print("=" * 70)
-    print()
-
-    # ══════════════════════════════════════════════════════════════════════
-    # 1. BUILDINGS — the foundation
-    # ══════════════════════════════════════════════════════════════════════
+def stage_buildings(out, old, ctx):
     print("━━━ 1/18 Buildings ━━━")
     out.execute("""
         CREATE TABLE buildings (
@@ -207,13 +143,20 @@ def main():
     out.commit()
     print(f"  {count:,} buildings")
 
-    # Build BBL lookup sets
-    valid_bbls = set(r[0] for r in out.execute("SELECT bbl FROM buildings"))
+    n = build_address_index(out, *INDEXES['main'][1:])
+    print(f"  {n:,} addresses in search index")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 2. BIN → BBL mapping
-    # ══════════════════════════════════════════════════════════════════════
+    # BBL lookup set for the stages that match records to buildings
+    ctx['valid_bbls'] = set(r[0] for r in out.execute("SELECT bbl FROM buildings"))
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# 2. BIN → BBL mapping
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_bin_map(out, old, ctx):
     print("\n━━━ 2/18 BIN → BBL mapping ━━━")
+    valid_bbls = ctx['valid_bbls']
     out.execute("CREATE TABLE _bin_map (bin INTEGER PRIMARY KEY, bbl INTEGER NOT NULL)")
 
     bin_to_bbl = {}
@@ -227,14 +170,18 @@ def main():
             pass
 
     out.executemany("INSERT INTO _bin_map VALUES (?,?)", bin_to_bbl.items())
-    out.execute("CREATE INDEX idx_binmap_bbl ON _bin_map(bbl)")
+    ctx['load'].index("CREATE INDEX idx_binmap_bbl ON _bin_map(bbl)")
     out.commit()
     print(f"  {len(bin_to_bbl):,} BIN→BBL mappings")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 3. SALES (ACRIS transactions)
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 3. SALES (ACRIS transactions)
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_sales(out, old, ctx):
     print("\n━━━ 3/18 Sales (ACRIS) ━━━")
+    valid_bbls = ctx['valid_bbls']
     out.execute("""
         CREATE TABLE sales (
             document_id TEXT NOT NULL,
@@ -259,7 +206,7 @@ def main():
     acris_source = 'old'
     acris_count = 0
 
-    if not force_old and (ACRIS_CACHE / 'master').exists():
+    if not ctx['force_old'] and (ACRIS_CACHE / 'master').exists():
         # ── Load from full ACRIS cache ──────────────────────────────────
         acris_source = 'cache'
         print("  Loading from ACRIS cache (full history)...")
@@ -383,16 +330,21 @@ def main():
             label="sales"
         )
 
-    out.execute("CREATE INDEX idx_sales_bbl ON sales(bbl)")
-    out.execute("CREATE INDEX idx_sales_date ON sales(recorded_date)")
-    out.execute("CREATE INDEX idx_sales_type ON sales(doc_type)")
-    out.execute("CREATE INDEX idx_sales_bbl_type ON sales(bbl, doc_type)")
+    ctx['load'].cluster('sales', 'bbl, recorded_date')
+    ctx['load'].index("CREATE INDEX idx_sales_bbl ON sales(bbl, recorded_date)")
+    ctx['load'].index("CREATE INDEX idx_sales_date ON sales(recorded_date)")
+    ctx['load'].index("CREATE INDEX idx_sales_type ON sales(doc_type)")
+    ctx['load'].index("CREATE INDEX idx_sales_bbl_type ON sales(bbl, doc_type)")
     out.commit()
     print(f"  {acris_count:,} sales from {acris_source}")
+    return {'acris_source': acris_source}
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 4. HPD COMPLAINTS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 4. HPD COMPLAINTS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_hpd_complaints(out, old, ctx):
     print("\n━━━ 4/18 HPD complaints ━━━")
     out.execute("""
         CREATE TABLE hpd_complaints (
@@ -420,14 +372,21 @@ def main():
 
     hpd_count = batch_insert(out, "INSERT INTO hpd_complaints VALUES (?,?,?,?,?,?,?)",
                               gen_hpd(), label="hpd_complaints")
-    out.execute("CREATE INDEX idx_hpd_bbl ON hpd_complaints(bbl)")
-    out.execute("CREATE INDEX idx_hpd_date ON hpd_complaints(received_date)")
+    ctx['load'].cluster('hpd_complaints', 'bbl, received_date')
+    ctx['load'].index("CREATE INDEX idx_hpd_bbl ON hpd_complaints(bbl, received_date)")
+    ctx['load'].index("CREATE INDEX idx_hpd_date ON hpd_complaints(received_date)")
     out.commit()
     print(f"  {hpd_count:,} HPD complaints")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 5. SERVICE REQUESTS (311) — merge both tables, deduplicate
-    # ══════════════════════════════════════════════════════════════════════
+    refresh_complaint_stats(out, full=True)
+    print("  complaint_stats_by_bbl rollup built")
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# 5. SERVICE REQUESTS (311) — merge both tables, deduplicate
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_service_requests(out, old, ctx):
     print("\n━━━ 5/18 Service requests (311) ━━━")
     out.execute("""
         CREATE TABLE service_requests (
@@ -448,10 +407,7 @@ def main():
     # Use the larger service_requests_311 table (15M) as primary
     # The smaller complaints_311 (3.3M) is a subset with fewer columns
     sr_count = 0
-
-    # Check which tables exist in old DB
-    old_tables = set(r[0] for r in old.execute(
-        "SELECT name FROM sqlite_master WHERE type='table'"))
+    old_tables = ctx['old_tables']
 
     if 'service_requests_311' in old_tables:
         def gen_sr():
@@ -488,15 +444,21 @@ def main():
         sr_count = batch_insert(out, "INSERT INTO service_requests VALUES (?,?,?,?,?,?,?,?,?,?,?)",
                                 gen_sr_fallback(), label="service_requests")
 
-    out.execute("CREATE INDEX idx_sr_bbl ON service_requests(bbl)")
-    out.execute("CREATE INDEX idx_sr_date ON service_requests(created_date)")
-    out.execute("CREATE INDEX idx_sr_type ON service_requests(complaint_type)")
+    ctx['load'].cluster('service_requests', 'bbl, created_date')
+    ctx['load'].index("CREATE INDEX idx_sr_bbl ON service_requests(bbl, created_date)")
+    ctx['load'].index("CREATE INDEX idx_sr_date ON service_requests(created_date)")
+    ctx['load'].index("CREATE INDEX idx_sr_type ON service_requests(complaint_type)")
     out.commit()
     print(f"  {sr_count:,} service requests")
+    refresh_sr_types(out)
+    print("  sr_types dictionary built")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 6. DOB PERMITS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 6. DOB PERMITS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_permits(out, old, ctx):
     print("\n━━━ 6/18 DOB permits ━━━")
     out.execute("""
         CREATE TABLE permits (
@@ -528,14 +490,18 @@ def main():
 
     permit_count = batch_insert(out, "INSERT INTO permits VALUES (?,?,?,?,?,?,?,?)",
                                 gen_permits(), label="permits")
-    out.execute("CREATE INDEX idx_permits_bbl ON permits(bbl)")
-    out.execute("CREATE INDEX idx_permits_date ON permits(action_date)")
+    ctx['load'].cluster('permits', 'bbl, action_date')
+    ctx['load'].index("CREATE INDEX idx_permits_bbl ON permits(bbl, action_date)")
+    ctx['load'].index("CREATE INDEX idx_permits_date ON permits(action_date)")
     out.commit()
     print(f"  {permit_count:,} permits")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 7. DOB COMPLAINTS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 7. DOB COMPLAINTS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_dob_complaints(out, old, ctx):
     print("\n━━━ 7/18 DOB complaints ━━━")
     out.execute("""
         CREATE TABLE dob_complaints (
@@ -562,13 +528,17 @@ def main():
 
     dobc_count = batch_insert(out, "INSERT INTO dob_complaints VALUES (?,?,?,?,?,?)",
                                gen_dobc(), label="dob_complaints")
-    out.execute("CREATE INDEX idx_dobc_bbl ON dob_complaints(bbl)")
+    ctx['load'].cluster('dob_complaints', 'bbl, disposition_date')
+    ctx['load'].index("CREATE INDEX idx_dobc_bbl ON dob_complaints(bbl, disposition_date)")
     out.commit()
     print(f"  {dobc_count:,} DOB complaints")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 8. ECB VIOLATIONS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 8. ECB VIOLATIONS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_violations(out, old, ctx):
     print("\n━━━ 8/18 Violations (ECB) ━━━")
     out.execute("""
         CREATE TABLE violations (
@@ -600,14 +570,18 @@ def main():
 
     viol_count = batch_insert(out, "INSERT INTO violations VALUES (?,?,?,?,?,?,?,?)",
                                gen_violations(), label="violations")
-    out.execute("CREATE INDEX idx_violations_bbl ON violations(bbl)")
-    out.execute("CREATE INDEX idx_violations_date ON violations(issue_date)")
+    ctx['load'].cluster('violations', 'bbl, issue_date')
+    ctx['load'].index("CREATE INDEX idx_violations_bbl ON violations(bbl, issue_date)")
+    ctx['load'].index("CREATE INDEX idx_violations_date ON violations(issue_date)")
     out.commit()
     print(f"  {viol_count:,} violations")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 9. HPD LITIGATION
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 9. HPD LITIGATION
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_litigation(out, old, ctx):
     print("\n━━━ 9/18 Litigation (HPD) ━━━")
     out.execute("""
         CREATE TABLE litigation (
@@ -627,13 +601,17 @@ def main():
 
     lit_count = batch_insert(out, "INSERT INTO litigation VALUES (?,?,?,?)",
                               gen_lit(), label="litigation")
-    out.execute("CREATE INDEX idx_lit_bbl ON litigation(bbl)")
+    ctx['load'].cluster('litigation', 'bbl, opened_date')
+    ctx['load'].index("CREATE INDEX idx_lit_bbl ON litigation(bbl, opened_date)")
     out.commit()
     print(f"  {lit_count:,} litigation records")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 10. HPD CONTACTS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 10. HPD CONTACTS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_contacts(out, old, ctx):
     print("\n━━━ 10/18 Contacts (HPD) ━━━")
 
     # Map contact type codes to readable names
@@ -672,13 +650,17 @@ def main():
 
     contact_count = batch_insert(out, "INSERT INTO contacts VALUES (?,?,?,?,?,?)",
                                   gen_contacts(), label="contacts")
-    out.execute("CREATE INDEX idx_contacts_bbl ON contacts(bbl)")
+    ctx['load'].cluster('contacts', 'bbl, registered_date')
+    ctx['load'].index("CREATE INDEX idx_contacts_bbl ON contacts(bbl, registered_date)")
     out.commit()
     print(f"  {contact_count:,} contacts")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 11. RENT STABILIZATION
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 11. RENT STABILIZATION
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_rent_stabilization(out, old, ctx):
     print("\n━━━ 11/18 Rent stabilization ━━━")
     out.execute("""
         CREATE TABLE rent_stabilization (
@@ -709,13 +691,17 @@ def main():
 
     rs_count = batch_insert(out, "INSERT INTO rent_stabilization VALUES (?,?,?,?,?,?,?,?,?)",
                              gen_rs(), label="rent_stabilization")
-    out.execute("CREATE INDEX idx_rs_bbl ON rent_stabilization(bbl)")
+    ctx['load'].cluster('rent_stabilization', 'bbl, year')
+    ctx['load'].index("CREATE INDEX idx_rs_bbl ON rent_stabilization(bbl, year)")
     out.commit()
     print(f"  {rs_count:,} rent stabilization records")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 12. EVICTIONS + CERTIFICATES OF OCCUPANCY
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 12. EVICTIONS + CERTIFICATES OF OCCUPANCY
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_evictions(out, old, ctx):
     print("\n━━━ 12/18 Evictions + Certificates of Occupancy ━━━")
 
     # Marshal evictions
@@ -743,7 +729,8 @@ def main():
 
     evict_count = batch_insert(out, "INSERT INTO evictions VALUES (?,?,?,?,?,?)",
                                 gen_evictions(), label="evictions")
-    out.execute("CREATE INDEX idx_evict_bbl ON evictions(bbl)")
+    ctx['load'].cluster('evictions', 'bbl, executed_date')
+    ctx['load'].index("CREATE INDEX idx_evict_bbl ON evictions(bbl, executed_date)")
     out.commit()
     print(f"  {evict_count:,} evictions")
 
@@ -761,7 +748,7 @@ def main():
         )
     """)
 
-    if 'certificates_of_occupancy' in old_tables:
+    if 'certificates_of_occupancy' in ctx['old_tables']:
         def gen_co():
             for row in old.execute("""
                 SELECT bbl, job_number, co_issue_date, co_type,
@@ -782,13 +769,63 @@ def main():
     else:
         co_count = 0
 
-    out.execute("CREATE INDEX idx_co_bbl ON certificates_of_occupancy(bbl)")
+    ctx['load'].index("CREATE INDEX idx_co_bbl ON certificates_of_occupancy(bbl)")
     out.commit()
     print(f"  {co_count:,} certificates of occupancy")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 13. HPD VIOLATIONS (from data_cache)
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 13-18. DATASETS FROM data_cache (pull_datasets.py)
+# ══════════════════════════════════════════════════════════════════════════
+
+def dataset_source(ctx, name):
+    """Where to load `name` from: 'staged' (a finished pull_datasets.py
+    --stream table), 'cache' (data_cache/<name>/), or None. When both
+    exist the newer wins, unless --datasets-from-cache."""
+    manifest = DATA_CACHE / name / MANIFEST
+    cached = (DATA_CACHE / name).exists()
+    stage = None if ctx.get('datasets_from_cache') else staged(STAGING_DB, name)
+    if stage and cached and manifest.exists():
+        cache_time = datetime.fromtimestamp(manifest.stat().st_mtime)
+        if cache_time > datetime.fromisoformat(stage['staged_at']):
+            return 'cache'
+    if stage:
+        return 'staged'
+    return 'cache' if cached else None
+
+
+def load_dataset(out, ctx, name):
+    """Load a pull_datasets.py dataset into its table. Staged rows were
+    normalized as they were pulled; cached records go through vayo.datasets'
+    row builder, the same one pull_datasets.py --sync upserts with. Keeps
+    the newest row per natural key and records the :updated_at watermark
+    for the next sync."""
+    valid_bbls = ctx.get('valid_bbls')
+    if dataset_source(ctx, name) == 'staged':
+        print(f"  from {STAGING_DB.name}")
+        rows = staged_rows(STAGING_DB, name)
+        if DATASETS[name].get('valid_bbls'):
+            rows = (row for row in rows if row[0] in valid_bbls)
+        watermark = staged(STAGING_DB, name)['watermark']
+    else:
+        cache = BatchCache(DATA_CACHE / name)
+        rows = (row for row in (dataset_row(name, rec, valid_bbls) for rec in cache)
+                if row is not None)
+        watermark = cache_watermark(cache)
+    count = batch_insert(out, insert_sql(name), rows, label=name)
+    key = DATASETS[name]['key']
+    if key:
+        count -= ctx['load'].dedupe(DATASETS[name]['table'], key, newest='updated_at')
+    set_watermark(out, name, watermark, count)
+    out.commit()
+    return count
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# 13. HPD VIOLATIONS (from data_cache)
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_hpd_violations(out, old, ctx):
     print("\n━━━ 13/18 HPD violations ━━━")
     out.execute("""
         CREATE TABLE hpd_violations (
@@ -802,45 +839,28 @@ def main():
             status_date TEXT,
             violation_status TEXT,
             nov_type TEXT,
-            rent_impairing TEXT
+            rent_impairing TEXT,
+            violation_id TEXT,
+            updated_at TEXT
         )
     """)
 
     hpd_viol_count = 0
-    if (DATA_CACHE / 'hpd_violations').exists():
-        def gen_hpd_violations():
-            for rec in iter_data_cache('hpd_violations'):
-                boro = rec.get('boroid', '')
-                block = rec.get('block', '')
-                lot = rec.get('lot', '')
-                bbl = make_bbl(boro, block, lot)
-                if not bbl or bbl not in valid_bbls:
-                    continue
-                yield (
-                    bbl,
-                    rec.get('apartment', ''),
-                    rec.get('class', ''),
-                    (rec.get('inspectiondate') or '')[:10],
-                    (rec.get('approveddate') or '')[:10],
-                    rec.get('novdescription', ''),
-                    rec.get('currentstatus', ''),
-                    (rec.get('currentstatusdate') or '')[:10],
-                    rec.get('violationstatus', ''),
-                    rec.get('novtype', ''),
-                    rec.get('rentimpairing', ''),
-                )
-
-        hpd_viol_count = batch_insert(out, "INSERT INTO hpd_violations VALUES (?,?,?,?,?,?,?,?,?,?,?)",
-                                       gen_hpd_violations(), label="hpd_violations")
-    out.execute("CREATE INDEX idx_hpdv_bbl ON hpd_violations(bbl)")
-    out.execute("CREATE INDEX idx_hpdv_date ON hpd_violations(inspection_date)")
-    out.execute("CREATE INDEX idx_hpdv_class ON hpd_violations(class)")
+    if dataset_source(ctx, 'hpd_violations'):
+        hpd_viol_count = load_dataset(out, ctx, 'hpd_violations')
+    ctx['load'].index("CREATE INDEX idx_hpdv_bbl ON hpd_violations(bbl)")
+    ctx['load'].index("CREATE INDEX idx_hpdv_date ON hpd_violations(inspection_date)")
+    ctx['load'].index("CREATE INDEX idx_hpdv_class ON hpd_violations(class)")
+    ctx['load'].index("CREATE UNIQUE INDEX idx_hpdv_key ON hpd_violations(violation_id)")
     out.commit()
     print(f"  {hpd_viol_count:,} HPD violations")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 14. ROLLING SALES (DOF)
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 14. ROLLING SALES (DOF)
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_rolling_sales(out, old, ctx):
     print("\n━━━ 14/18 Rolling sales (DOF) ━━━")
     out.execute("""
         CREATE TABLE rolling_sales (
@@ -857,38 +877,19 @@ def main():
     """)
 
     rs_sale_count = 0
-    if (DATA_CACHE / 'rolling_sales').exists():
-        def gen_rolling_sales():
-            for rec in iter_data_cache('rolling_sales'):
-                bbl = make_bbl(
-                    rec.get('borough', ''),
-                    rec.get('block', ''),
-                    rec.get('lot', '')
-                )
-                if not bbl:
-                    continue
-                yield (
-                    bbl,
-                    rec.get('address', ''),
-                    rec.get('zip_code', ''),
-                    parse_int(rec.get('residential_units')),
-                    rec.get('building_class_at_present', ''),
-                    parse_int(rec.get('year_built')),
-                    parse_int(rec.get('gross_square_feet')),
-                    parse_float(rec.get('sale_price')),
-                    (rec.get('sale_date') or '')[:10],
-                )
-
-        rs_sale_count = batch_insert(out, "INSERT INTO rolling_sales VALUES (?,?,?,?,?,?,?,?,?)",
-                                      gen_rolling_sales(), label="rolling_sales")
-    out.execute("CREATE INDEX idx_rsales_bbl ON rolling_sales(bbl)")
-    out.execute("CREATE INDEX idx_rsales_date ON rolling_sales(sale_date)")
+    if dataset_source(ctx, 'rolling_sales'):
+        rs_sale_count = load_dataset(out, ctx, 'rolling_sales')
+    ctx['load'].index("CREATE INDEX idx_rsales_bbl ON rolling_sales(bbl)")
+    ctx['load'].index("CREATE INDEX idx_rsales_date ON rolling_sales(sale_date)")
     out.commit()
     print(f"  {rs_sale_count:,} rolling sales")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 15. TAX LIENS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 15. TAX LIENS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_tax_liens(out, old, ctx):
     print("\n━━━ 15/18 Tax liens ━━━")
     out.execute("""
         CREATE TABLE tax_liens (
@@ -903,37 +904,18 @@ def main():
     """)
 
     lien_count = 0
-    if (DATA_CACHE / 'tax_liens').exists():
-        def gen_tax_liens():
-            for rec in iter_data_cache('tax_liens'):
-                bbl = make_bbl(
-                    rec.get('borough', ''),
-                    rec.get('block', ''),
-                    rec.get('lot', '')
-                )
-                if not bbl:
-                    continue
-                addr_parts = [rec.get('house_number', ''), rec.get('street_name', '')]
-                addr = ' '.join(p for p in addr_parts if p).strip()
-                yield (
-                    bbl,
-                    rec.get('tax_class_code', ''),
-                    rec.get('building_class', ''),
-                    addr,
-                    rec.get('zip_code', ''),
-                    rec.get('water_debt_only', ''),
-                    rec.get('cycle', ''),
-                )
-
-        lien_count = batch_insert(out, "INSERT INTO tax_liens VALUES (?,?,?,?,?,?,?)",
-                                   gen_tax_liens(), label="tax_liens")
-    out.execute("CREATE INDEX idx_liens_bbl ON tax_liens(bbl)")
+    if dataset_source(ctx, 'tax_liens'):
+        lien_count = load_dataset(out, ctx, 'tax_liens')
+    ctx['load'].index("CREATE INDEX idx_liens_bbl ON tax_liens(bbl)")
     out.commit()
     print(f"  {lien_count:,} tax liens")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 16. DOB NOW JOBS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 16. DOB NOW JOBS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_dob_now_jobs(out, old, ctx):
     print("\n━━━ 16/18 DOB NOW jobs ━━━")
     out.execute("""
         CREATE TABLE dob_now_jobs (
@@ -947,56 +929,27 @@ def main():
             status_date TEXT,
             first_permit_date TEXT,
             latitude REAL,
-            longitude REAL
+            longitude REAL,
+            job_filing_number TEXT,
+            updated_at TEXT
         )
     """)
 
     dob_now_count = 0
-    if (DATA_CACHE / 'dob_now_jobs').exists():
-        def gen_dob_now():
-            for rec in iter_data_cache('dob_now_jobs'):
-                bbl_str = rec.get('bbl', '')
-                if bbl_str:
-                    try:
-                        bbl = int(bbl_str)
-                    except (ValueError, TypeError):
-                        bbl = make_bbl(
-                            rec.get('borough', ''),
-                            rec.get('block', ''),
-                            rec.get('lot', '')
-                        )
-                else:
-                    bbl = make_bbl(
-                        rec.get('borough', ''),
-                        rec.get('block', ''),
-                        rec.get('lot', '')
-                    )
-                if not bbl:
-                    continue
-                yield (
-                    bbl,
-                    rec.get('job_type', ''),
-                    rec.get('filing_status', ''),
-                    parse_float(rec.get('initial_cost')),
-                    parse_int(rec.get('existing_dwelling_units')),
-                    parse_int(rec.get('proposed_dwelling_units')),
-                    (rec.get('filing_date') or '')[:10],
-                    (rec.get('current_status_date') or '')[:10],
-                    (rec.get('first_permit_date') or '')[:10],
-                    parse_float(rec.get('latitude')),
-                    parse_float(rec.get('longitude')),
-                )
-
-        dob_now_count = batch_insert(out, "INSERT INTO dob_now_jobs VALUES (?,?,?,?,?,?,?,?,?,?,?)",
-                                      gen_dob_now(), label="dob_now_jobs")
-    out.execute("CREATE INDEX idx_dobnow_bbl ON dob_now_jobs(bbl)")
-    out.execute("CREATE INDEX idx_dobnow_date ON dob_now_jobs(filing_date)")
+    if dataset_source(ctx, 'dob_now_jobs'):
+        dob_now_count = load_dataset(out, ctx, 'dob_now_jobs')
+    ctx['load'].index("CREATE INDEX idx_dobnow_bbl ON dob_now_jobs(bbl)")
+    ctx['load'].index("CREATE INDEX idx_dobnow_date ON dob_now_jobs(filing_date)")
+    ctx['load'].index("CREATE UNIQUE INDEX idx_dobnow_key ON dob_now_jobs(job_filing_number)")
     out.commit()
     print(f"  {dob_now_count:,} DOB NOW jobs")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 17. VACATE ORDERS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 17. VACATE ORDERS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_vacate_orders(out, old, ctx):
     print("\n━━━ 17/18 Vacate orders ━━━")
     out.execute("""
         CREATE TABLE vacate_orders (
@@ -1007,41 +960,26 @@ def main():
             rescind_date TEXT,
             vacated_units INTEGER,
             latitude REAL,
-            longitude REAL
+            longitude REAL,
+            vacate_order_number TEXT,
+            updated_at TEXT
         )
     """)
 
     vacate_count = 0
-    if (DATA_CACHE / 'vacate_orders').exists():
-        def gen_vacate():
-            for rec in iter_data_cache('vacate_orders'):
-                bbl_str = rec.get('bbl', '')
-                try:
-                    bbl = int(bbl_str) if bbl_str else None
-                except (ValueError, TypeError):
-                    bbl = None
-                if not bbl:
-                    continue
-                yield (
-                    bbl,
-                    rec.get('primary_vacate_reason', ''),
-                    rec.get('vacate_type', ''),
-                    (rec.get('vacate_effective_date') or '')[:10],
-                    (rec.get('actual_rescind_date') or '')[:10],
-                    parse_int(rec.get('number_of_vacated_units')),
-                    parse_float(rec.get('latitude')),
-                    parse_float(rec.get('longitude')),
-                )
-
-        vacate_count = batch_insert(out, "INSERT INTO vacate_orders VALUES (?,?,?,?,?,?,?,?)",
-                                     gen_vacate(), label="vacate_orders")
-    out.execute("CREATE INDEX idx_vacate_bbl ON vacate_orders(bbl)")
+    if dataset_source(ctx, 'vacate_orders'):
+        vacate_count = load_dataset(out, ctx, 'vacate_orders')
+    ctx['load'].index("CREATE INDEX idx_vacate_bbl ON vacate_orders(bbl)")
+    ctx['load'].index("CREATE UNIQUE INDEX idx_vacate_key ON vacate_orders(vacate_order_number)")
     out.commit()
     print(f"  {vacate_count:,} vacate orders")
 
-    # ══════════════════════════════════════════════════════════════════════
-    # 18. SUBWAY STATIONS
-    # ══════════════════════════════════════════════════════════════════════
+
+# ══════════════════════════════════════════════════════════════════════════
+# 18. SUBWAY STATIONS
+# ══════════════════════════════════════════════════════════════════════════
+
+def stage_subway_stations(out, old, ctx):
     print("\n━━━ 18/18 Subway stations ━━━")
     out.execute("""
         CREATE TABLE subway_stations (
@@ -1058,26 +996,231 @@ def main():
     """)
 
     station_count = 0
-    if (DATA_CACHE / 'subway_stations').exists():
-        def gen_stations():
-            for rec in iter_data_cache('subway_stations'):
-                yield (
-                    parse_int(rec.get('station_id')),
-                    parse_int(rec.get('complex_id')),
-                    rec.get('stop_name', ''),
-                    rec.get('borough', ''),
-                    rec.get('daytime_routes', ''),
-                    rec.get('structure', ''),
-                    parse_float(rec.get('gtfs_latitude')),
-                    parse_float(rec.get('gtfs_longitude')),
-                    parse_int(rec.get('ada')),
-                )
-
-        station_count = batch_insert(out, "INSERT INTO subway_stations VALUES (?,?,?,?,?,?,?,?,?)",
-                                      gen_stations(), label="subway_stations")
+    if dataset_source(ctx, 'subway_stations'):
+        station_count = load_dataset(out, ctx, 'subway_stations')
     out.commit()
     print(f"  {station_count:,} subway stations")
 
+
+# ══════════════════════════════════════════════════════════════════════════
+# Stage graph
+# ══════════════════════════════════════════════════════════════════════════
+
+# name → run(out, old, ctx), the stages it needs merged first, and whether
+# it must run on the output connection itself (main) rather than a shard.
+STAGES = {
+    'buildings': {'run': stage_buildings, 'deps': [], 'main': True},
+    'bin_map': {'run': stage_bin_map, 'deps': ['buildings']},
+    'sales': {'run': stage_sales, 'deps': ['buildings']},
+    'hpd_complaints': {'run': stage_hpd_complaints, 'deps': []},
+    'service_requests': {'run': stage_service_requests, 'deps': []},
+    'permits': {'run': stage_permits, 'deps': []},
+    'dob_complaints': {'run': stage_dob_complaints, 'deps': []},
+    'violations': {'run': stage_violations, 'deps': []},
+    'litigation': {'run': stage_litigation, 'deps': []},
+    'contacts': {'run': stage_contacts, 'deps': []},
+    'rent_stabilization': {'run': stage_rent_stabilization, 'deps': []},
+    'evictions': {'run': stage_evictions, 'deps': []},
+    'hpd_violations': {'run': stage_hpd_violations, 'deps': ['buildings']},
+    'rolling_sales': {'run': stage_rolling_sales, 'deps': []},
+    'tax_liens': {'run': stage_tax_liens, 'deps': []},
+    'dob_now_jobs': {'run': stage_dob_now_jobs, 'deps': []},
+    'vacate_orders': {'run': stage_vacate_orders, 'deps': []},
+    'subway_stations': {'run': stage_subway_stations, 'deps': []},
+}
+
+
+def stage_order():
+    """Stage names in declaration order, moved after their dependencies."""
+    order, seen = [], set()
+
+    def visit(name, path=()):
+        if name in seen:
+            return
+        if name in path:
+            raise ValueError(f"stage dependency cycle: {' → '.join(path + (name,))}")
+        for dep in STAGES[name]['deps']:
+            visit(dep, path + (name,))
+        seen.add(name)
+        order.append(name)
+
+    for name in STAGES:
+        visit(name)
+    return order
+
+
+def run_sequential(out, old, ctx):
+    """Every stage in dependency order on the output connection."""
+    results = {}
+    for name in stage_order():
+        ctx['load'].phase(name)
+        results[name] = STAGES[name]['run'](out, old, ctx)
+    return results
+
+
+def _run_shard(name, ctx):
+    """Worker: run one stage into a fresh shard DB, indexes included.
+    Returns (path, stage result, seconds, worker peak RSS MB)."""
+    t = time.time()
+    path = SHARD_DIR / f"{name}.db"
+    for p in (path, path.with_name(path.name + '-journal')):
+        if p.exists():
+            os.remove(str(p))
+    old = sqlite3.connect(f"file:{OLD_DB}?mode=ro", uri=True)
+    old.row_factory = sqlite3.Row
+    shard = sqlite3.connect(str(path))
+    # Each worker sorts its own indexes, so the pool builds them in parallel.
+    ctx['load'] = BulkLoad(shard, threads=1)
+    try:
+        result = STAGES[name]['run'](shard, old, ctx)
+        ctx['load'].build_indexes()
+    finally:
+        shard.close()
+        old.close()
+    return path, result, time.time() - t, peak_rss_mb()
+
+
+def merge_shard(out, path):
+    """Copy every table of a shard DB, with its indexes, into `out`.
+
+    Each new table is created from the shard's own CREATE statements, and
+    so are its indexes, before any rows go in. INSERT INTO t SELECT * FROM
+    shard.t into that empty table then takes SQLite's transfer
+    optimization, which copies the table's and every matching index's
+    records as they are, so the indexes the worker sorted aren't rebuilt.
+    A table that already exists in `out` (shared bookkeeping like
+    _rollup_state) gets the shard's rows added.
+    """
+    out.commit()
+    out.execute("ATTACH DATABASE ? AS shard", [str(path)])
+    try:
+        objects = out.execute("""
+            SELECT type, name, tbl_name, sql FROM shard.sqlite_master
+            WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        """).fetchall()
+        have = set(r[0] for r in out.execute("SELECT name FROM main.sqlite_master"))
+        for typ, name, _, sql in objects:
+            if typ != 'table':
+                continue
+            if name in have:
+                out.execute(f"INSERT OR REPLACE INTO main.[{name}] SELECT * FROM shard.[{name}]")
+                continue
+            out.execute(sql)
+            for i_typ, i_name, i_table, i_sql in objects:
+                if i_typ == 'index' and i_table == name:
+                    out.execute(i_sql)
+            out.execute(f"INSERT INTO main.[{name}] SELECT * FROM shard.[{name}]")
+        for typ, name, _, sql in objects:
+            if typ in ('trigger', 'view') and name not in have:
+                out.execute(sql)
+        out.commit()
+    finally:
+        out.execute("DETACH DATABASE shard")
+
+
+def run_parallel(out, old, ctx, jobs):
+    """Run the stage graph over `jobs` worker processes, merging shards
+    into `out` as they finish."""
+    stage_order()   # fail fast on a cycle
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    remaining = list(STAGES)
+    done, results, pending = set(), {}, {}
+    # fork: stage functions live in this script's __main__.
+    methods = multiprocessing.get_all_start_methods()
+    mp = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    merge_secs = 0.0
+
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=mp) as pool:
+        while remaining or pending:
+            ready = [n for n in remaining if all(d in done for d in STAGES[n]['deps'])]
+            # valid_bbls goes along once the buildings stage has set it, so
+            # workers never read OUT_DB while a shard is being merged into it.
+            shard_ctx = {k: v for k, v in ctx.items() if k != 'load'}
+            for name in ready:
+                if not STAGES[name].get('main'):
+                    pending[pool.submit(_run_shard, name, shard_ctx)] = name
+                    remaining.remove(name)
+            main_ready = [n for n in ready if STAGES[n].get('main')]
+            if main_ready:
+                # Runs here while the workers get on with their shards.
+                name = main_ready[0]
+                t = time.time()
+                results[name] = STAGES[name]['run'](out, old, ctx)
+                ctx['load'].record(name, time.time() - t, peak_rss_mb())
+                done.add(name)
+                remaining.remove(name)
+                continue
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = pending.pop(fut)
+                path, results[name], secs, peak = fut.result()
+                t = time.time()
+                merge_shard(out, path)
+                os.remove(str(path))
+                done.add(name)
+                ctx['load'].record(f"{name} (worker)", secs, peak)
+                merge_secs += time.time() - t
+                print(f"  ✓ {name} built in {secs:.1f}s, merged in {time.time() - t:.1f}s",
+                      flush=True)
+    ctx['load'].record('merge shards', merge_secs, peak_rss_mb())
+    try:
+        SHARD_DIR.rmdir()
+    except OSError:
+        pass
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    jobs = int(args[args.index('--jobs') + 1]) if '--jobs' in args else 1
+    args = set(args)
+    use_cache = '--acris-from-cache' in args or ACRIS_CACHE.exists()
+    force_old = '--acris-from-old' in args
+    datasets_from_cache = '--datasets-from-cache' in args
+
+    t0 = time.time()
+
+    # ── Prepare files ─────────────────────────────────────────────────────
+    if OLD_DB.exists():
+        print(f"Using existing {OLD_DB.name} as source")
+        if OUT_DB.exists():
+            os.remove(str(OUT_DB))
+    elif OUT_DB.exists():
+        print(f"Renaming {OUT_DB.name} → {OLD_DB.name}")
+        shutil.move(str(OUT_DB), str(OLD_DB))
+    else:
+        print(f"ERROR: Neither {OUT_DB} nor {OLD_DB} found. Nothing to rebuild from.")
+        sys.exit(1)
+
+    old = sqlite3.connect(str(OLD_DB))
+    old.row_factory = sqlite3.Row
+
+    out = sqlite3.connect(str(OUT_DB))
+    load = BulkLoad(out)
+
+    print()
+    print("=" * 70)
+    print("  VAYO DATABASE BUILD" + (f" ({jobs} workers)" if jobs > 1 else ""))
+    print("=" * 70)
+    print()
+
+    ctx = {
+        'load': load,
+        'force_old': force_old,
+        'datasets_from_cache': datasets_from_cache,
+        'old_tables': set(r[0] for r in old.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'")),
+    }
+    if jobs > 1:
+        results = run_parallel(out, old, ctx, jobs)
+    else:
+        results = run_sequential(out, old, ctx)
+    acris_source = results['sales']['acris_source']
+
+    print("\n━━━ Indexes + ANALYZE ━━━", flush=True)
+    load.finish()
+
     # ══════════════════════════════════════════════════════════════════════
     # FINAL REPORT
     # ══════════════════════════════════════════════════════════════════════
@@ -1105,6 +1248,7 @@ def main():
     print(f"  Build time:    {elapsed:.1f}s")
     print(f"  ACRIS source:  {acris_source}")
     print(f"\n  Output: {OUT_DB}")
+    load.report()
 
     old.close()
     out.close()
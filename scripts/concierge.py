@@ -13,14 +13,17 @@ import sqlite3
 import json
 import sys
 import readline
-from collections import defaultdict
 from datetime import datetime, timedelta
+from pathlib import Path
 
-DB = "/Users/pjump/Desktop/projects/vayo/vayo_clean.db"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo import MAIN_DB
+from vayo.address import has_address_index, search_address_index, fetch_ranked
+from vayo.scoring import results, score_bbls
 
 # ── Database Setup ─────────────────────────────────────────────────────────
 
-db = sqlite3.connect(DB)
+db = sqlite3.connect(MAIN_DB)
 db.row_factory = sqlite3.Row
 
 LOOKBACK_MONTHS = 24
@@ -77,261 +80,27 @@ NEIGHBORHOODS = {
 
 # ── Scoring Functions ──────────────────────────────────────────────────────
 
-def score_building(b, data):
-    """Score a single building. Returns dict with scores and signal details."""
-    bbl = b['bbl']
-    units = b['units_residential']
-    sqft = b['avg_unit_sqft'] or 0
-
-    # GEM SCORE
-    gem = 0
-    gem_reasons = []
-
-    if sqft >= 2000: gem += 25; gem_reasons.append(f"{sqft:,} sqft avg — very spacious")
-    elif sqft >= 1500: gem += 22; gem_reasons.append(f"{sqft:,} sqft avg — spacious")
-    elif sqft >= 1200: gem += 18; gem_reasons.append(f"{sqft:,} sqft avg — good size")
-    elif sqft >= 1000: gem += 15; gem_reasons.append(f"{sqft:,} sqft avg — decent")
-    elif sqft >= 800: gem += 10; gem_reasons.append(f"{sqft:,} sqft avg")
-    elif sqft >= 600: gem += 5
-
-    cpr = data['complaints'].get(bbl, 0) / units if units > 0 else 0
-    rcpr = data['recent_complaints'].get(bbl, 0) / units if units > 0 else 0
-    if cpr == 0: gem += 25; gem_reasons.append("zero complaints ever")
-    elif cpr < 1: gem += 22; gem_reasons.append(f"very clean record ({cpr:.1f} complaints/unit)")
-    elif cpr < 3: gem += 18; gem_reasons.append(f"good maintenance ({cpr:.1f} complaints/unit)")
-    elif cpr < 5: gem += 12
-    elif cpr < 10: gem += 5
-    if rcpr == 0: gem += 5
-
-    npr = data['noise'].get(bbl, 0) / units if units > 0 else 0
-    if npr == 0: gem += 15; gem_reasons.append("zero noise complaints")
-    elif npr < 0.5: gem += 10; gem_reasons.append("quiet building")
-    elif npr < 1: gem += 5
-
-    yr = b['year_built'] or 0
-    if 1880 <= yr <= 1945:
-        gem += 8; gem_reasons.append(f"prewar ({yr})")
-    elif yr >= 2015:
-        gem += 6; gem_reasons.append(f"new construction ({yr})")
-    if 6 <= units <= 30:
-        gem += 4; gem_reasons.append(f"boutique ({units} units)")
-    if (b['num_floors'] or 0) >= 6: gem += 3
-
-    is_stab = bbl in data['rent_stab'] and data['rent_stab'][bbl] > 0
-    if is_stab:
-        gem += 10
-        gem_reasons.append(f"rent stabilized ({data['rent_stab'][bbl]} units)")
-        if sqft >= 1000: gem += 5
-    gem = min(gem, 100)
-
-    # AVAILABILITY SIGNALS
-    signals = []
-    signal_count = 0
-
-    dp = data['dob_permits'].get(bbl)
-    if dp:
-        cost = dp['max_cost']
-        if cost >= 200000:
-            signals.append(('DOB permit ($200K+)', 17.7, f"${cost:,.0f} renovation — major work, likely unit turnover"))
-        elif cost >= 50000:
-            signals.append(('DOB permit ($50-200K)', 10.2, f"${cost:,.0f} renovation"))
-        elif cost < 10000 and cost > 0:
-            signals.append(('DOB permit (<$10K)', 10.5, f"${cost:,.0f} — cosmetic work, possible pre-listing prep"))
-        elif dp['has_alt']:
-            signals.append(('DOB alteration', 16.4, f"{dp['count']} alteration permits filed"))
-        else:
-            signals.append(('DOB permit', 8.0, f"{dp['count']} permits"))
-        signal_count += 1
-
-    hl = data['hpd_lit'].get(bbl)
-    if hl:
-        if 'TENANT ACTION' in hl['types']:
-            signals.append(('HPD tenant action', 8.3, f"tenant lawsuit — {hl['count']} cases. Building under legal pressure."))
-        elif hl['types']:
-            signals.append(('HPD litigation', 6.4, f"{', '.join(sorted(hl['types']))} — {hl['count']} cases"))
-        else:
-            signals.append(('HPD litigation', 6.4, f"{hl['count']} cases"))
-        signal_count += 1
-
-    dc = data['distress_311'].get(bbl, 0)
-    dc_per_unit = dc / units if units > 0 else 0
-    if dc >= 5 and dc_per_unit >= 0.1:
-        signals.append(('311 distress complaints', 7.9, f"{dc} complaints ({dc_per_unit:.1f}/unit) — heat, water, plumbing issues"))
-        signal_count += 1
-    elif dc >= 3 and dc_per_unit >= 0.05:
-        signals.append(('311 distress complaints', 7.6, f"{dc} complaints — building may be deteriorating"))
-        signal_count += 1
-
-    ev = data['evictions'].get(bbl, 0)
-    if ev > 0:
-        signals.append(('Marshal eviction', 6.3, f"{ev} eviction(s) — forced vacancy creates openings"))
-        signal_count += 1
-
-    ec = data['ecb'].get(bbl)
-    if ec and ec > 0:
-        signals.append(('ECB unpaid fines', 5.0, f"${ec:,.0f} in unpaid fines — financial pressure on owner"))
-        signal_count += 1
-
-    ac = data['acris'].get(bbl)
-    if ac:
-        if ac['agreements'] > 0:
-            signals.append(('ACRIS agreement', 4.1, f"{ac['agreements']} pre-sale agreements filed"))
-            signal_count += 1
-        if ac['satisfactions'] > 0:
-            signals.append(('Mortgage satisfied', 3.0, f"{ac['satisfactions']} mortgage(s) paid off — often precedes sale"))
-            signal_count += 1
-
-    mc = data['owner_changed'].get(bbl)
-    if mc:
-        signals.append(('Ownership changed', 3.3, "corporate owner name changed in HPD records"))
-        signal_count += 1
-
-    # Compute availability score
-    if not signals:
-        avail = 0
-        convergence = 'none'
-    else:
-        sorted_sigs = sorted(signals, key=lambda x: x[1], reverse=True)
-        raw_lift = sum(s[1] for s in sorted_sigs[:3])
-        if signal_count >= 3:
-            multiplier = 1.5
-            convergence = 'strong'
-        elif signal_count == 2:
-            multiplier = 1.2
-            convergence = 'moderate'
-        else:
-            multiplier = 1.0
-            convergence = 'single'
-        avail = min(100, round((raw_lift * multiplier / 50) * 100))
-
-    traded = len(ac['units_traded']) if ac else 0
-
-    return {
-        'bbl': bbl,
-        'address': b['address'],
-        'zip': b['zipcode'],
-        'borough': b['borough'],
-        'built': b['year_built'],
-        'floors': b['num_floors'],
-        'units': units,
-        'avg_sqft': sqft,
-        'owner': (b['owner_name'] or '')[:50],
-        'gem_score': gem,
-        'gem_reasons': gem_reasons,
-        'avail_score': avail,
-        'convergence': convergence,
-        'signal_count': signal_count,
-        'signals': [(s[0], s[2]) for s in sorted(signals, key=lambda x: x[1], reverse=True)],
-        'combined': gem + avail,
-        'rent_stabilized': is_stab,
-        'stab_units': data['rent_stab'].get(bbl, 0),
-        'units_traded': traded,
-        'last_sale_date': ac['last_sale_date'] if ac else None,
-        'last_sale_amt': ac['last_sale_amt'] if ac else 0,
-        'complaints_per_unit': round(cpr, 1),
-    }
-
-
-def load_data(target_bbls):
-    """Load all signal data for a set of target BBLs using temp table for fast JOINs."""
-    data = {
-        'complaints': defaultdict(int),
-        'recent_complaints': defaultdict(int),
-        'noise': defaultdict(int),
-        'distress_311': defaultdict(int),
-        'rent_stab': {},
-        'acris': defaultdict(lambda: {
-            'deeds': 0, 'mortgages': 0, 'satisfactions': 0,
-            'agreements': 0, 'units_traded': set(),
-            'last_sale_date': None, 'last_sale_amt': 0,
-        }),
-        'dob_permits': {},
-        'hpd_lit': {},
-        'ecb': {},
-        'evictions': defaultdict(int),
-        'owner_changed': {},
-    }
-
-    # Create temp table for fast JOINs against indexed BBL columns
-    db.execute("DROP TABLE IF EXISTS _target_bbls")
-    db.execute("CREATE TEMP TABLE _target_bbls (bbl INTEGER PRIMARY KEY)")
-    db.executemany("INSERT INTO _target_bbls VALUES (?)", [(b,) for b in target_bbls])
-
-    for row in db.execute("SELECT c.bbl, COUNT(*) as cnt FROM hpd_complaints c JOIN _target_bbls t ON c.bbl=t.bbl GROUP BY c.bbl"):
-        data['complaints'][row['bbl']] = row['cnt']
-
-    for row in db.execute("SELECT c.bbl, COUNT(*) as cnt FROM hpd_complaints c JOIN _target_bbls t ON c.bbl=t.bbl WHERE c.received_date >= ? GROUP BY c.bbl", [cutoff_iso]):
-        data['recent_complaints'][row['bbl']] = row['cnt']
-
-    for row in db.execute("SELECT s.bbl, COUNT(*) as cnt FROM service_requests s JOIN _target_bbls t ON s.bbl=t.bbl WHERE s.complaint_type LIKE '%Noise%' GROUP BY s.bbl"):
-        data['noise'][row['bbl']] = row['cnt']
-
-    for row in db.execute("""
-        SELECT s.bbl, COUNT(*) as cnt FROM service_requests s
-        JOIN _target_bbls t ON s.bbl=t.bbl
-        WHERE s.created_date >= ?
-        AND (s.complaint_type LIKE '%HEAT%' OR s.complaint_type LIKE '%WATER%'
-             OR s.complaint_type LIKE '%PLUMBING%' OR s.complaint_type LIKE '%UNSANITARY%'
-             OR s.complaint_type LIKE '%PAINT%' OR s.complaint_type LIKE '%PLASTER%')
-        GROUP BY s.bbl
-    """, [cutoff_iso]):
-        data['distress_311'][row['bbl']] = row['cnt']
-
-    for row in db.execute("SELECT r.bbl, MAX(r.stabilized_units) as su FROM rent_stabilization r JOIN _target_bbls t ON r.bbl=t.bbl GROUP BY r.bbl"):
-        data['rent_stab'][row['bbl']] = row['su'] or 0
-
-    for row in db.execute("SELECT a.bbl, a.doc_type, a.recorded_date, a.amount, a.buyer, a.unit FROM sales a JOIN _target_bbls t ON a.bbl=t.bbl WHERE a.recorded_date >= ?", [cutoff_iso]):
-        ac = data['acris'][row['bbl']]
-        dt = row['doc_type'] or ''
-        if dt == 'DEED':
-            ac['deeds'] += 1
-            if row['unit']: ac['units_traded'].add(row['unit'])
-            try: amt = float(row['amount'] or 0)
-            except: amt = 0
-            rec = row['recorded_date'] or ''
-            if rec > (ac['last_sale_date'] or ''):
-                ac['last_sale_date'] = rec
-                ac['last_sale_amt'] = amt
-        elif dt == 'MTGE': ac['mortgages'] += 1
-        elif dt == 'SAT': ac['satisfactions'] += 1
-        elif dt == 'AGMT': ac['agreements'] += 1
-
-    dob_max = db.execute("SELECT MAX(action_date) FROM permits").fetchone()[0] or ''
-    dob_cutoff = cutoff_iso if dob_max >= cutoff_iso else '2000-01-01'
-    dob_permits = defaultdict(lambda: {'count': 0, 'max_cost': 0, 'has_alt': False})
-    for row in db.execute("SELECT d.bbl, d.job_type, d.estimated_cost FROM permits d JOIN _target_bbls t ON d.bbl=t.bbl WHERE d.action_date >= ?", [dob_cutoff]):
-        p = dob_permits[row['bbl']]
-        p['count'] += 1
-        try: cost = float(row['estimated_cost'] or 0)
-        except: cost = 0
-        if cost > p['max_cost']: p['max_cost'] = cost
-        if 'A' in (row['job_type'] or '').upper(): p['has_alt'] = True
-    data['dob_permits'] = dict(dob_permits)
-
-    hpd_lit = defaultdict(lambda: {'count': 0, 'types': set()})
-    for row in db.execute("SELECT h.bbl, h.case_type FROM litigation h JOIN _target_bbls t ON h.bbl=t.bbl WHERE h.opened_date >= ?", [cutoff_iso]):
-        h = hpd_lit[row['bbl']]
-        h['count'] += 1
-        if row['case_type']: h['types'].add(row['case_type'])
-    data['hpd_lit'] = dict(hpd_lit)
-
-    ecb = defaultdict(float)
-    for row in db.execute("SELECT e.bbl, e.balance_due FROM violations e JOIN _target_bbls t ON e.bbl=t.bbl WHERE e.issue_date >= ?", [cutoff_iso]):
-        try: ecb[row['bbl']] += float(row['balance_due'] or 0)
-        except: pass
-    data['ecb'] = {k: v for k, v in ecb.items() if v > 0}
-
-    for row in db.execute("SELECT m.bbl, COUNT(*) as cnt FROM evictions m JOIN _target_bbls t ON m.bbl=t.bbl WHERE m.executed_date >= ? GROUP BY m.bbl", [cutoff_iso]):
-        data['evictions'][row['bbl']] = row['cnt']
-
-    owner_history = defaultdict(set)
-    for row in db.execute("SELECT bc.bbl, bc.company FROM contacts bc JOIN _target_bbls t ON bc.bbl=t.bbl WHERE bc.role='owner' AND bc.company IS NOT NULL"):
-        name = (row['company'] or '').strip().upper()
-        if name: owner_history[row['bbl']].add(name)
-    data['owner_changed'] = {bbl: True for bbl, names in owner_history.items() if len(names) >= 2}
-
-    db.execute("DROP TABLE IF EXISTS _target_bbls")
-    return data
+def score_buildings(buildings):
+    """Score buildings (bbl → buildings row) with the shared scoring library.
+    Non-residential buildings have no features and are left out."""
+    fs, rows, res = score_bbls(db, list(buildings), cutoff_iso)
+    scored = []
+    for result in results(fs, rows, res, reasons=True):
+        b = buildings[result['bbl']]
+        s = {
+            'bbl': result['bbl'],
+            'address': b['address'],
+            'zip': b['zipcode'],
+            'borough': b['borough'],
+            'built': b['year_built'],
+            'floors': b['num_floors'],
+            'units': b['units_residential'],
+            'avg_sqft': b['avg_unit_sqft'] or 0,
+            'owner': (b['owner_name'] or '')[:50],
+        }
+        s.update(result)
+        scored.append(s)
+    return scored
 
 
 def search_buildings(zips, min_units=4):
@@ -353,11 +122,16 @@ def lookup_building(query):
         row = db.execute("SELECT * FROM buildings WHERE bbl = ?", [int(query)]).fetchone()
         if row: return {row['bbl']: dict(row)}
     # Address search
-    rows = db.execute(
-        "SELECT bbl, address, zipcode, borough, year_built, num_floors, units_residential, owner_name, avg_unit_sqft FROM buildings WHERE address LIKE ? AND units_residential > 0 LIMIT 20",
-        [f"%{query.upper()}%"]
-    ).fetchall()
-    return {r['bbl']: dict(r) for r in rows}
+    cols = "bbl, address, zipcode, borough, year_built, num_floors, units_residential, owner_name, avg_unit_sqft"
+    if has_address_index(db, 'building_addr'):
+        bbls = search_address_index(db, 'building_addr', query, limit=20)
+        rows = fetch_ranked(db, f"SELECT bbl AS _rid, {cols} FROM buildings WHERE bbl IN ({{ids}})", bbls)
+    else:
+        rows = db.execute(
+            f"SELECT {cols} FROM buildings WHERE address LIKE ? AND units_residential > 0 LIMIT 20",
+            [f"%{query.upper()}%"]
+        ).fetchall()
+    return {r['bbl']: {k: r[k] for k in r.keys() if k != '_rid'} for r in rows}
 
 
 # ── Display Functions ──────────────────────────────────────────────────────
@@ -439,7 +213,6 @@ def main():
 
     current_zips = None
     current_buildings = None
-    current_data = None
     current_scored = None
 
     while True:
@@ -499,14 +272,8 @@ def main():
             current_zips = zips
             print(f"\n  Scanning zip codes: {', '.join(zips)}...")
             current_buildings = search_buildings(zips)
-            print(f"  Loading signals for {len(current_buildings):,} buildings...", end=' ', flush=True)
-            target_bbls = set(current_buildings.keys())
-            current_data = load_data(target_bbls)
-            print("done.")
-            print("  Scoring...", end=' ', flush=True)
-            current_scored = []
-            for bbl, b in current_buildings.items():
-                current_scored.append(score_building(b, current_data))
+            print(f"  Scoring {len(current_buildings):,} buildings...", end=' ', flush=True)
+            current_scored = score_buildings(current_buildings)
             current_scored.sort(key=lambda x: x['combined'], reverse=True)
             print("done.")
 
@@ -530,24 +297,24 @@ def main():
 
         elif cmd.startswith('look at ') or cmd.startswith('show '):
             query = raw[8:] if cmd.startswith('look at ') else raw[5:]
-            results = lookup_building(query)
-            if not results:
+            matches = lookup_building(query)
+            if not matches:
                 print(f"\n  No building found matching '{query}'")
                 continue
-            if len(results) > 1 and len(results) <= 10:
-                print(f"\n  Found {len(results)} matches:")
-                for bbl, b in results.items():
+            if len(matches) > 1 and len(matches) <= 10:
+                print(f"\n  Found {len(matches)} matches:")
+                for bbl, b in matches.items():
                     print(f"    {b['address']}, {b['zipcode']} ({b['units_residential']} units) — BBL {bbl}")
-                print(f"\n  Showing details for all {len(results)}...")
-            elif len(results) > 10:
-                print(f"\n  Found {len(results)} matches — showing first 5:")
-                results = dict(list(results.items())[:5])
-
-            target_bbls = set(results.keys())
-            bld_data = load_data(target_bbls)
-            for bbl, b in results.items():
-                s = score_building(b, bld_data)
+                print(f"\n  Showing details for all {len(matches)}...")
+            elif len(matches) > 10:
+                print(f"\n  Found {len(matches)} matches — showing first 5:")
+                matches = dict(list(matches.items())[:5])
+
+            scored = score_buildings(matches)
+            for s in scored:
                 show_building_detail(s)
+            if len(scored) < len(matches):
+                print(f"  ({len(matches) - len(scored)} non-residential match(es) not scored)\n")
 
         elif cmd == 'diamonds':
             if not current_scored:
@@ -615,14 +382,8 @@ def main():
                     current_zips = zips
                     print(f"\n  Scanning: {', '.join(matches)} (zips: {', '.join(zips)})...")
                     current_buildings = search_buildings(zips)
-                    print(f"  Loading signals for {len(current_buildings):,} buildings...", end=' ', flush=True)
-                    target_bbls = set(current_buildings.keys())
-                    current_data = load_data(target_bbls)
-                    print("done.")
-                    print("  Scoring...", end=' ', flush=True)
-                    current_scored = []
-                    for bbl, b in current_buildings.items():
-                        current_scored.append(score_building(b, current_data))
+                    print(f"  Scoring {len(current_buildings):,} buildings...", end=' ', flush=True)
+                    current_scored = score_buildings(current_buildings)
                     current_scored.sort(key=lambda x: x['combined'], reverse=True)
                     print("done.")
                     with_signals = sum(1 for s in current_scored if s['signal_count'] > 0)
@@ -1,58 +1,30 @@
 #!/usr/bin/env python3
 """
 Pull ACRIS data with a single date filter (AND clauses time out on Socrata).
-Uses $order + $offset pagination from most recent backwards.
+Uses $order + $offset pagination from most recent backwards, through the
+shared vayo.socrata client.
 """
 
-import subprocess
 import json
 import sqlite3
-import time
 import os
-import urllib.parse
+import sys
 from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.socrata import SyncClient
 
 DB = "/Users/pjump/Desktop/projects/vayo/vayo_clean.db"
 CACHE_DIR = "/Users/pjump/Desktop/projects/vayo/acris_cache"
 BATCH = 50000
 
-def fetch(url):
-    for attempt in range(5):
-        result = subprocess.run(
-            ['curl', '-s', '--max-time', '300', url],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0 and result.stdout.strip().startswith('['):
-            try:
-                return json.loads(result.stdout)
-            except json.JSONDecodeError:
-                pass
-        wait = 10 * (attempt + 1)
-        print(f"    retry {attempt+1} (wait {wait}s)...", flush=True)
-        time.sleep(wait)
-    return []
-
-def build_url(base, params):
-    """Build a properly URL-encoded Socrata API URL."""
-    return f"{base}?{urllib.parse.urlencode(params)}"
-
-def fetch_all(base, query_params, label):
-    """Paginate through a Socrata endpoint with proper URL encoding."""
+def fetch_all(client, base, query_params, label):
+    """Paginate through a Socrata endpoint."""
     all_rows = []
-    offset = 0
-    while True:
-        params = {**query_params, '$limit': BATCH, '$offset': offset}
-        url = build_url(base, params)
-        print(f"  [{label}] offset {offset:,}...", end=' ', flush=True)
-        data = fetch(url)
-        print(f"{len(data):,}", flush=True)
-        if not data:
-            break
+    for offset, data in client.pages(base, query_params, batch=BATCH, label=label):
+        print(f"  [{label}] offset {offset:,}: {len(data):,}", flush=True)
         all_rows.extend(data)
-        if len(data) < BATCH:
-            break
-        offset += BATCH
-        time.sleep(2)
     print(f"  [{label}] Total: {len(all_rows):,}")
     return all_rows
 
@@ -67,7 +39,7 @@ def make_bbl(boro, block, lot):
     except (ValueError, TypeError):
         return None
 
-def main():
+def refresh(client):
     os.makedirs(CACHE_DIR, exist_ok=True)
     db = sqlite3.connect(DB)
 
@@ -90,7 +62,7 @@ def main():
     else:
         print("\nPulling Master records (2022+)...")
         raw_master = fetch_all(
-            "https://data.cityofnewyork.us/resource/bnx9-e6tj.json",
+            client, "https://data.cityofnewyork.us/resource/bnx9-e6tj.json",
             {'$where': "recorded_datetime>'2022-01-01T00:00:00.000'",
              '$order': 'recorded_datetime DESC'},
             "Master"
@@ -117,7 +89,7 @@ def main():
     else:
         print("\nPulling Legals (2022+)...")
         legals = fetch_all(
-            "https://data.cityofnewyork.us/resource/8h5j-fqxa.json",
+            client, "https://data.cityofnewyork.us/resource/8h5j-fqxa.json",
             {'$where': "good_through_date>'2022-01-01T00:00:00.000'",
              '$order': 'good_through_date DESC'},
             "Legals"
@@ -157,7 +129,7 @@ def main():
     else:
         print("\nPulling Parties (2022+)...")
         parties = fetch_all(
-            "https://data.cityofnewyork.us/resource/636b-3b5g.json",
+            client, "https://data.cityofnewyork.us/resource/636b-3b5g.json",
             {'$where': "good_through_date>'2022-01-01T00:00:00.000'",
              '$order': 'good_through_date DESC'},
             "Parties"
@@ -226,5 +198,9 @@ def main():
         print(f"    {row[0]}: {row[1]:,}")
     db.close()
 
+def main():
+    with SyncClient() as client:
+        refresh(client)
+
 if __name__ == '__main__':
     main()
@@ -7,24 +7,28 @@ Three endpoints:
   - Legals:  https://data.cityofnewyork.us/resource/8h5j-fqxa.json  (~22.5M)
   - Parties: https://data.cityofnewyork.us/resource/636b-3b5g.json  (~46M)
 
-Records are cached as line-delimited JSON (one JSON array per batch file)
-to avoid loading everything into memory at once.
+Records are cached as gzip-compressed NDJSON, one segment per batch plus a
+manifest (see vayo.batchcache), and read back a line at a time.
 
 Usage:
     python3 scripts/pull_acris_full.py [--resume] [--master-only] [--legals-only] [--parties-only]
 
+Requests go through the shared vayo.socrata client. The selected endpoints
+are pulled at the same time, each with a few pages in flight, within the
+client's concurrency and rate limits.
+
 Estimated time: 6-10 hours for all three endpoints.
-Estimated disk: ~15GB in acris_cache/full/
+Estimated disk: ~3GB in acris_cache/full/
 """
 
-import subprocess
-import json
-import time
-import os
+import asyncio
 import sys
-import urllib.parse
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.batchcache import BatchCache, disk_bytes
+from vayo.socrata import FetchError, SocrataClient
+
 CACHE_DIR = Path("/Users/pjump/Desktop/projects/vayo/acris_cache/full")
 BATCH = 50000
 MAX_RETRIES = 8
@@ -50,102 +54,61 @@ ENDPOINTS = {
 TARGET_DOC_TYPES = {'DEED', 'MTGE', 'SAT', 'AGMT', 'LPNS', 'AL&R'}
 
 
-def fetch(url):
-    """Fetch a single URL with retries."""
-    for attempt in range(MAX_RETRIES):
-        result = subprocess.run(
-            ['curl', '-s', '--max-time', '600', url],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0 and result.stdout.strip().startswith('['):
-            try:
-                return json.loads(result.stdout)
-            except json.JSONDecodeError:
-                pass
-        wait = min(15 * (attempt + 1), 120)
-        print(f"    retry {attempt+1}/{MAX_RETRIES} (wait {wait}s)...", flush=True)
-        time.sleep(wait)
-    return None
-
-
-def pull_endpoint(name, config, resume=False):
+async def pull_endpoint(client, name, config, resume=False):
     """Pull all records from a Socrata endpoint, saving batches to disk."""
-    cache_dir = CACHE_DIR / name
-    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache = BatchCache(CACHE_DIR / name, key='document_id')
 
     # Find resume point
     start_batch = 0
     if resume:
-        existing = sorted(cache_dir.glob('batch_*.json'))
-        if existing:
-            last = existing[-1].stem  # e.g., batch_0050
-            start_batch = int(last.split('_')[1]) + 1
-            print(f"  Resuming from batch {start_batch} ({start_batch * BATCH:,} offset)")
+        last = cache.last()
+        if last:
+            start_batch = last[0] + 1
+            print(f"  [{name}] resuming from batch {start_batch} ({start_batch * BATCH:,} offset)")
 
-    offset = start_batch * BATCH
     total_fetched = start_batch * BATCH  # approximate
     batch_num = start_batch
 
-    base_params = {
+    params = {
         '$select': config['select'],
         '$order': config['order'],
-        '$limit': BATCH,
     }
 
-    while True:
-        params = {**base_params, '$offset': offset}
-        url = f"{config['url']}?{urllib.parse.urlencode(params)}"
-
-        print(f"  [{name}] batch {batch_num} (offset {offset:,})...", end=' ', flush=True)
-        data = fetch(url)
-
-        if data is None:
-            print(f"FAILED after {MAX_RETRIES} retries. Run with --resume to continue.", flush=True)
-            return total_fetched
-
-        print(f"{len(data):,} records", flush=True)
-
-        if not data:
-            break
-
-        # Save batch to disk
-        batch_file = cache_dir / f"batch_{batch_num:05d}.json"
-        with open(batch_file, 'w') as f:
-            json.dump(data, f)
-
-        total_fetched += len(data)
-        batch_num += 1
-
-        if len(data) < BATCH:
-            break
-
-        offset += BATCH
-        time.sleep(1.5)  # Be nice to the API
+    try:
+        async for offset, data in client.pages(config['url'], params, batch=BATCH,
+                                               start=start_batch * BATCH, label=name):
+            batch_num = offset // BATCH
+            print(f"  [{name}] batch {batch_num} (offset {offset:,}): {len(data):,} records",
+                  flush=True)
+            if not data:
+                break
+            # Save batch to disk
+            await asyncio.to_thread(cache.write, batch_num, data)
+            total_fetched += len(data)
+            batch_num += 1
+    except FetchError as e:
+        print(f"  [{name}] FAILED ({e}). Run with --resume to continue.", flush=True)
+        return total_fetched
 
     print(f"  [{name}] COMPLETE: {total_fetched:,} records in {batch_num} batches")
     return total_fetched
 
 
+async def pull_endpoints(names, resume):
+    async with SocrataClient(retries=MAX_RETRIES, timeout=600) as client:
+        counts = await asyncio.gather(*(pull_endpoint(client, name, ENDPOINTS[name], resume)
+                                        for name in names))
+    return dict(zip(names, counts))
+
+
 def count_cached(name):
     """Count total records in cached batches."""
-    cache_dir = CACHE_DIR / name
-    if not cache_dir.exists():
-        return 0
-    total = 0
-    for f in sorted(cache_dir.glob('batch_*.json')):
-        with open(f) as fh:
-            total += len(json.load(fh))
-    return total
+    return BatchCache(CACHE_DIR / name).rows()
 
 
 def iter_cached(name):
     """Iterate over all cached records for an endpoint."""
-    cache_dir = CACHE_DIR / name
-    if not cache_dir.exists():
-        return
-    for f in sorted(cache_dir.glob('batch_*.json')):
-        with open(f) as fh:
-            yield from json.load(fh)
+    yield from BatchCache(CACHE_DIR / name)
 
 
 def main():
@@ -166,25 +129,19 @@ def main():
     print(f"  Target doc types: {', '.join(sorted(TARGET_DOC_TYPES))}")
     print()
 
-    totals = {}
-
+    names = []
     if pull_master:
-        print(f"{'─'*70}")
-        print(f"  MASTER (~16.9M records)")
-        print(f"{'─'*70}")
-        totals['master'] = pull_endpoint('master', ENDPOINTS['master'], resume)
-
+        print("  MASTER  (~16.9M records)")
+        names.append('master')
     if pull_legals:
-        print(f"\n{'─'*70}")
-        print(f"  LEGALS (~22.5M records)")
-        print(f"{'─'*70}")
-        totals['legals'] = pull_endpoint('legals', ENDPOINTS['legals'], resume)
-
+        print("  LEGALS  (~22.5M records)")
+        names.append('legals')
     if pull_parties:
-        print(f"\n{'─'*70}")
-        print(f"  PARTIES (~46M records)")
-        print(f"{'─'*70}")
-        totals['parties'] = pull_endpoint('parties', ENDPOINTS['parties'], resume)
+        print("  PARTIES (~46M records)")
+        names.append('parties')
+    print()
+
+    totals = asyncio.run(pull_endpoints(names, resume))
 
     # Summary
     print(f"\n{'='*70}")
@@ -194,8 +151,7 @@ def main():
         print(f"  {name:<10} {count:>15,} records")
 
     # Disk usage
-    total_size = sum(f.stat().st_size for f in CACHE_DIR.rglob('*.json'))
-    print(f"\n  Total disk: {total_size / (1024**3):.1f} GB")
+    print(f"\n  Total disk: {disk_bytes(CACHE_DIR) / (1024**3):.1f} GB")
     print(f"  Cache dir:  {CACHE_DIR}")
 
 
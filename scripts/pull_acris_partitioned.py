@@ -1,170 +1,166 @@
 #!/usr/bin/env python3
 """
 Partitioned ACRIS puller — splits by filter (borough/doc_id range) to avoid
-slow high-offset pagination. All partitions run in parallel.
+slow high-offset pagination. All partitions run in parallel, sharing one
+vayo.socrata client: its pooled connections, concurrency limit and token
+bucket replace per-thread requests and sleeps.
 
-Legals: 5 partitions by borough (~22.5M total)
-Parties: 12 partitions by document_id range (~46M total)
+Partitions are planned, not hardcoded: vayo.partition probes count(*) over
+document_id ranges and splits them until each chunk holds ~1M rows, then
+workers take chunks from one queue, largest first, so no worker is left
+tailing on a giant partition.
+
+Legals: seeded by borough, then split by document_id (~22.5M total)
+Parties: split by document_id (~46M total)
+
+Delete <endpoint>_parts/plan.json (with its caches) to re-plan from scratch.
 
 Usage:
     python3 scripts/pull_acris_partitioned.py [--legals-only] [--parties-only]
 """
 
-import json
-import time
+import asyncio
 import sys
-import urllib.parse
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
-import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.batchcache import BatchCache, cache_dirs, disk_bytes
+from vayo.partition import drain, load_plan, plan, save_plan
+from vayo.socrata import FetchError, SocrataClient
 
 CACHE_DIR = Path("/Users/pjump/Desktop/projects/vayo/acris_cache/full")
 BATCH = 50000
 MAX_RETRIES = 8
 
-print_lock = threading.Lock()
+
 def tprint(msg):
-    with print_lock:
-        print(msg, flush=True)
+    print(msg, flush=True)
 
-# --- Partition definitions ---
+# --- Partition seeds ---
+# Each seed is cut into document_id ranges of about CHUNK_ROWS rows by
+# vayo.partition.plan(); the chunks are saved in <endpoint>_parts/plan.json
+# so a resumed pull finds the same chunks.
+
+CHUNK_ROWS = 1_000_000
 
 LEGALS_BASE = "https://data.cityofnewyork.us/resource/8h5j-fqxa.json"
 LEGALS_SELECT = "document_id,borough,block,lot,unit"
 
-LEGALS_PARTITIONS = [
-    {"name": "boro_1", "where": "borough='1'", "expected": 5_500_000},
-    {"name": "boro_2", "where": "borough='2'", "expected": 2_500_000},
-    {"name": "boro_3", "where": "borough='3'", "expected": 7_400_000},
-    {"name": "boro_4", "where": "borough='4'", "expected": 7_100_000},
-    {"name": "boro_5", "where": "borough='5'", "expected": 210_000},
+LEGALS_SEEDS = [
+    {"name": f"boro_{b}", "where": f"borough='{b}'"} for b in '12345'
 ]
 
 PARTIES_BASE = "https://data.cityofnewyork.us/resource/636b-3b5g.json"
 PARTIES_SELECT = "document_id,party_type,name"
 
-PARTIES_PARTITIONS = [
-    {"name": "num_2000_2005", "where": "document_id>='2000' AND document_id<'2005'", "expected": 3_100_000},
-    {"name": "num_2005_2010", "where": "document_id>='2005' AND document_id<'2010'", "expected": 6_200_000},
-    {"name": "num_2010_2015", "where": "document_id>='2010' AND document_id<'2015'", "expected": 4_950_000},
-    {"name": "num_2015_2020", "where": "document_id>='2015' AND document_id<'2020'", "expected": 5_050_000},
-    {"name": "num_2020_2025", "where": "document_id>='2020' AND document_id<'2025'", "expected": 4_850_000},
-    {"name": "num_2025_plus", "where": "document_id>='2025' AND document_id<'A'", "expected": 950_000},
-    {"name": "alpha_BK", "where": "document_id>='B' AND document_id<'C'", "expected": 5_150_000},
-    {"name": "alpha_FT_1", "where": "document_id>='FT_1' AND document_id<'FT_2'", "expected": 2_900_000},
-    {"name": "alpha_FT_2", "where": "document_id>='FT_2' AND document_id<'FT_3'", "expected": 1_800_000},
-    {"name": "alpha_FT_3", "where": "document_id>='FT_3' AND document_id<'FT_4'", "expected": 5_400_000},
-    {"name": "alpha_FT_4", "where": "document_id>='FT_4' AND document_id<'FT_5'", "expected": 6_000_000},
+PARTIES_SEEDS = [
+    {"name": "doc", "where": None},
 ]
 
 
-def fetch_with_retry(url, label=""):
-    """Fetch URL with retries and backoff."""
-    for attempt in range(MAX_RETRIES):
-        try:
-            resp = requests.get(url, timeout=600)
-            if resp.status_code == 200 and resp.text.strip().startswith('['):
-                return resp.json()
-            elif resp.status_code == 429:
-                wait = min(60 * (attempt + 1), 300)
-                tprint(f"    [{label}] rate limited, wait {wait}s...")
-                time.sleep(wait)
-                continue
-        except (requests.RequestException, json.JSONDecodeError) as e:
-            pass
-        wait = min(15 * (attempt + 1), 120)
-        tprint(f"    [{label}] retry {attempt+1}/{MAX_RETRIES} (wait {wait}s)...")
-        time.sleep(wait)
-    return None
-
-
-def pull_partition(endpoint_name, base_url, select, partition):
-    """Pull all records for a single partition. Returns total count."""
+async def pull_partition(client, endpoint_name, base_url, select, partition):
+    """Pull all records for a single planned chunk. Returns total count."""
     pname = partition["name"]
     where = partition["where"]
     label = f"{endpoint_name}/{pname}"
-    cache_dir = CACHE_DIR / f"{endpoint_name}_parts" / pname
-    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache = BatchCache(CACHE_DIR / f"{endpoint_name}_parts" / pname, key='document_id')
 
-    # Check for resume
-    existing = sorted(cache_dir.glob("batch_*.json"))
+    # Check for resume; row counts come from the manifest, not the batches
+    last = cache.last()
     start_batch = 0
-    if existing:
+    if last:
+        last_batch, last_count = last
         # Check if last batch was partial (meaning complete)
-        with open(existing[-1]) as f:
-            last_count = len(json.load(f))
         if last_count < BATCH:
-            total = sum(len(json.load(open(bf))) for bf in existing)
+            total = cache.rows()
             tprint(f"  [{label}] already complete: {total:,} records")
             return total
-        start_batch = int(existing[-1].stem.split('_')[1]) + 1
+        start_batch = last_batch + 1
 
     offset = start_batch * BATCH
-    batch_num = start_batch
     total = start_batch * BATCH
 
     if start_batch > 0:
         tprint(f"  [{label}] resuming from batch {start_batch} (offset {offset:,})")
     else:
-        tprint(f"  [{label}] starting (expected ~{partition['expected']:,})")
-
-    while True:
-        params = {
-            '$select': select,
-            '$where': where,
-            '$order': 'document_id',
-            '$limit': BATCH,
-            '$offset': offset,
-        }
-        url = f"{base_url}?{urllib.parse.urlencode(params)}"
-
-        data = fetch_with_retry(url, label)
-
-        if data is None:
-            tprint(f"  [{label}] FAILED at batch {batch_num}")
-            return total
-
-        count = len(data)
-
-        # Save
-        batch_file = cache_dir / f"batch_{batch_num:05d}.json"
-        with open(batch_file, 'w') as f:
-            json.dump(data, f)
-
-        total += count
-        tprint(f"  [{label}] batch {batch_num}: {count:,} (total {total:,})")
-
-        if count < BATCH:
-            break
-
-        batch_num += 1
-        offset += BATCH
-        time.sleep(0.3)
+        tprint(f"  [{label}] starting (~{partition['count']:,} at planning)")
+
+    params = {
+        '$select': select,
+        '$order': 'document_id',
+    }
+    if where:
+        params['$where'] = where
+    try:
+        async for offset, data in client.pages(base_url, params, batch=BATCH,
+                                               start=offset, label=label):
+            batch_num = offset // BATCH
+            count = len(data)
+
+            # Save
+            await asyncio.to_thread(cache.write, batch_num, data)
+
+            total += count
+            tprint(f"  [{label}] batch {batch_num}: {count:,} (total {total:,})")
+    except FetchError as e:
+        tprint(f"  [{label}] FAILED ({e})")
+        return total
 
     tprint(f"  [{label}] COMPLETE: {total:,} records")
     return total
 
 
-def pull_endpoint(endpoint_name, base_url, select, partitions, max_workers=5):
-    """Pull all partitions for an endpoint in parallel."""
+async def partition_plan(client, endpoint_name, base_url, seeds):
+    """The saved chunk plan for an endpoint, or a new one probed from the
+    API. Returns None if the parts directory holds caches the plan doesn't
+    know (e.g. from the old fixed partitions), since pulling next to them
+    would duplicate records in the build."""
+    parts_dir = CACHE_DIR / f"{endpoint_name}_parts"
+    plan_path = parts_dir / "plan.json"
+    chunks = load_plan(plan_path)
+    if chunks is not None:
+        tprint(f"  Using saved plan {plan_path} ({len(chunks)} chunks)")
+    else:
+        tprint(f"  Planning {endpoint_name} chunks of ~{CHUNK_ROWS:,} rows...")
+        chunks = await plan(client, base_url, 'document_id', seeds,
+                            target=CHUNK_ROWS, log=tprint)
+    stale = [d for d in cache_dirs(parts_dir)
+             if d.name not in {c['name'] for c in chunks}]
+    if stale:
+        tprint(f"  {len(stale)} cache dirs in {parts_dir} aren't in the plan "
+               f"(e.g. {stale[0].name}). Move them aside and rerun.")
+        return None
+    save_plan(plan_path, chunks)
+    return chunks
+
+
+async def pull_endpoint(endpoint_name, base_url, select, seeds, max_workers=5):
+    """Plan an endpoint's chunks and pull them on `max_workers` workers
+    sharing one queue, largest chunk first."""
     tprint(f"\n{'='*70}")
-    tprint(f"  {endpoint_name.upper()} — {len(partitions)} partitions, {max_workers} workers")
+    tprint(f"  {endpoint_name.upper()} — {len(seeds)} seeds, {max_workers} workers")
     tprint(f"{'='*70}")
 
-    results = {}
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {
-            executor.submit(pull_partition, endpoint_name, base_url, select, p): p["name"]
-            for p in partitions
-        }
-        for fut in as_completed(futures):
-            pname = futures[fut]
-            try:
-                results[pname] = fut.result()
-            except Exception as e:
-                tprint(f"  [{endpoint_name}/{pname}] ERROR: {e}")
-                results[pname] = 0
+    async with SocrataClient(concurrency=max_workers, retries=MAX_RETRIES) as client:
+        try:
+            chunks = await partition_plan(client, endpoint_name, base_url, seeds)
+        except FetchError as e:
+            tprint(f"  [{endpoint_name}] planning FAILED ({e})")
+            return 0
+        if chunks is None:
+            return 0
+        sizes = sorted(c['count'] for c in chunks)
+        tprint(f"  {len(chunks)} chunks, {sizes[0]:,}–{sizes[-1]:,} rows "
+               f"(median {sizes[len(sizes) // 2]:,})")
+        results = await drain(
+            chunks,
+            lambda chunk: pull_partition(client, endpoint_name, base_url, select, chunk),
+            max_workers)
+
+    for pname, count in results.items():
+        if isinstance(count, Exception):
+            tprint(f"  [{endpoint_name}/{pname}] ERROR: {count}")
+            results[pname] = 0
 
     grand_total = sum(results.values())
     tprint(f"\n  {endpoint_name.upper()} TOTAL: {grand_total:,}")
@@ -185,14 +181,14 @@ def main():
     totals = {}
 
     if do_legals:
-        totals['legals'] = pull_endpoint(
-            'legals', LEGALS_BASE, LEGALS_SELECT, LEGALS_PARTITIONS, max_workers=5
-        )
+        totals['legals'] = asyncio.run(pull_endpoint(
+            'legals', LEGALS_BASE, LEGALS_SELECT, LEGALS_SEEDS, max_workers=5
+        ))
 
     if do_parties:
-        totals['parties'] = pull_endpoint(
-            'parties', PARTIES_BASE, PARTIES_SELECT, PARTIES_PARTITIONS, max_workers=6
-        )
+        totals['parties'] = asyncio.run(pull_endpoint(
+            'parties', PARTIES_BASE, PARTIES_SELECT, PARTIES_SEEDS, max_workers=6
+        ))
 
     tprint(f"\n{'='*70}")
     tprint(f"  ALL DONE")
@@ -200,8 +196,7 @@ def main():
     for name, total in totals.items():
         tprint(f"  {name}: {total:,}")
 
-    total_size = sum(f.stat().st_size for f in CACHE_DIR.rglob('*.json'))
-    tprint(f"  Total cache: {total_size / (1024**3):.1f} GB")
+    tprint(f"  Total cache: {disk_bytes(CACHE_DIR) / (1024**3):.1f} GB")
 
 
 if __name__ == '__main__':
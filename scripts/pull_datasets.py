@@ -3,7 +3,8 @@
 VAYO Dataset Puller
 ===================
 Pulls all supplementary datasets from NYC Open Data (and MTA/NY State).
-Each dataset is cached as JSON batches in data_cache/<name>/.
+Each dataset is cached as compressed NDJSON batches in data_cache/<name>/
+(see vayo.batchcache).
 
 Datasets:
   hpd_violations    10.7M   HPD inspector violations (A/B/C severity)
@@ -13,34 +14,70 @@ Datasets:
   vacate_orders       8K    HPD vacate/repair orders
   subway_stations    ~500   MTA subway station locations with lat/lon
 
+Incremental sync (--sync) skips the cache and applies only the records
+Socrata reports changed since the last build or sync (their :updated_at is
+past the dataset's watermark in vayo_clean.db's _sync_state) straight to
+vayo_clean.db. They are upserted by natural key (violationid,
+job_filing_number, ...) through the same row builders build_vayo_db uses;
+see vayo.datasets. Datasets without a natural key (rolling_sales,
+tax_liens, subway_stations) are re-pulled whole, and only when something
+in them changed.
+Deletions upstream are not seen; a full pull and rebuild picks them up.
+
+Streaming mode (--stream) skips the JSON cache for a full pull: each page
+is normalized by the same row builders and written straight into a staging
+table in data_staging.db by a writer thread, while the next pages download
+(see vayo.ingest). build_vayo_db loads the staged rows as they are.
+--keep-cache also writes the raw pages to data_cache/ for audit.
+
+Requests go through the shared vayo.socrata client: a full pull pages all
+datasets at once over pooled connections, within its concurrency and rate
+limits.
+
 Usage:
     python3 scripts/pull_datasets.py                    # pull all
     python3 scripts/pull_datasets.py hpd_violations     # pull one
     python3 scripts/pull_datasets.py --resume            # resume interrupted pulls
+    python3 scripts/pull_datasets.py --stream            # pull into data_staging.db
+    python3 scripts/pull_datasets.py --stream --keep-cache --resume
     python3 scripts/pull_datasets.py --list              # show status
+    python3 scripts/pull_datasets.py --sync              # apply changes to vayo_clean.db
 """
 
-import subprocess
-import json
+import asyncio
+import sqlite3
 import time
-import os
 import sys
-import urllib.parse
+from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.batchcache import BatchCache, disk_bytes
+from vayo.datasets import DATASETS as TABLES, get_watermark, set_watermark, upsert
+from vayo.ingest import StagingWriter, stream_dataset
+from vayo.socrata import FetchError, SocrataClient, SyncClient
+
 CACHE_DIR = Path("/Users/pjump/Desktop/projects/vayo/data_cache")
+OUT_DB = CACHE_DIR.parent / "vayo_clean.db"
+STAGING_DB = CACHE_DIR.parent / "data_staging.db"
 BATCH = 50000
 MAX_RETRIES = 6
 
+# A sync re-reads this far behind the watermark, for rows whose update
+# became visible after later ones had been read. Upserts make it harmless.
+SYNC_OVERLAP = timedelta(days=1)
+
 # ── Dataset definitions ───────────────────────────────────────────────────
 # Each dataset: (name, base_url, select_fields, order_field, estimated_records)
+# Every select includes :updated_at, which the cache manifest tracks as its
+# key, so a build knows where the next --sync should start.
 
 DATASETS = {
     'hpd_violations': {
         'url': 'https://data.cityofnewyork.us/resource/wvxf-dwi5.json',
-        'select': 'boroid,block,lot,apartment,class,inspectiondate,approveddate,'
-                  'novdescription,currentstatus,currentstatusdate,violationstatus,'
-                  'novtype,rentimpairing',
+        'select': 'violationid,boroid,block,lot,apartment,class,inspectiondate,'
+                  'approveddate,novdescription,currentstatus,currentstatusdate,'
+                  'violationstatus,novtype,rentimpairing,:updated_at',
         'order': 'inspectiondate DESC',
         'estimate': '10.7M',
     },
@@ -48,117 +85,221 @@ DATASETS = {
         'url': 'https://data.cityofnewyork.us/resource/usep-8jbt.json',
         'select': 'borough,block,lot,address,zip_code,residential_units,'
                   'building_class_at_present,year_built,gross_square_feet,'
-                  'sale_price,sale_date',
+                  'sale_price,sale_date,:updated_at',
         'order': 'sale_date DESC',
         'estimate': '80K',
     },
     'tax_liens': {
         'url': 'https://data.cityofnewyork.us/resource/9rz4-mjek.json',
         'select': 'borough,block,lot,tax_class_code,building_class,'
-                  'house_number,street_name,zip_code,water_debt_only,cycle',
+                  'house_number,street_name,zip_code,water_debt_only,cycle,:updated_at',
         'order': 'cycle DESC',
         'estimate': '264K',
     },
     'dob_now_jobs': {
         'url': 'https://data.cityofnewyork.us/resource/w9ak-ipjd.json',
-        'select': 'bbl,bin,borough,block,lot,house_no,street_name,job_type,'
-                  'filing_status,initial_cost,existing_dwelling_units,'
+        'select': 'job_filing_number,bbl,bin,borough,block,lot,house_no,street_name,'
+                  'job_type,filing_status,initial_cost,existing_dwelling_units,'
                   'proposed_dwelling_units,filing_date,current_status_date,'
-                  'first_permit_date,latitude,longitude',
+                  'first_permit_date,latitude,longitude,:updated_at',
         'order': 'filing_date DESC',
         'estimate': '863K',
     },
     'vacate_orders': {
         'url': 'https://data.cityofnewyork.us/resource/tb8q-a3ar.json',
-        'select': 'bbl,bin,boro_short_name,house_number,street_name,'
-                  'primary_vacate_reason,vacate_type,vacate_effective_date,'
-                  'actual_rescind_date,number_of_vacated_units,latitude,longitude',
+        'select': 'vacate_order_number,bbl,bin,boro_short_name,house_number,'
+                  'street_name,primary_vacate_reason,vacate_type,vacate_effective_date,'
+                  'actual_rescind_date,number_of_vacated_units,latitude,longitude,'
+                  ':updated_at',
         'order': 'vacate_effective_date DESC',
         'estimate': '8K',
     },
     'subway_stations': {
         'url': 'https://data.ny.gov/resource/39hk-dx4f.json',
         'select': 'station_id,complex_id,stop_name,borough,daytime_routes,'
-                  'structure,gtfs_latitude,gtfs_longitude,ada',
+                  'structure,gtfs_latitude,gtfs_longitude,ada,:updated_at',
         'order': 'station_id',
         'estimate': '500',
     },
 }
 
 
-def fetch(url):
-    """Fetch a URL with retries."""
-    for attempt in range(MAX_RETRIES):
-        result = subprocess.run(
-            ['curl', '-s', '--max-time', '300', url],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0 and result.stdout.strip().startswith('['):
-            try:
-                return json.loads(result.stdout)
-            except json.JSONDecodeError:
-                pass
-        wait = min(10 * (attempt + 1), 60)
-        print(f"    retry {attempt+1}/{MAX_RETRIES} (wait {wait}s)...", flush=True)
-        time.sleep(wait)
-    return None
-
-
-def pull_dataset(name, config, resume=False):
+async def pull_dataset(client, name, config, resume=False):
     """Pull all records for a dataset."""
-    cache_dir = CACHE_DIR / name
-    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache = BatchCache(CACHE_DIR / name, key=':updated_at')
 
     # Resume support
     start_batch = 0
     if resume:
-        existing = sorted(cache_dir.glob('batch_*.json'))
-        if existing:
-            last = existing[-1].stem
-            start_batch = int(last.split('_')[1]) + 1
-            print(f"  Resuming from batch {start_batch} ({start_batch * BATCH:,} offset)")
-
-    offset = start_batch * BATCH
-    batch_num = start_batch
-    total = start_batch * BATCH
+        last = cache.last()
+        if last:
+            start_batch = last[0] + 1
+            print(f"  [{name}] resuming from batch {start_batch} ({start_batch * BATCH:,} offset)")
 
-    base_params = {
+    total = start_batch * BATCH
+    params = {
         '$select': config['select'],
         '$order': config['order'],
-        '$limit': BATCH,
     }
 
-    while True:
-        params = {**base_params, '$offset': offset}
-        url = f"{config['url']}?{urllib.parse.urlencode(params)}"
+    try:
+        async for offset, data in client.pages(config['url'], params, batch=BATCH,
+                                               start=start_batch * BATCH, label=name):
+            batch_num = offset // BATCH
+            print(f"  [{name}] batch {batch_num} (offset {offset:,}): "
+                  f"{len(data):,} records", flush=True)
+            if data:
+                await asyncio.to_thread(cache.write, batch_num, data)
+            total += len(data)
+    except FetchError as e:
+        print(f"  [{name}] FAILED ({e}). Run with --resume to continue.", flush=True)
+        return total
 
-        print(f"  [{name}] batch {batch_num} (offset {offset:,})...", end=' ', flush=True)
-        data = fetch(url)
+    print(f"  [{name}] COMPLETE: {total:,} records")
+    return total
 
-        if data is None:
-            print(f"FAILED. Run with --resume to continue.", flush=True)
-            return total
 
-        print(f"{len(data):,} records", flush=True)
+async def pull_all(targets, resume):
+    """Pull every target dataset concurrently through one client."""
+    async with SocrataClient(retries=MAX_RETRIES) as client:
+        counts = await asyncio.gather(*(pull_dataset(client, name, config, resume)
+                                        for name, config in targets.items()))
+    return dict(zip(targets, counts))
 
-        if not data:
-            break
 
-        batch_file = cache_dir / f"batch_{batch_num:05d}.json"
-        with open(batch_file, 'w') as f:
-            json.dump(data, f)
+async def stream_dataset_to_staging(client, writer, name, config, resume=False,
+                                    keep_cache=False):
+    """Pull all records for a dataset into its staging table."""
+    cache = BatchCache(CACHE_DIR / name, key=':updated_at') if keep_cache else None
+    params = {
+        '$select': config['select'],
+        '$order': config['order'],
+    }
+    try:
+        total = await stream_dataset(client, writer, name, config['url'], params,
+                                     batch=BATCH, resume=resume, cache=cache)
+    except FetchError as e:
+        print(f"  [{name}] FAILED ({e}). Run with --stream --resume to continue.", flush=True)
+        return 0
+    print(f"  [{name}] STAGED: {total:,} records")
+    return total
 
-        total += len(data)
-        batch_num += 1
 
-        if len(data) < BATCH:
-            break
+async def stream_all(targets, resume, keep_cache):
+    """Stream every target dataset concurrently into data_staging.db."""
+    with StagingWriter(STAGING_DB) as writer:
+        async with SocrataClient(retries=MAX_RETRIES) as client:
+            counts = await asyncio.gather(*(
+                stream_dataset_to_staging(client, writer, name, config, resume, keep_cache)
+                for name, config in targets.items()))
+    return dict(zip(targets, counts))
 
-        offset += BATCH
-        time.sleep(1.0)
 
-    print(f"  [{name}] COMPLETE: {total:,} records")
-    return total
+def soql_time(ts):
+    """Socrata :updated_at ('2024-03-05T17:20:11.000Z') as a SoQL literal."""
+    return ts.rstrip('Z')
+
+
+def count_changed(client, config, since):
+    """Rows of a dataset updated after `since`."""
+    return client.count(config['url'], f":updated_at > '{soql_time(since)}'")
+
+
+def iter_changed(client, name, config, since):
+    """Pages of records updated after `since` (all records if None), in
+    (:updated_at, :id) order. Pages by keyset rather than $offset, so rows
+    updated mid-sync can't shift unread rows past the reader."""
+    last = None
+    while True:
+        where = []
+        if since:
+            where.append(f":updated_at > '{soql_time(since)}'")
+        if last:
+            ts, row_id = soql_time(last[':updated_at']), last[':id']
+            where.append(f"(:updated_at > '{ts}' OR (:updated_at = '{ts}' AND :id > '{row_id}'))")
+        params = {
+            '$select': f"{config['select']},:id",
+            '$order': ':updated_at, :id',
+            '$limit': BATCH,
+        }
+        if where:
+            params['$where'] = ' AND '.join(where)
+        print(f"  [{name}] changed rows after {last[':updated_at'] if last else since}...",
+              end=' ', flush=True)
+        data = client.get(config['url'], params, label=name)
+        print(f"{len(data):,} records", flush=True)
+        if data:
+            yield data
+            last = data[-1]
+        if len(data) < BATCH:
+            return
+
+
+def sync_dataset(client, db, name, config, valid_bbls):
+    """Bring one dataset's table in vayo_clean.db up to date. Returns the
+    number of rows written."""
+    spec = TABLES[name]
+    have = db.execute(f"PRAGMA table_info({spec['table']})").fetchall()
+    if len(have) != spec['columns']:
+        sys.exit(f"  {spec['table']} has no natural-key column yet; "
+                 f"rebuild with scripts/build_vayo_db.py first")
+    watermark = get_watermark(db, name)
+    if watermark and spec['key']:
+        # Upsert only what changed, re-reading a little behind the watermark.
+        since = (datetime.fromisoformat(soql_time(watermark)[:19]) - SYNC_OVERLAP).isoformat()
+        written = 0
+        for page in iter_changed(client, name, config, since):
+            written += upsert(db, name, page, valid_bbls)
+            top = max(r[':updated_at'] for r in page)
+            watermark = max(watermark, top)
+            set_watermark(db, name, watermark, written)
+            db.commit()
+        print(f"  [{name}] {written:,} rows upserted, watermark {watermark}")
+        return written
+
+    if watermark:
+        changed = count_changed(client, config, watermark)
+        if changed == 0:
+            print(f"  [{name}] unchanged since {watermark}")
+            return 0
+    # No key to upsert by, or no watermark to start from: replace the table
+    # in one transaction, so readers never see it half-filled.
+    db.execute(f"DELETE FROM {spec['table']}")
+    written, top = 0, None
+    for page in iter_changed(client, name, config, None):
+        written += upsert(db, name, page, valid_bbls)
+        page_top = max(r[':updated_at'] for r in page)
+        top = max(top, page_top) if top else page_top
+    set_watermark(db, name, top, written)
+    db.commit()
+    print(f"  [{name}] table replaced: {written:,} rows, watermark {top}")
+    return written
+
+
+def sync(targets):
+    """Apply upstream changes for `targets` to vayo_clean.db."""
+    db = sqlite3.connect(str(OUT_DB))
+    db.execute("PRAGMA busy_timeout=30000")
+    valid_bbls = set(r[0] for r in db.execute("SELECT bbl FROM buildings"))
+    results = {}
+    try:
+        with SyncClient(retries=MAX_RETRIES) as client:
+            for name, config in targets.items():
+                print(f"{'─'*60}")
+                print(f"  SYNC {name.upper()}")
+                print(f"{'─'*60}")
+                t = time.time()
+                try:
+                    results[name] = sync_dataset(client, db, name, config, valid_bbls)
+                except FetchError as e:
+                    # Pages already upserted stay, with the watermark they reached.
+                    db.rollback()
+                    print(f"  [{name}] FAILED ({e}). Run --sync again to continue.")
+                    results[name] = 0
+                print(f"  [{name}] {time.time() - t:.1f}s\n")
+    finally:
+        db.close()
+    return results
 
 
 def show_status():
@@ -166,16 +307,10 @@ def show_status():
     print(f"\n{'Dataset':<20} {'Cached':<12} {'Expected':<10} {'Disk':<10}")
     print("-" * 55)
     for name, config in DATASETS.items():
-        cache_dir = CACHE_DIR / name
-        if cache_dir.exists():
-            total = 0
-            size = 0
-            for f in cache_dir.glob('batch_*.json'):
-                with open(f) as fh:
-                    total += len(json.load(fh))
-                size += f.stat().st_size
-            cached_str = f"{total:,}"
-            size_str = f"{size / (1024**2):.0f} MB"
+        cache = BatchCache(CACHE_DIR / name)
+        if cache.segments():
+            cached_str = f"{cache.rows():,}"
+            size_str = f"{cache.disk_bytes() / (1024**2):.0f} MB"
         else:
             cached_str = "-"
             size_str = "-"
@@ -187,6 +322,8 @@ def main():
     args = [a for a in sys.argv[1:] if not a.startswith('-')]
     flags = {a for a in sys.argv[1:] if a.startswith('-')}
     resume = '--resume' in flags
+    stream = '--stream' in flags
+    keep_cache = '--keep-cache' in flags
 
     if '--list' in flags or '--status' in flags:
         show_status()
@@ -203,23 +340,40 @@ def main():
     else:
         targets = DATASETS
 
+    if '--sync' in flags:
+        print("=" * 60)
+        print("  VAYO DATASET SYNC")
+        print("=" * 60)
+        print(f"  Syncing: {', '.join(targets.keys())}")
+        print(f"  Database: {OUT_DB}")
+        print()
+        results = sync(targets)
+        print(f"{'='*60}")
+        for name, count in results.items():
+            print(f"  {name:<20} {count:>12,} rows written")
+        return
+
     CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
     print("=" * 60)
     print("  VAYO DATASET PULLER")
     print("=" * 60)
     print(f"  Pulling: {', '.join(targets.keys())}")
-    print(f"  Cache: {CACHE_DIR}")
+    if stream:
+        print(f"  Staging: {STAGING_DB}")
+    if not stream or keep_cache:
+        print(f"  Cache: {CACHE_DIR}")
     print(f"  Resume: {resume}")
     print()
 
-    results = {}
     for name, config in targets.items():
-        print(f"{'─'*60}")
-        print(f"  {name.upper()} (~{config['estimate']} records)")
-        print(f"{'─'*60}")
-        results[name] = pull_dataset(name, config, resume)
-        print()
+        print(f"  {name:<20} ~{config['estimate']} records")
+    print()
+    if stream:
+        results = asyncio.run(stream_all(targets, resume, keep_cache))
+    else:
+        results = asyncio.run(pull_all(targets, resume))
+    print()
 
     # Summary
     print(f"{'='*60}")
@@ -227,11 +381,7 @@ def main():
     print(f"{'='*60}")
     for name, count in results.items():
         print(f"  {name:<20} {count:>12,}")
-    total_size = sum(
-        f.stat().st_size
-        for f in CACHE_DIR.rglob('*.json')
-    )
-    print(f"\n  Total disk: {total_size / (1024**2):,.0f} MB")
+    print(f"\n  Total disk: {disk_bytes(CACHE_DIR) / (1024**2):,.0f} MB")
 
 
 if __name__ == '__main__':
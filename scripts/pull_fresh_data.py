@@ -5,62 +5,39 @@ Pull fresh data from NYC Open Data to fill gaps in vayo_clean.db:
 2. ACRIS full coverage — currently only 0.64% of buildings
 3. ACRIS Lis Pendens — missing entirely
 
-Uses curl + Socrata API with pagination.
+Pages come from the shared vayo.socrata client and are processed as they
+arrive rather than collected first; the next pages download meanwhile. A
+failed fetch raises FetchError before anything is committed, so a table is
+never left replaced by a partial pull.
 """
 
-import subprocess
-import json
 import sqlite3
-import time
 import sys
+from itertools import chain
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vayo.socrata import SyncClient
 
 DB = "/Users/pjump/Desktop/projects/vayo/vayo_clean.db"
 BATCH = 50000
 
-def fetch(url, label):
-    """Fetch JSON from URL using curl."""
-    for attempt in range(3):
-        try:
-            result = subprocess.run(
-                ['curl', '-s', '-f', '--max-time', '120', url],
-                capture_output=True, text=True
-            )
-            if result.returncode != 0:
-                print(f"  curl error (attempt {attempt+1}): {result.stderr[:200]}")
-                time.sleep(5)
-                continue
-            data = json.loads(result.stdout)
-            return data
-        except json.JSONDecodeError as e:
-            print(f"  JSON error: {e}")
-            time.sleep(5)
-    return []
-
-def fetch_all(base_url, label, max_records=None):
-    """Paginate through a Socrata endpoint."""
-    all_rows = []
-    offset = 0
-    sep = '&' if '?' in base_url else '?'
-
-    while True:
-        url = f"{base_url}{sep}$limit={BATCH}&$offset={offset}"
-        print(f"  [{label}] offset {offset:,}...", end=' ', flush=True)
-        data = fetch(url, label)
-        print(f"{len(data):,} rows")
-
-        if not data:
-            break
-        all_rows.extend(data)
-        if max_records and len(all_rows) >= max_records:
-            all_rows = all_rows[:max_records]
+def fetch_all(client, url, params, label, max_records=None):
+    """Paginate through a Socrata endpoint, yielding rows as each page
+    arrives, so only one page is in memory at a time."""
+    total = 0
+
+    for offset, data in client.pages(url, params, batch=BATCH, label=label):
+        print(f"  [{label}] offset {offset:,}: {len(data):,} rows", flush=True)
+        if max_records and total + len(data) >= max_records:
+            data = data[:max_records - total]
+            total += len(data)
+            yield from data
             break
-        if len(data) < BATCH:
-            break
-        offset += BATCH
-        time.sleep(1.5)
+        total += len(data)
+        yield from data
 
-    print(f"  [{label}] Total: {len(all_rows):,}")
-    return all_rows
+    print(f"  [{label}] Total: {total:,}")
 
 
 def load_valid_bbls(db):
@@ -97,7 +74,7 @@ def make_bbl(boro, block, lot):
         return None
 
 
-def pull_dob_now(db):
+def pull_dob_now(db, client):
     """Pull DOB NOW permits — the newer system with fresh data."""
     print("\n" + "=" * 70)
     print("  PULLING DOB NOW PERMITS")
@@ -105,23 +82,25 @@ def pull_dob_now(db):
 
     valid_bbls, _ = load_valid_bbls(db)
 
-    # DOB NOW has current_status_date for dates and bbl field directly
-    data = fetch_all(
-        "https://data.cityofnewyork.us/resource/w9ak-ipjd.json?$where=current_status_date>'2022-01-01T00:00:00'",
-        "DOB-NOW"
-    )
-
-    # Also get records without dates (many have null dates)
-    data2 = fetch_all(
-        "https://data.cityofnewyork.us/resource/w9ak-ipjd.json?$where=current_status_date IS NULL",
-        "DOB-NOW-nodate"
+    # DOB NOW has current_status_date for dates and bbl field directly,
+    # followed by the records without dates (many have null dates)
+    data = chain(
+        fetch_all(
+            client, "https://data.cityofnewyork.us/resource/w9ak-ipjd.json",
+            {'$where': "current_status_date>'2022-01-01T00:00:00'", '$order': ':id'},
+            "DOB-NOW"
+        ),
+        fetch_all(
+            client, "https://data.cityofnewyork.us/resource/w9ak-ipjd.json",
+            {'$where': "current_status_date IS NULL", '$order': ':id'},
+            "DOB-NOW-nodate"
+        ),
     )
-    data.extend(data2)
 
-    # Also pull legacy permits (all available)
-    print()
+    # Also pull legacy permits (all available), fetched once DOB NOW is in
     legacy = fetch_all(
-        "https://data.cityofnewyork.us/resource/ic3t-wcy2.json",
+        client, "https://data.cityofnewyork.us/resource/ic3t-wcy2.json",
+        {'$order': ':id'},
         "DOB-Legacy"
     )
 
@@ -209,7 +188,7 @@ def pull_dob_now(db):
     return inserted
 
 
-def pull_acris(db):
+def pull_acris(db, client):
     """Pull ACRIS master + legals + parties for recent transactions."""
     print("\n" + "=" * 70)
     print("  PULLING ACRIS DATA (2022+)")
@@ -224,7 +203,9 @@ def pull_acris(db):
     # Pull master records
     print("\n  --- Master (2022+, key doc types) ---")
     master = fetch_all(
-        f"https://data.cityofnewyork.us/resource/bnx9-e6tj.json?$where=recorded_datetime>'2022-01-01T00:00:00' AND ({type_filter})",
+        client, "https://data.cityofnewyork.us/resource/bnx9-e6tj.json",
+        {'$where': f"recorded_datetime>'2022-01-01T00:00:00' AND ({type_filter})",
+         '$order': ':id'},
         "Master"
     )
 
@@ -238,7 +219,8 @@ def pull_acris(db):
     # Pull legals — use good_through_date to filter to recent
     print("\n  --- Legals (property linkage) ---")
     legals = fetch_all(
-        "https://data.cityofnewyork.us/resource/8h5j-fqxa.json?$where=good_through_date>'2022-01-01T00:00:00'",
+        client, "https://data.cityofnewyork.us/resource/8h5j-fqxa.json",
+        {'$where': "good_through_date>'2022-01-01T00:00:00'", '$order': ':id'},
         "Legals"
     )
 
@@ -275,7 +257,8 @@ def pull_acris(db):
     # Pull parties
     print("\n  --- Parties (buyer/seller) ---")
     parties = fetch_all(
-        "https://data.cityofnewyork.us/resource/636b-3b5g.json?$where=good_through_date>'2022-01-01T00:00:00'",
+        client, "https://data.cityofnewyork.us/resource/636b-3b5g.json",
+        {'$where': "good_through_date>'2022-01-01T00:00:00'", '$order': ':id'},
         "Parties"
     )
 
@@ -336,8 +319,9 @@ def main():
     print("  VAYO DATA REFRESH")
     print("=" * 70)
 
-    dob_count = pull_dob_now(db)
-    acris_count = pull_acris(db)
+    with SyncClient() as client:
+        dob_count = pull_dob_now(db, client)
+        acris_count = pull_acris(db, client)
 
     # Summary
     print("\n" + "=" * 70)
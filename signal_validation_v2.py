@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 """
 Signal Validation v2 - Availability signals predicting DEED transfers
-Optimized: pre-load DEED dates into memory for fast lookups
+Optimized: DEED dates pre-loaded into a sorted per-BBL index (vayo.events),
+so every "DEED within N months?" question is answered in bulk
+(runs against the old raw schema; the canonical-schema, configurable
+version that feeds scoring is `python3 -m vayo.backtest`)
 """
 
 import sqlite3
 import time
 from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import datetime
+
+import numpy as np
+
+from vayo.backtest import wilson
+from vayo.events import load_events, to_days
 
 DB_PATH = "/Users/pjump/Desktop/projects/vayo/vayo_clean.db"
 
@@ -36,7 +44,12 @@ def print_result(label, hits, total, baseline_rate):
         print(f"  {label}: NO DATA")
         return
     rate = hits / total
-    print(f"  {label}: {fmt_pct(hits, total)}  |  lift = {lift(rate, baseline_rate)}")
+    # 95% Wilson interval on the rate, scaled by the (population-sized) baseline
+    ci = ""
+    if baseline_rate:
+        low, high = wilson(hits, total)
+        ci = f" [{low / baseline_rate:.2f}-{high / baseline_rate:.2f}x]"
+    print(f"  {label}: {fmt_pct(hits, total)}  |  lift = {lift(rate, baseline_rate)}{ci}")
 
 def parse_date(s):
     """Parse ISO date string to datetime.date"""
@@ -54,15 +67,18 @@ def parse_date_mdy(s):
     except:
         return None
 
-def has_deed_within(deed_dates_by_bbl, bbl, signal_date, months):
-    """Check if any DEED on this BBL within N months after signal_date"""
-    if bbl not in deed_dates_by_bbl:
-        return False
-    cutoff = signal_date + timedelta(days=months * 30)
-    for dd in deed_dates_by_bbl[bbl]:
-        if signal_date <= dd <= cutoff:
-            return True
-    return False
+def deed_hits(deeds, signal_dates, months):
+    """How many {bbl: signal_date} entries have a DEED within N months
+    (N*30 days) on or after the signal date"""
+    if not signal_dates:
+        return 0
+    bbls = np.fromiter(signal_dates.keys(), dtype=np.int64, count=len(signal_dates))
+    return int(deeds.any_within(bbls, to_days(signal_dates.values()), months * 30).sum())
+
+def deeds_between(deeds, bbls, start, end):
+    """How many of `bbls` have a DEED dated start <= d < end"""
+    bbls = np.fromiter(bbls, dtype=np.int64)
+    return int(deeds.any_between(bbls, start.toordinal(), end.toordinal()).sum())
 
 
 def main():
@@ -77,18 +93,11 @@ def main():
     # ============================================================
     print("\n  Pre-loading DEED transactions into memory...")
     t0 = time.time()
-    deed_dates = defaultdict(list)
-    cursor = conn.execute("""
+    deeds = load_events(conn, """
         SELECT bbl, document_date FROM acris_transactions 
-        WHERE doc_type = 'DEED' AND document_date IS NOT NULL
+        WHERE doc_type = 'DEED' AND bbl IS NOT NULL AND document_date IS NOT NULL
     """)
-    deed_count = 0
-    for bbl, ddate in cursor:
-        d = parse_date(ddate)
-        if d:
-            deed_dates[bbl].append(d)
-            deed_count += 1
-    print(f"  Loaded {deed_count:,} DEED records across {len(deed_dates):,} BBLs in {time.time()-t0:.1f}s")
+    print(f"  Loaded {len(deeds):,} DEED records across {deeds.bbl_count:,} BBLs in {time.time()-t0:.1f}s")
 
     # Pre-load residential BBLs
     print("  Loading residential BBLs...")
@@ -106,9 +115,9 @@ def main():
     d2023_start = datetime(2023, 1, 1).date()
     d2023_mid = datetime(2023, 7, 1).date()
 
-    deed_6m = sum(1 for bbl in res_bbls if any(d2022_start <= d < d2022_mid for d in deed_dates.get(bbl, [])))
-    deed_12m = sum(1 for bbl in res_bbls if any(d2022_start <= d < d2023_start for d in deed_dates.get(bbl, [])))
-    deed_18m = sum(1 for bbl in res_bbls if any(d2022_start <= d < d2023_mid for d in deed_dates.get(bbl, [])))
+    deed_6m = deeds_between(deeds, res_bbls, d2022_start, d2022_mid)
+    deed_12m = deeds_between(deeds, res_bbls, d2022_start, d2023_start)
+    deed_18m = deeds_between(deeds, res_bbls, d2022_start, d2023_mid)
 
     b6 = deed_6m / total_res
     b12 = deed_12m / total_res
@@ -155,13 +164,13 @@ def main():
 
     print(f"\n  --- Overall (all case types) ---")
     for months, label, baseline in [(6, "6mo", b6), (12, "12mo", b12), (18, "18mo", b18)]:
-        hits = sum(1 for bbl, d in bbl_first_case.items() if has_deed_within(deed_dates, bbl, d, months))
+        hits = deed_hits(deeds, bbl_first_case, months)
         print_result(f"DEED within {label}", hits, len(bbl_first_case), baseline)
 
     print(f"\n  --- By case type (12-month window) ---")
     for ct in sorted(casetype_bbls.keys(), key=lambda x: -len(casetype_bbls[x]))[:8]:
         ct_bbls = casetype_bbls[ct]
-        hits = sum(1 for bbl, d in ct_bbls.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, ct_bbls, 12)
         print_result(f"  {ct}", hits, len(ct_bbls), b12)
 
     print(f"  Computed in {time.time()-t0:.1f}s")
@@ -202,19 +211,19 @@ def main():
 
     print(f"\n  --- Overall ---")
     for months, label, baseline in [(6, "6mo", b6), (12, "12mo", b12)]:
-        hits = sum(1 for bbl, d in ecb_bbl_first.items() if has_deed_within(deed_dates, bbl, d, months))
+        hits = deed_hits(deeds, ecb_bbl_first, months)
         print_result(f"DEED within {label}", hits, len(ecb_bbl_first), baseline)
 
     print(f"\n  --- By severity (12-month window) ---")
     for sev in sorted(ecb_by_severity.keys(), key=lambda x: -len(ecb_by_severity[x])):
         bbls = ecb_by_severity[sev]
         if len(bbls) < 50: continue
-        hits = sum(1 for bbl, d in bbls.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls, 12)
         print_result(f"  {sev} ({len(bbls):,} BBLs)", hits, len(bbls), b12)
 
     print(f"\n  --- Unpaid balance vs paid (12mo) ---")
     for label, bbls_dict in [("Unpaid balance", ecb_unpaid_bbls), ("No balance due", ecb_paid_bbls)]:
-        hits = sum(1 for bbl, d in bbls_dict.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls_dict, 12)
         print_result(f"  {label}", hits, len(bbls_dict), b12)
 
     print(f"  Computed in {time.time()-t0:.1f}s")
@@ -248,14 +257,14 @@ def main():
 
     print(f"\n  --- Overall ---")
     for months, label, baseline in [(6, "6mo", b6), (12, "12mo", b12)]:
-        hits = sum(1 for bbl, d in mgmt_bbl_first.items() if has_deed_within(deed_dates, bbl, d, months))
+        hits = deed_hits(deeds, mgmt_bbl_first, months)
         print_result(f"DEED within {label}", hits, len(mgmt_bbl_first), baseline)
 
     print(f"\n  --- By contact_type (12-month window) ---")
     for ct in sorted(mgmt_by_type.keys(), key=lambda x: -len(mgmt_by_type[x]))[:6]:
         bbls = mgmt_by_type[ct]
         if len(bbls) < 50: continue
-        hits = sum(1 for bbl, d in bbls.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls, 12)
         print_result(f"  {ct} ({len(bbls):,} BBLs)", hits, len(bbls), b12)
 
     print(f"  Computed in {time.time()-t0:.1f}s")
@@ -299,7 +308,7 @@ def main():
             if bbl not in res_bbls: continue
             d = parse_date(dstr)
             if d: bbls_dict[bbl] = d
-        hits = sum(1 for bbl, d in bbls_dict.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls_dict, 12)
         print_result(f"  {ctype}", hits, len(bbls_dict), b12)
 
     print(f"\n  --- Non-distress types for comparison (12mo) ---")
@@ -317,7 +326,7 @@ def main():
             if bbl not in res_bbls: continue
             d = parse_date(dstr)
             if d: bbls_dict[bbl] = d
-        hits = sum(1 for bbl, d in bbls_dict.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls_dict, 12)
         print_result(f"  {ctype}", hits, len(bbls_dict), b12)
 
     # High-volume distress
@@ -337,7 +346,7 @@ def main():
             if bbl not in res_bbls: continue
             d = parse_date(dstr)
             if d: bbls_dict[bbl] = d
-        hits = sum(1 for bbl, d in bbls_dict.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls_dict, 12)
         print_result(f"  3+ {ctype}", hits, len(bbls_dict), b12)
 
     # 5+ complaints of any distress type
@@ -356,7 +365,7 @@ def main():
         if bbl not in res_bbls: continue
         d = parse_date(dstr)
         if d: bbls_dict[bbl] = d
-    hits = sum(1 for bbl, d in bbls_dict.items() if has_deed_within(deed_dates, bbl, d, 12))
+    hits = deed_hits(deeds, bbls_dict, 12)
     print_result(f"  5+ any distress complaints", hits, len(bbls_dict), b12)
 
     print(f"  Computed in {time.time()-t0:.1f}s")
@@ -394,7 +403,7 @@ def main():
     print(f"  --- By initial cost bucket (12-month window) ---")
     for label in ["< $10K", "$10K-$50K", "$50K-$200K", "$200K+"]:
         bbls = cost_buckets[label]
-        hits = sum(1 for bbl, d in bbls.items() if has_deed_within(deed_dates, bbl, d, 12))
+        hits = deed_hits(deeds, bbls, 12)
         print_result(f"  {label} ({len(bbls):,} BBLs)", hits, len(bbls), b12)
 
     print(f"  Computed in {time.time()-t0:.1f}s")
@@ -466,7 +475,7 @@ def main():
     print(f"\n  --- DEED rate (any DEED in 2022-2024) by signal count ---")
     for sc in sorted(count_dist.keys()):
         bbls_with_sc = [bbl for bbl, c in signal_count.items() if c == sc]
-        hits = sum(1 for bbl in bbls_with_sc if any(d2022_start <= d < d2025_start for d in deed_dates.get(bbl, [])))
+        hits = deeds_between(deeds, bbls_with_sc, d2022_start, d2025_start)
         print_result(f"  {sc} signals", hits, len(bbls_with_sc), b12)
 
     # Specific 2-signal combos
@@ -484,7 +493,7 @@ def main():
     ]
     for label, combo_bbls in combos:
         if len(combo_bbls) < 20: continue
-        hits = sum(1 for bbl in combo_bbls if any(d2022_start <= d < d2025_start for d in deed_dates.get(bbl, [])))
+        hits = deeds_between(deeds, combo_bbls, d2022_start, d2025_start)
         print_result(f"  {label} ({len(combo_bbls):,} BBLs)", hits, len(combo_bbls), b12)
 
     # Triple combos
@@ -500,7 +509,7 @@ def main():
     ]
     for label, combo_bbls in triples:
         if len(combo_bbls) < 10: continue
-        hits = sum(1 for bbl in combo_bbls if any(d2022_start <= d < d2025_start for d in deed_dates.get(bbl, [])))
+        hits = deeds_between(deeds, combo_bbls, d2022_start, d2025_start)
         print_result(f"  {label} ({len(combo_bbls):,} BBLs)", hits, len(combo_bbls), b12)
 
     # Single signal baselines (same methodology)
@@ -515,7 +524,7 @@ def main():
     for label, sig_set in singles:
         alone = [bbl for bbl in sig_set if signal_count[bbl] == 1]
         if len(alone) < 10: continue
-        hits = sum(1 for bbl in alone if any(d2022_start <= d < d2025_start for d in deed_dates.get(bbl, [])))
+        hits = deeds_between(deeds, alone, d2022_start, d2025_start)
         print_result(f"  {label} ({len(alone):,} BBLs)", hits, len(alone), b12)
 
     print(f"  Computed in {time.time()-t0:.1f}s")
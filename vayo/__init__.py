@@ -0,0 +1,11 @@
+"""
+Shared Vayo library code used by the build/pull scripts and the API.
+
+Scripts under scripts/ put the project root on sys.path and import from
+here; the API imports it directly (uvicorn runs from the project root).
+"""
+
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+MAIN_DB = PROJECT_DIR / "vayo_clean.db"
@@ -0,0 +1,310 @@
+"""
+Address normalization and the typeahead address index.
+
+One normalizer (normalize_addr) is used everywhere addresses are compared:
+PLUTO ↔ StreetEasy slug matching at build time, the search index, and the
+queries typed into the search box. Both sides of every comparison go
+through it, so "25 West 23rd Street" and "25 WEST 23 STREET" meet as
+"25 W 23 ST".
+
+The index is two tables per indexed source, built once at DB-build time:
+
+    <name>           (id INTEGER PRIMARY KEY, addr_norm TEXT, weight INTEGER)
+    <name>_fts       FTS5 trigram index over addr_norm (external content)
+
+`id` is the rowid of the source row (for `buildings` that is the BBL).
+address_index_state records the source table's MAX(rowid) at build time.
+The scrapers keep writing listings after the index is built, and an
+INSERT OR REPLACE moves a row to a new rowid, so once the source has moved
+on has_address_index() reports no index and callers fall back to LIKE
+until `python3 -m vayo.address` rebuilds it.
+Queries of 3+ characters go through the trigram index, so any substring
+matches without a table scan; shorter queries use a prefix range scan on
+addr_norm. Prefix hits rank ahead of mid-string hits, then by weight.
+"""
+
+import re
+import sqlite3
+
+# Full word → abbreviation. Applied per token, so "AVENUE A" → "AVE A".
+SUFFIXES = {
+    'AVENUE': 'AVE', 'STREET': 'ST', 'BOULEVARD': 'BLVD', 'DRIVE': 'DR',
+    'PLACE': 'PL', 'ROAD': 'RD', 'COURT': 'CT', 'LANE': 'LN',
+    'TERRACE': 'TERR', 'PARKWAY': 'PKWY', 'SQUARE': 'SQ', 'CRESCENT': 'CRES',
+}
+DIRECTIONS = {'EAST': 'E', 'WEST': 'W', 'NORTH': 'N', 'SOUTH': 'S'}
+ABBREVIATIONS = {**SUFFIXES, **DIRECTIONS}
+
+_ORDINAL = re.compile(r'^(\d+)(ST|ND|RD|TH)$')
+_PARTIAL_ORDINAL = re.compile(r'^(\d+)(S|N|R|T)$')
+_JUNK = re.compile(r"[.,#']")
+
+CANDIDATES = 2000   # max index hits ranked per query
+
+
+def normalize_addr(addr, partial=False):
+    """Normalize an address for matching: uppercase, abbreviate street types
+    and directions, drop ordinal suffixes ("23RD" → "23").
+
+    With partial=True the last token is treated as still being typed, so a
+    prefix of a full word collapses to its abbreviation ("5 AVEN" → "5 AVE")
+    and can match the normalized index.
+    """
+    if not addr:
+        return ''
+    a = _JUNK.sub('', str(addr).upper().replace('_', '-'))
+    tokens = a.split()
+    out = []
+    for i, tok in enumerate(tokens):
+        if tok in ABBREVIATIONS:
+            out.append(ABBREVIATIONS[tok])
+            continue
+        m = _ORDINAL.match(tok)
+        if m:
+            out.append(m.group(1))
+            continue
+        if partial and i == len(tokens) - 1:
+            m = _PARTIAL_ORDINAL.match(tok)
+            if m:
+                out.append(m.group(1))
+                continue
+            for full, abbr in ABBREVIATIONS.items():
+                if len(tok) > len(abbr) and full.startswith(tok):
+                    tok = abbr
+                    break
+        out.append(tok)
+    return ' '.join(out)
+
+
+# ── Build ────────────────────────────────────────────────────────────────
+
+def _max_rowid(db, source):
+    return db.execute(f"SELECT MAX(rowid) FROM [{source}]").fetchone()[0]
+
+
+def build_address_index(db, name, source, source_sql, batch_size=50000):
+    """(Re)build the address index `name` from `source_sql`.
+
+    source_sql must select (id, address, weight) from table `source` — id
+    being the rowid the caller will look rows up by. Returns the number of
+    indexed rows.
+    """
+    db.execute(f"DROP TABLE IF EXISTS [{name}_fts]")
+    db.execute(f"DROP TABLE IF EXISTS [{name}]")
+    db.execute(f"""
+        CREATE TABLE [{name}] (
+            id INTEGER PRIMARY KEY,
+            addr_norm TEXT NOT NULL,
+            weight INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    count = 0
+    batch = []
+    for rid, addr, weight in db.execute(source_sql).fetchall():
+        norm = normalize_addr(addr)
+        if not norm:
+            continue
+        batch.append((rid, norm, weight or 0))
+        if len(batch) >= batch_size:
+            db.executemany(f"INSERT OR REPLACE INTO [{name}] VALUES (?,?,?)", batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.executemany(f"INSERT OR REPLACE INTO [{name}] VALUES (?,?,?)", batch)
+        count += len(batch)
+
+    db.execute(f"CREATE INDEX [idx_{name}_norm] ON [{name}](addr_norm)")
+    db.execute(f"""
+        CREATE VIRTUAL TABLE [{name}_fts] USING fts5(
+            addr_norm, content='{name}', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    db.execute(f"INSERT INTO [{name}_fts]([{name}_fts]) VALUES('rebuild')")
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS address_index_state (
+            name TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            max_rowid INTEGER
+        )
+    """)
+    db.execute("INSERT OR REPLACE INTO address_index_state VALUES (?,?,?)",
+               [name, source, _max_rowid(db, source)])
+    db.commit()
+    return count
+
+
+# ── Query ────────────────────────────────────────────────────────────────
+
+def has_address_index(db, name):
+    """True if index `name` exists and its source table hasn't changed
+    since it was built."""
+    try:
+        state = db.execute(
+            "SELECT source, max_rowid FROM address_index_state WHERE name = ?", [name]
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return False        # built before address_index_state existed
+    if state is None:
+        return False
+    source, max_rowid = state
+    try:
+        return _max_rowid(db, source) == max_rowid
+    except sqlite3.OperationalError:
+        return False
+
+
+def _candidates(db, name, q, weight_clause, weight_params):
+    if len(q) >= 3:
+        phrase = '"' + q.replace('"', '""') + '"'
+        return db.execute(
+            f"""SELECT a.id, a.addr_norm, a.weight
+                FROM [{name}_fts] f JOIN [{name}] a ON a.id = f.rowid
+                WHERE f.addr_norm MATCH ?{weight_clause}
+                LIMIT ?""",
+            [phrase, *weight_params, CANDIDATES],
+        ).fetchall()
+    # Too short for trigrams: walk the addr_norm index from the prefix.
+    return db.execute(
+        f"""SELECT a.id, a.addr_norm, a.weight FROM [{name}] a
+            WHERE a.addr_norm >= ? AND a.addr_norm < ?{weight_clause}
+            LIMIT ?""",
+        [q, q + '\U0010ffff', *weight_params, CANDIDATES],
+    ).fetchall()
+
+
+def _tier(addr, q):
+    if addr == q:
+        return 0
+    if addr.startswith(q):
+        return 1
+    if f' {q}' in f' {addr}':
+        return 2            # matches at a word boundary
+    return 3
+
+
+def search_address_index(db, name, query, limit=20, min_weight=None):
+    """Return ids from index `name` matching `query`, best first.
+
+    A half-typed last word is searched both as typed and collapsed to the
+    abbreviation it could be the start of: "100 NOR" must still find
+    "100 NORFOLK ST" as well as "100 N ...".
+    """
+    # As typed first: on a tie, the literal reading of the prefix wins.
+    variants = list(dict.fromkeys(
+        v for v in (normalize_addr(query), normalize_addr(query, partial=True)) if v))
+    if not variants:
+        return []
+
+    weight_clause = "" if min_weight is None else " AND a.weight >= ?"
+    weight_params = [] if min_weight is None else [min_weight]
+
+    rows = {}
+    for q in variants:
+        for row in _candidates(db, name, q, weight_clause, weight_params):
+            rows[row[0]] = row
+
+    def rank(row):
+        addr = row[1]
+        return (min((_tier(addr, q), i) for i, q in enumerate(variants)),
+                -row[2], len(addr))
+
+    return [r[0] for r in sorted(rows.values(), key=rank)[:limit]]
+
+
+def fetch_ranked(db, sql, ids):
+    """Run `sql` (which must contain `{ids}` and select `_rid`) for the
+    given ids and return rows in the order of `ids`."""
+    if not ids:
+        return []
+    placeholders = ','.join('?' * len(ids))
+    rows = db.execute(sql.format(ids=placeholders), ids).fetchall()
+    order = {rid: i for i, rid in enumerate(ids)}
+    return sorted(rows, key=lambda r: order[r['_rid']])
+
+
+# Typed query → address it must rank first, against CHECK_ADDRESSES.
+CHECK_ADDRESSES = [
+    '100 NORFOLK STREET', '100 NORTH 5TH STREET', '100 WESTCHESTER AVENUE',
+    '100 WEST 23RD STREET', '100 COURTLANDT AVENUE', '25 COURT STREET',
+    '5 AVENUE A', '123 RIVERSIDE DRIVE',
+]
+CHECK_QUERIES = {
+    '100 NOR': '100 NORFOLK ST',
+    '100 NORT': '100 N 5 ST',
+    '100 WES': '100 WESTCHESTER AVE',
+    '100 W 23': '100 W 23 ST',
+    '100 COU': '100 COURTLANDT AVE',
+    '25 COU': '25 CT ST',
+    '5 AVEN': '5 AVE A',
+    '123 riverside dr': '123 RIVERSIDE DR',
+    '12': '123 RIVERSIDE DR',
+}
+
+
+def check():
+    """Run CHECK_QUERIES against a scratch index; returns the failures."""
+    db = sqlite3.connect(':memory:')
+    db.execute("CREATE TABLE src (address TEXT)")
+    db.executemany("INSERT INTO src VALUES (?)", [(a,) for a in CHECK_ADDRESSES])
+    build_address_index(db, 'check_addr', 'src', "SELECT rowid, address, 0 FROM src")
+    norm = dict(db.execute("SELECT id, addr_norm FROM check_addr"))
+    failures = []
+    for query, want in CHECK_QUERIES.items():
+        ids = search_address_index(db, 'check_addr', query)
+        got = norm[ids[0]] if ids else None
+        if got != want:
+            failures.append((query, want, got))
+    return failures
+
+
+def main():
+    """Rebuild address indexes on existing databases, or check the search:
+
+        python3 -m vayo.address [main|elliman|se ...]
+        python3 -m vayo.address check
+    """
+    import sys
+    from . import PROJECT_DIR
+
+    if sys.argv[1:] == ['check']:
+        failures = check()
+        for query, want, got in failures:
+            print(f"  {query!r}: expected {want!r} first, got {got!r}")
+        print(f"  {len(CHECK_QUERIES) - len(failures)}/{len(CHECK_QUERIES)} queries ok")
+        sys.exit(1 if failures else 0)
+
+    targets = sys.argv[1:] or list(INDEXES)
+    for target in targets:
+        path, name, source, sql = INDEXES[target]
+        path = PROJECT_DIR / path
+        if not path.exists():
+            print(f"  {target}: {path.name} not found, skipping")
+            continue
+        db = sqlite3.connect(str(path))
+        n = build_address_index(db, name, source, sql)
+        db.close()
+        print(f"  {target}: {n:,} addresses indexed into {name}")
+
+
+# Address indexes per database: (db file, index name, source table, source query)
+INDEXES = {
+    'main': (
+        'vayo_clean.db', 'building_addr', 'buildings',
+        "SELECT bbl, address, units_residential FROM buildings "
+        "WHERE units_residential > 0",
+    ),
+    'elliman': (
+        'elliman_mls.db', 'listing_addr', 'listings',
+        "SELECT rowid, address, 0 FROM listings",
+    ),
+    'se': (
+        'se_listings.db', 'se_building_addr', 'buildings',
+        "SELECT rowid, address, COALESCE(total_units, 0) FROM buildings "
+        "WHERE status = 'ok'",
+    ),
+}
+
+
+if __name__ == '__main__':
+    main()
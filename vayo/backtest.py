@@ -0,0 +1,564 @@
+"""
+Declarative signal backtests: how much more often does a DEED follow a
+signal than it follows an arbitrary residential building?
+
+A signal is a row in SIGNALS: which table, which BBL and date columns, an
+optional SQL filter, an optional grouping column (one extra result per
+group value, e.g. per litigation case type) and an optional min_count (the
+signal fires on a building's Nth event in the period rather than its
+first). Events that aren't rows of the table (an owner change is a
+registration whose owner name the building hasn't had before) come from an
+optional `from` subquery over it instead; the table still keys the cache.
+For every signal × period × window the backtest takes each residential
+BBL's signal date in the period, checks for a DEED within `window` months
+after it (vayo.events), and divides that hit rate by the share of all
+residential BBLs with a DEED in the same span from the start of the
+period.
+
+Each row also carries a 95% Wilson interval on its hit rate and a bootstrap
+interval on its lift. Resampling a 0/1 array and taking its mean is a
+binomial draw, so the bootstrap is one rng.binomial call over a
+(rows × resamples) matrix for the signal side and one for the baseline side,
+for every row of the table at once.
+
+Parsed events are cached under vayo_events/ as one .npz per signal, keyed
+by the signal definition and the table's fingerprint (MAX(rowid) plus its
+schema), so reruns skip the queries and the date parsing. Signals are
+backtested in parallel worker processes. The result is written to
+signal_lifts.json, which vayo.scoring uses for its lift weights.
+
+Rolling-origin mode slides a SPAN_MONTHS signal window forward one month
+at a time over the whole DEED history and recomputes every lift at each
+origin, to show whether a lift is stable or drifting. It doesn't re-run the
+fixed-period backtest per origin. Each event is the k-th event of its BBL
+(k = min_count) for one contiguous run of origins. Its DEED outcome is
+looked up once, and +1 is added at the start of that run of origins and
+−1 after its end. A cumulative sum then gives every origin's counts, so the
+whole history costs about one pass over the events (the same for the
+baseline DEEDs). Written to signal_lifts_rolling.json.
+
+    python3 -m vayo.backtest
+    python3 -m vayo.backtest --periods 2021-01-01:2023-01-01,2022-01-01:2024-01-01 --windows 6,12
+    python3 -m vayo.backtest --rolling [--span 12] [--windows 12]
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+from . import PROJECT_DIR, MAIN_DB
+from .events import EPOCH_ORDINAL, EventIndex, iso_days
+from .sr_types import CATEGORIES
+
+CACHE_DIR = PROJECT_DIR / "vayo_events"
+LIFT_TABLE = PROJECT_DIR / "signal_lifts.json"
+ROLLING_TABLE = PROJECT_DIR / "signal_lifts_rolling.json"
+
+DAYS_PER_MONTH = 30
+CONFIDENCE = 0.95
+RESAMPLES = 4000
+PERIODS = [('2022-01-01', '2024-01-01')]
+WINDOWS = [6, 12, 18]
+OUTCOME = 'deed'
+SPAN_MONTHS = 12    # rolling mode: signal window length
+
+SIGNAL_DEFAULTS = {'bbl': 'bbl', 'where': None, 'group': None, 'min_count': 1,
+                   'from': None}
+
+# The first registration of each distinct HPD owner name per building,
+# except the building's first owner: the date the owner changed.
+OWNER_CHANGES = """
+    SELECT bbl, registered_date FROM (
+        SELECT bbl, MIN(registered_date) AS registered_date,
+               ROW_NUMBER() OVER (PARTITION BY bbl ORDER BY MIN(registered_date)) AS nth
+        FROM contacts
+        WHERE role = 'owner' AND company IS NOT NULL AND trim(company) <> ''
+          AND registered_date IS NOT NULL
+        GROUP BY bbl, upper(trim(company))
+    ) WHERE nth > 1
+"""
+
+# name → table / bbl / date / where / group / min_count / from (see module docstring)
+SIGNALS = {
+    'deed': {'table': 'sales', 'date': 'document_date', 'where': "doc_type = 'DEED'"},
+    'permit': {'table': 'permits', 'date': 'action_date'},
+    'permit_200k': {'table': 'permits', 'date': 'action_date',
+                    'where': "estimated_cost >= 200000"},
+    'permit_50k': {'table': 'permits', 'date': 'action_date',
+                   'where': "estimated_cost >= 50000 AND estimated_cost < 200000"},
+    'permit_under_10k': {'table': 'permits', 'date': 'action_date',
+                         'where': "estimated_cost > 0 AND estimated_cost < 10000"},
+    'permit_alteration': {'table': 'permits', 'date': 'action_date',
+                          'where': "instr(upper(COALESCE(job_type, '')), 'A') > 0"},
+    'litigation': {'table': 'litigation', 'date': 'opened_date', 'group': 'case_type'},
+    'litigation_tenant_action': {'table': 'litigation', 'date': 'opened_date',
+                                 'where': "case_type = 'TENANT ACTION'"},
+    'litigation_typed': {'table': 'litigation', 'date': 'opened_date',
+                         'where': "case_type IS NOT NULL AND case_type <> ''"},
+    'distress_311': {'table': 'service_requests', 'date': 'created_date',
+                     'where': CATEGORIES['distress'], 'min_count': 3},
+    'distress_311_heavy': {'table': 'service_requests', 'date': 'created_date',
+                           'where': CATEGORIES['distress'], 'min_count': 5},
+    'eviction': {'table': 'evictions', 'date': 'executed_date'},
+    'ecb_unpaid': {'table': 'violations', 'date': 'issue_date', 'where': "balance_due > 0"},
+    'acris_agreement': {'table': 'sales', 'date': 'recorded_date', 'where': "doc_type = 'AGMT'"},
+    'mortgage_satisfaction': {'table': 'sales', 'date': 'recorded_date', 'where': "doc_type = 'SAT'"},
+    'owner_registration': {'table': 'contacts', 'date': 'registered_date', 'where': "role = 'owner'"},
+    'owner_change': {'table': 'contacts', 'date': 'registered_date', 'from': OWNER_CHANGES},
+}
+
+
+def signal_spec(name):
+    return {**SIGNAL_DEFAULTS, **SIGNALS[name]}
+
+
+def day_number(iso):
+    return date.fromisoformat(iso).toordinal()
+
+
+# ── Intervals ────────────────────────────────────────────────────────────
+
+Z = {0.90: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+def wilson(hits, n, confidence=CONFIDENCE):
+    """Wilson score interval for hits / n; arrays (or scalars) in, (low,
+    high) arrays out. n = 0 gives (0, 1)."""
+    hits = np.asarray(hits, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    z = Z[confidence]
+    safe = np.maximum(n, 1)
+    p = hits / safe
+    denom = 1 + z * z / safe
+    center = (p + z * z / (2 * safe)) / denom
+    half = z * np.sqrt(p * (1 - p) / safe + z * z / (4 * safe * safe)) / denom
+    empty = n == 0
+    return np.where(empty, 0.0, center - half), np.where(empty, 1.0, center + half)
+
+
+def bootstrap_lift(hits, n, base_hits, base_n, resamples=RESAMPLES,
+                   confidence=CONFIDENCE, seed=0):
+    """Percentile bootstrap interval for (hits/n) / (base_hits/base_n), one
+    per element of the input arrays. Resamples whose baseline comes out 0
+    are dropped; rows with no signal BBLs or nothing left get NaN."""
+    hits, n = np.asarray(hits, dtype=np.int64), np.asarray(n, dtype=np.int64)
+    base_hits = np.asarray(base_hits, dtype=np.int64)
+    base_n = np.asarray(base_n, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    shape = (len(hits), resamples)
+
+    def draw(k, m):
+        p = np.divide(k, m, out=np.zeros(len(k)), where=m > 0)
+        return rng.binomial(m[:, None], p[:, None], size=shape) / np.maximum(m, 1)[:, None]
+
+    rate, base = draw(hits, n), draw(base_hits, base_n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lifts = np.where(base > 0, rate / base, np.nan)
+    tail = 100 * (1 - confidence) / 2
+    low = np.full(len(hits), np.nan)
+    high = np.full(len(hits), np.nan)
+    ok = (n > 0) & ~np.isnan(lifts).all(axis=1)
+    if ok.any():
+        low[ok], high[ok] = np.nanpercentile(lifts[ok], [tail, 100 - tail], axis=1)
+    return low, high
+
+
+def add_intervals(rows, resamples=RESAMPLES, seed=0):
+    """Set rate_low / rate_high (Wilson) and lift_low / lift_high
+    (bootstrap) on every lift-table row, in one vectorized pass."""
+    if not rows:
+        return rows
+    col = lambda k: np.array([r[k] for r in rows], dtype=np.int64)
+    hits, n = col('hits'), col('bbls')
+    rate_low, rate_high = wilson(hits, n)
+    lift_low, lift_high = bootstrap_lift(hits, n, col('baseline_hits'), col('baseline_bbls'),
+                                         resamples, seed=seed)
+    for i, r in enumerate(rows):
+        r['rate_low'], r['rate_high'] = float(rate_low[i]), float(rate_high[i])
+        r['lift_low'] = None if np.isnan(lift_low[i]) else float(lift_low[i])
+        r['lift_high'] = None if np.isnan(lift_high[i]) else float(lift_high[i])
+    return rows
+
+
+# ── Events ───────────────────────────────────────────────────────────────
+
+class SignalEvents:
+    """Every event of one signal: parallel bbl / day / group-code arrays
+    (group -1 = no value), sorted by (bbl, day)."""
+
+    def __init__(self, bbl, day, group, groups):
+        self.bbl = bbl
+        self.day = day
+        self.group = group
+        self.groups = groups
+
+    def __len__(self):
+        return len(self.bbl)
+
+    def first_in(self, start, end, min_count=1, group=None):
+        """(bbls, days): for each BBL with at least `min_count` events dated
+        start <= day < end, the day of its min_count-th one."""
+        mask = (self.day >= start) & (self.day < end)
+        if group is not None:
+            mask &= self.group == self.groups.index(group)
+        bbl, day = self.bbl[mask], self.day[mask]
+        # Already sorted by (bbl, day), so the first row per BBL is its earliest.
+        uniq, starts, counts = np.unique(bbl, return_index=True, return_counts=True)
+        keep = counts >= min_count
+        return uniq[keep], day[starts[keep] + min_count - 1]
+
+    def index(self):
+        return EventIndex.from_pairs(self.bbl, self.day)
+
+
+def table_fingerprint(db, table):
+    top = db.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0]
+    schema = db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", [table]
+    ).fetchone()
+    return f"{top}:{hashlib.sha1((schema[0] if schema else '').encode()).hexdigest()[:12]}"
+
+
+def load_signal(db, name, cache_dir=CACHE_DIR):
+    """SignalEvents for `name`, from the on-disk cache when the table hasn't
+    changed since it was written."""
+    spec = signal_spec(name)
+    key = json.dumps([spec, table_fingerprint(db, spec['table'])], sort_keys=True)
+    path = Path(cache_dir) / f"{name}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.npz"
+    if path.exists():
+        z = np.load(path)
+        return SignalEvents(z['bbl'], z['day'], z['group'], json.loads(str(z['groups'])))
+
+    group_col = spec['group'] or 'NULL'
+    where = f" AND ({spec['where']})" if spec['where'] else ""
+    source = f"({spec['from']})" if spec['from'] else spec['table']
+    rows = db.execute(f"""
+        SELECT {spec['bbl']}, {spec['date']}, {group_col} FROM {source}
+        WHERE {spec['bbl']} IS NOT NULL AND {spec['date']} IS NOT NULL{where}
+    """).fetchall()
+    bbl = np.array([r[0] for r in rows], dtype=np.int64)
+    day = iso_days(r[1] for r in rows)
+    groups = sorted({r[2] for r in rows if r[2] not in (None, '')})
+    code = {g: i for i, g in enumerate(groups)}
+    group = np.array([code.get(r[2], -1) for r in rows], dtype=np.int32)
+
+    keep = day >= 0
+    bbl, day, group = bbl[keep], day[keep], group[keep]
+    order = np.lexsort((day, bbl))
+    events = SignalEvents(bbl[order], day[order], group[order], groups)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for old in path.parent.glob(f"{name}-*.npz"):
+        old.unlink()
+    tmp = path.with_name(path.stem + '.tmp.npz')
+    np.savez(tmp, bbl=events.bbl, day=events.day, group=events.group,
+             groups=np.array(json.dumps(groups)))
+    os.replace(tmp, path)
+    return events
+
+
+def residential_bbls(db):
+    return np.unique(np.array([r[0] for r in db.execute(
+        "SELECT bbl FROM buildings WHERE units_residential > 0")], dtype=np.int64))
+
+
+# ── Backtest ─────────────────────────────────────────────────────────────
+
+def _backtest_signal(path, name, periods, windows, res, cache_dir):
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        deeds = load_signal(db, OUTCOME, cache_dir).index()
+        events = load_signal(db, name, cache_dir)
+    finally:
+        db.close()
+
+    spec = signal_spec(name)
+    out = []
+    for p0, p1 in periods:
+        start, end = day_number(p0), day_number(p1)
+        baseline = {months: deeds.any_within(res, np.full(len(res), start), months * DAYS_PER_MONTH)
+                    for months in windows}
+        for group in [None] + (events.groups if spec['group'] else []):
+            bbls, days = events.first_in(start, end, spec['min_count'], group)
+            keep = np.isin(bbls, res)
+            bbls, days = bbls[keep], days[keep]
+            for months in windows:
+                hits = deeds.any_within(bbls, days, months * DAYS_PER_MONTH)
+                rate = hits.mean() if len(hits) else 0.0
+                base_hits = int(baseline[months].sum())
+                base_rate = base_hits / len(res) if len(res) else 0.0
+                out.append({
+                    'signal': name,
+                    'group': group,
+                    'period': [p0, p1],
+                    'window_months': months,
+                    'bbls': int(len(bbls)),
+                    'hits': int(hits.sum()),
+                    'rate': float(rate),
+                    'baseline': float(base_rate),
+                    'baseline_hits': base_hits,
+                    'baseline_bbls': int(len(res)),
+                    'lift': float(rate / base_rate) if base_rate else None,
+                })
+    return out
+
+
+def run_backtest(path=MAIN_DB, signals=None, periods=PERIODS, windows=WINDOWS,
+                 workers=None, cache_dir=CACHE_DIR, log=print):
+    """Backtest `signals` (default: all but the outcome) in a process pool.
+    Returns the lift table as a dict."""
+    signals = signals or [s for s in SIGNALS if s != OUTCOME]
+    t0 = time.time()
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    res = residential_bbls(db)
+    deeds = load_signal(db, OUTCOME, cache_dir)    # warm the shared cache once
+    db.close()
+    log(f"  {len(res):,} residential BBLs, {len(deeds):,} deeds ({time.time() - t0:.1f}s)")
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=ctx) as pool:
+        futures = {name: pool.submit(_backtest_signal, str(path), name, periods, windows,
+                                     res, cache_dir)
+                   for name in signals}
+        for name, fut in futures.items():
+            rows.extend(fut.result())
+            log(f"  {name:<28} {time.time() - t0:6.1f}s")
+
+    t1 = time.time()
+    add_intervals(rows)
+    log(f"  intervals: {len(rows):,} rows × {RESAMPLES:,} resamples ({time.time() - t1:.1f}s)")
+
+    return {
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'outcome': OUTCOME,
+        'days_per_month': DAYS_PER_MONTH,
+        'periods': [list(p) for p in periods],
+        'windows': list(windows),
+        'confidence': CONFIDENCE,
+        'resamples': RESAMPLES,
+        'rows': rows,
+    }
+
+
+def save_lift_table(table, path=LIFT_TABLE):
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(table, f, indent=1)
+    os.replace(tmp, path)
+
+
+def load_lift_table(path=LIFT_TABLE):
+    """The saved lift table, or None if there isn't one."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def lift_lookup(table, window=12, period=None, min_bbls=0):
+    """{signal: lift} for ungrouped rows of one window and period (default:
+    the period that ends last), skipping signals seen on fewer than
+    `min_bbls` buildings."""
+    rows = [r for r in table['rows'] if r['group'] is None and r['window_months'] == window
+            and r['bbls'] >= min_bbls]
+    if period is None and rows:
+        period = max((r['period'] for r in rows), key=lambda p: (p[1], p[0]))
+    return {r['signal']: r['lift'] for r in rows
+            if list(r['period']) == list(period) and r['lift'] is not None}
+
+
+# ── Rolling origin ───────────────────────────────────────────────────────
+
+def month_starts(first, last):
+    """Day numbers of the 1st of each month, from first's month through last's."""
+    month = lambda d: np.datetime64(date.fromordinal(int(d)), 'M')
+    months = np.arange(month(first), month(last) + 1)
+    return months.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+
+def origin_counts(origins, lo, hi, weights=None):
+    """Per origin, the (weighted) number of [lo, hi] day ranges holding it:
+    +w where each range's run of origins starts, −w past its end, cumsum."""
+    a = np.searchsorted(origins, lo, 'left')
+    b = np.searchsorted(origins, hi, 'right')
+    keep = b > a
+    w = np.ones(len(a)) if weights is None else np.asarray(weights, dtype=np.float64)
+    n = len(origins) + 1
+    diff = (np.bincount(a[keep], w[keep], minlength=n)
+            - np.bincount(b[keep], w[keep], minlength=n))
+    return np.rint(np.cumsum(diff[:-1])).astype(np.int64)
+
+
+def kth_event_origins(bbl, day, k, span):
+    """For each event, the [lo, hi] window starts s for which it is its
+    BBL's k-th event in [s, s + span). Events sorted by (bbl, day); events
+    that never are get lo > hi."""
+    i = np.arange(len(day))
+    _, starts, counts = np.unique(bbl, return_index=True, return_counts=True)
+    pos = i - np.repeat(starts, counts)
+    day = day.astype(np.int64)
+    first = day[np.maximum(i - (k - 1), 0)]                      # 1st of the k in the window
+    before = np.where(pos >= k, day[np.maximum(i - k, 0)], np.iinfo(np.int32).min)
+    lo = np.maximum(before + 1, day - span + 1)
+    hi = np.where(pos >= k - 1, first, lo - 1)
+    return lo, hi
+
+
+def baseline_counts(deeds, res, origins, days):
+    """Per origin o, how many of `res` have a DEED in [o, o + days]."""
+    keep = np.isin(deeds.bbl, res)
+    bbl, day = deeds.bbl[keep], deeds.day[keep].astype(np.int64)
+    # A DEED on day d covers origins [d - days, d]; count only the part the
+    # same BBL's previous DEED doesn't already cover.
+    prev = np.r_[np.iinfo(np.int32).min, day[:-1]]
+    prev[np.r_[True, bbl[1:] != bbl[:-1]]] = np.iinfo(np.int32).min
+    return origin_counts(origins, np.maximum(day - days, prev + 1), day)
+
+
+def _rolling_signal(path, name, origins, windows, span, res, cache_dir):
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        deeds = load_signal(db, OUTCOME, cache_dir).index()
+        events = load_signal(db, name, cache_dir)
+    finally:
+        db.close()
+
+    keep = np.isin(events.bbl, res)
+    bbl, day = events.bbl[keep], events.day[keep]
+    lo, hi = kth_event_origins(bbl, day, signal_spec(name)['min_count'], span)
+    fires = lo <= hi
+    bbl, day, lo, hi = bbl[fires], day[fires], lo[fires], hi[fires]
+
+    n = origin_counts(origins, lo, hi)
+    out = []
+    for months in windows:
+        hit = deeds.any_within(bbl, day, months * DAYS_PER_MONTH)
+        out.append({'signal': name, 'window_months': months, 'bbls': n.tolist(),
+                    'hits': origin_counts(origins, lo, hi, hit).tolist()})
+    return out
+
+
+def run_rolling(path=MAIN_DB, signals=None, windows=(12,), span_months=SPAN_MONTHS,
+                workers=None, cache_dir=CACHE_DIR, log=print):
+    """Rolling-origin backtest: every month start from the first DEED up to
+    the last origin whose signal window and outcome window both end before
+    the last DEED. Returns the table as a dict of per-origin series."""
+    signals = signals or [s for s in SIGNALS if s != OUTCOME]
+    windows = list(windows)
+    span = span_months * DAYS_PER_MONTH
+    t0 = time.time()
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    res = residential_bbls(db)
+    deeds = load_signal(db, OUTCOME, cache_dir)
+    db.close()
+    if not len(deeds):
+        raise ValueError("no DEEDs to backtest against")
+    last = int(deeds.day.max()) - span - max(windows) * DAYS_PER_MONTH
+    origins = month_starts(deeds.day.min(), last)
+    origins = origins[origins <= last]
+    base = {months: baseline_counts(deeds, res, origins, months * DAYS_PER_MONTH)
+            for months in windows}
+    log(f"  {len(origins)} origins, {len(res):,} residential BBLs, "
+        f"{len(deeds):,} deeds ({time.time() - t0:.1f}s)")
+
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    series = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=ctx) as pool:
+        futures = {name: pool.submit(_rolling_signal, str(path), name, origins, windows,
+                                     span, res, cache_dir)
+                   for name in signals}
+        for name, fut in futures.items():
+            series.extend(fut.result())
+            log(f"  {name:<28} {time.time() - t0:6.1f}s")
+
+    for s in series:
+        b = base[s['window_months']]
+        s['lift'] = [h / k / (bh / len(res)) if k and bh else None
+                     for h, k, bh in zip(s['hits'], s['bbls'], b.tolist())]
+    return {
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'outcome': OUTCOME,
+        'days_per_month': DAYS_PER_MONTH,
+        'span_months': span_months,
+        'origins': [date.fromordinal(int(o)).isoformat() for o in origins],
+        'residential_bbls': int(len(res)),
+        'baseline': {str(m): b.tolist() for m, b in base.items()},
+        'series': series,
+    }
+
+
+def lift_drift(series, origins, min_bbls=0):
+    """Summary of one rolling series: origins used, mean and std of the
+    lift, and its least-squares trend in lift per year (None if < 2 points)."""
+    pts = [(date.fromisoformat(o).toordinal(), lift)
+           for o, lift, n in zip(origins, series['lift'], series['bbls'])
+           if lift is not None and n >= min_bbls]
+    if not pts:
+        return {'origins': 0, 'mean': None, 'std': None, 'per_year': None}
+    x, y = np.array(pts, dtype=np.float64).T
+    slope = np.polyfit(x / 365.25, y, 1)[0] if len(pts) > 1 else None
+    return {'origins': len(pts), 'mean': float(y.mean()), 'std': float(y.std()),
+            'per_year': None if slope is None else float(slope)}
+
+
+def main():
+    import sys
+
+    args = sys.argv[1:]
+    periods, windows, workers = PERIODS, WINDOWS, None
+    rolling, span = '--rolling' in args, SPAN_MONTHS
+    for flag, value in zip(args, args[1:]):
+        if flag == '--periods':
+            periods = [tuple(p.split(':')) for p in value.split(',')]
+        elif flag == '--windows':
+            windows = [int(w) for w in value.split(',')]
+        elif flag == '--workers':
+            workers = int(value)
+        elif flag == '--span':
+            span = int(value)
+
+    if rolling:
+        windows = windows if '--windows' in args else [12]
+        table = run_rolling(windows=windows, span_months=span, workers=workers)
+        save_lift_table(table, ROLLING_TABLE)
+        print(f"\n  {'signal':<28} {'win':>4} {'origins':>8} {'mean':>7} {'std':>6} {'per yr':>7}")
+        for s in table['series']:
+            d = lift_drift(s, table['origins'])
+            if d['mean'] is None:
+                print(f"  {s['signal']:<28} {s['window_months']:>4} {0:>8}")
+                continue
+            trend = f"{d['per_year']:+.2f}" if d['per_year'] is not None else ''
+            print(f"  {s['signal']:<28} {s['window_months']:>4} {d['origins']:>8} "
+                  f"{d['mean']:>6.2f}x {d['std']:>6.2f} {trend:>7}")
+        print(f"\n  Saved to {ROLLING_TABLE}")
+        return
+
+    table = run_backtest(periods=periods, windows=windows, workers=workers)
+    save_lift_table(table)
+    print(f"\n  {'signal':<36} {'period':<23} {'win':>4} {'BBLs':>8} {'rate':>7} {'lift':>7}"
+          f"  {int(100 * CONFIDENCE)}% CI")
+    for r in table['rows']:
+        name = r['signal'] + (f" [{r['group']}]" if r['group'] else '')
+        lift = f"{r['lift']:.2f}x" if r['lift'] is not None else 'N/A'
+        ci = (f"{r['lift_low']:.2f}–{r['lift_high']:.2f}x" if r['lift_low'] is not None
+              else '')
+        print(f"  {name[:36]:<36} {r['period'][0]}..{r['period'][1]} {r['window_months']:>4} "
+              f"{r['bbls']:>8,} {100 * r['rate']:>6.1f}% {lift:>7}  {ci}")
+    print(f"\n  Saved to {LIFT_TABLE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""
+On-disk format for the pullers' batch caches (data_cache/<name>/,
+acris_cache/full/<endpoint>/ and its partition directories).
+
+    cache = BatchCache(dir, key='document_id')
+    cache.write(batch_num, records)     # one API page → one segment
+    cache.last()                        # (batch_num, rows) of the last segment
+    cache.rows()                        # total, from the manifest
+    for rec in cache: ...               # streams every record, in batch order
+
+Each page is one segment, batch_00042.ndjson.gz: gzip-compressed NDJSON
+with one record per line, read back a line at a time rather than parsed as
+a whole. manifest.json in the same directory records, for each segment,
+its row count, byte size, sha256, and the min/max value of the cache's key
+field. Resume and status checks then read the manifest instead of
+re-parsing every batch, and verify() can tell a truncated segment from a
+good one. Segments and the manifest are written to a temp file and
+renamed into place, so a killed pull leaves at worst a segment the
+manifest doesn't list yet. That segment is counted by reading it.
+
+Caches written before this format (batch_00042.json, one JSON array per
+file) are still read, in the same batch order. Migrate them with:
+
+    python3 -m vayo.batchcache convert data_cache acris_cache/full
+    python3 -m vayo.batchcache status data_cache
+    python3 -m vayo.batchcache verify acris_cache/full
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+SUFFIX = '.ndjson.gz'
+LEGACY_SUFFIX = '.json'
+MANIFEST = 'manifest.json'
+COMPRESSLEVEL = 6
+
+# Threads of one puller write segments of the same cache concurrently
+# (pull_acris_parallel); manifest updates are read-modify-write.
+_manifest_lock = threading.Lock()
+
+
+def segment_name(batch_num):
+    return f"batch_{batch_num:05d}{SUFFIX}"
+
+
+def batch_number(path):
+    """batch_00042.ndjson.gz / batch_00042.json → 42."""
+    return int(Path(path).name.split('.')[0].split('_')[1])
+
+
+def _replace(path, data):
+    tmp = path.with_name(path.name + '.part')
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _stats(records, key):
+    entry = {'rows': len(records)}
+    if key:
+        keys = [str(r[key]) for r in records if r.get(key) is not None]
+        entry['min_key'] = min(keys) if keys else None
+        entry['max_key'] = max(keys) if keys else None
+    return entry
+
+
+def _read_segment(path):
+    if path.name.endswith(SUFFIX):
+        with gzip.open(path, 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path) as fh:
+            yield from json.load(fh)
+
+
+class BatchCache:
+    """One cache directory of numbered batch segments plus their manifest."""
+
+    def __init__(self, path, key=None):
+        self.path = Path(path)
+        self.key = key
+
+    # ── Manifest ──────────────────────────────────────────────────────────
+
+    def manifest(self):
+        try:
+            with open(self.path / MANIFEST) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {'key': self.key, 'segments': {}}
+
+    def _update_manifest(self, name, entry):
+        with _manifest_lock:
+            manifest = self.manifest()
+            manifest['key'] = self.key or manifest.get('key')
+            if entry is None:
+                manifest['segments'].pop(name, None)
+            else:
+                manifest['segments'][name] = entry
+            _replace(self.path / MANIFEST,
+                     json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+    # ── Writing ───────────────────────────────────────────────────────────
+
+    def write(self, batch_num, records):
+        """Write one batch as a compressed segment and record it in the
+        manifest. Returns the manifest entry."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        body = ''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records)
+        data = gzip.compress(body.encode('utf-8'), compresslevel=COMPRESSLEVEL, mtime=0)
+        path = self.path / segment_name(batch_num)
+        _replace(path, data)
+        entry = {**_stats(records, self.key), 'bytes': len(data),
+                 'sha256': hashlib.sha256(data).hexdigest()}
+        self._update_manifest(path.name, entry)
+        legacy = path.with_name(f"batch_{batch_num:05d}{LEGACY_SUFFIX}")
+        if legacy.exists():
+            os.remove(legacy)
+        return entry
+
+    # ── Reading ───────────────────────────────────────────────────────────
+
+    def segments(self):
+        """[(batch_num, path)] in batch order. A batch present in both
+        formats is read from its segment."""
+        if not self.path.exists():
+            return []
+        found = {}
+        for f in self.path.glob('batch_*'):
+            if f.name.endswith(SUFFIX):
+                found[batch_number(f)] = f
+            elif f.name.endswith(LEGACY_SUFFIX):
+                found.setdefault(batch_number(f), f)
+        return sorted(found.items())
+
+    def has(self, batch_num):
+        return ((self.path / segment_name(batch_num)).exists()
+                or (self.path / f"batch_{batch_num:05d}{LEGACY_SUFFIX}").exists())
+
+    def segment_rows(self, path, manifest=None):
+        """Row count of one segment: from the manifest when it lists the
+        segment, otherwise by reading it."""
+        entry = (manifest or self.manifest())['segments'].get(path.name)
+        if entry is not None:
+            return entry['rows']
+        return sum(1 for _ in _read_segment(path))
+
+    def rows(self):
+        manifest = self.manifest()
+        return sum(self.segment_rows(p, manifest) for _, p in self.segments())
+
+    def last(self):
+        """(batch_num, rows) of the highest-numbered batch, or None."""
+        segments = self.segments()
+        if not segments:
+            return None
+        num, path = segments[-1]
+        return num, self.segment_rows(path)
+
+    def disk_bytes(self):
+        return sum(p.stat().st_size for _, p in self.segments())
+
+    def __iter__(self):
+        for _, path in self.segments():
+            yield from _read_segment(path)
+
+    # ── Maintenance ───────────────────────────────────────────────────────
+
+    def verify(self):
+        """Names of segments whose checksum or row count doesn't match the
+        manifest, or that the manifest doesn't list."""
+        manifest = self.manifest()
+        bad = []
+        for _, path in self.segments():
+            entry = manifest['segments'].get(path.name)
+            if entry is None:
+                if path.name.endswith(SUFFIX):
+                    bad.append(path.name)
+                continue
+            data = path.read_bytes()
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                bad.append(path.name)
+                continue
+            try:
+                rows = sum(1 for _ in _read_segment(path))
+            except (OSError, EOFError, ValueError):
+                bad.append(path.name)
+                continue
+            if rows != entry['rows']:
+                bad.append(path.name)
+        return bad
+
+    def convert(self):
+        """Rewrite every legacy batch_*.json as a segment. Returns
+        (batches converted, bytes before, bytes after)."""
+        if self.key is None:
+            self.key = self.manifest().get('key')
+        n = before = after = 0
+        for num, path in self.segments():
+            if not path.name.endswith(LEGACY_SUFFIX):
+                continue
+            before += path.stat().st_size
+            with open(path) as fh:
+                records = json.load(fh)
+            after += self.write(num, records)['bytes']
+            n += 1
+        return n, before, after
+
+
+def cache_dirs(root):
+    """Every directory under `root` (itself included) holding batches, in
+    path order — e.g. each partition of acris_cache/full/legals_parts."""
+    root = Path(root)
+    if not root.exists():
+        return []
+    return sorted({f.parent for f in root.glob('**/batch_*')
+                   if f.name.endswith((SUFFIX, LEGACY_SUFFIX))})
+
+
+def iter_tree(root):
+    """Every record of every cache under `root`, directory by directory."""
+    for d in cache_dirs(root):
+        yield from BatchCache(d)
+
+
+def disk_bytes(root):
+    """Bytes used by batch segments and manifests under `root`."""
+    root = Path(root)
+    if not root.exists():
+        return 0
+    return sum(f.stat().st_size for f in root.rglob('*')
+               if f.name == MANIFEST or (f.name.startswith('batch_')
+                                         and f.name.endswith((SUFFIX, LEGACY_SUFFIX))))
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ('status', 'verify', 'convert'):
+        print("usage: python3 -m vayo.batchcache status|verify|convert DIR [DIR ...]")
+        sys.exit(2)
+    command, roots = sys.argv[1], sys.argv[2:]
+    failed = False
+    for root in roots:
+        for d in cache_dirs(root):
+            cache = BatchCache(d)
+            if command == 'status':
+                print(f"  {str(d):<60} {len(cache.segments()):>6} batches "
+                      f"{cache.rows():>13,} rows {cache.disk_bytes() / 1024**2:>9,.0f} MB")
+            elif command == 'verify':
+                bad = cache.verify()
+                failed |= bool(bad)
+                print(f"  {d}: {'ok' if not bad else 'BAD ' + ', '.join(bad)}")
+            else:
+                n, before, after = cache.convert()
+                if n:
+                    print(f"  {d}: {n} batches, {before / 1024**2:,.0f} MB → "
+                          f"{after / 1024**2:,.0f} MB")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
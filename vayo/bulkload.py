@@ -0,0 +1,155 @@
+"""
+Bulk-load profile for the database builders (build_vayo_db, build_clean_db,
+build_complete_db).
+
+    load = BulkLoad(db)          # right after creating the (empty) file
+    load.phase('sales')          # starts timing a phase, ends the previous one
+    ... CREATE TABLE, inserts, one commit per table ...
+    load.cluster('sales', 'bbl, recorded_date')
+    load.index("CREATE INDEX idx_sales_bbl ON sales(bbl, recorded_date)")
+    load.finish()                # deferred indexes, ANALYZE, optimize, WAL
+    load.report()
+
+While loading, the database has no rollback journal and no fsyncs, and it
+uses 16 KB pages, a 1 GB page cache and in-memory temp B-trees. A crash
+mid-build leaves a corrupt file, which is acceptable because every builder
+starts from scratch. Indexes are only collected during the load and
+built at the end. Each one is then a single sort over a finished table,
+instead of a B-tree kept up to date through every insert. PRAGMA threads
+lets SQLite's sorter use worker threads for each CREATE INDEX. finish()
+ANALYZEs the database so the planner has row counts, then puts it back in
+WAL mode for its readers.
+
+cluster() rewrites a just-loaded table in key order, before its indexes
+exist. The event tables are read one building at a time (WHERE bbl = ?
+ORDER BY date DESC), and once their rowids follow (bbl, date) each
+building's rows sit together on a few neighbouring pages. The tables stay
+ordinary rowid tables rather than WITHOUT ROWID, because complaint_stats,
+features and backtest track what is new by MAX(rowid). An index on
+(bbl, date) then answers the query in order, with the rowid as the
+tiebreaker. Rows appended later by a sync land at the end of the table,
+and the next rebuild clusters them again.
+
+Pages freed by a cluster() copy are reused by later tables and by the
+deferred indexes, so a freshly built file is not VACUUMed.
+"""
+
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+PAGE_SIZE = 16384
+CACHE_KB = 1_000_000
+
+
+def peak_rss_mb():
+    """High-water resident set size of this process in MB, or None where
+    the platform doesn't report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class BulkLoad:
+    """Load-time PRAGMAs, deferred indexes and phase timings for one
+    connection."""
+
+    def __init__(self, db, page_size=PAGE_SIZE, threads=None, log=print):
+        self.db = db
+        self.log = log
+        self.pending = []       # deferred CREATE INDEX statements
+        self.timings = []       # (phase, seconds, peak RSS MB at its end)
+        self._phase = None
+        self._t0 = time.time()
+        # page_size only takes effect before the first table is created.
+        db.execute(f"PRAGMA page_size={page_size}")
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+        db.execute("PRAGMA temp_store=MEMORY")
+        db.execute(f"PRAGMA threads={threads or os.cpu_count() or 1}")
+
+    def phase(self, name):
+        """End the running phase (if any) and start timing `name`."""
+        now = time.time()
+        if self._phase:
+            self.timings.append((self._phase[0], now - self._phase[1], peak_rss_mb()))
+        self._phase = (name, now) if name else None
+
+    def record(self, name, seconds, peak_mb=None):
+        """Add a phase timed elsewhere (e.g. in a worker process)."""
+        self.timings.append((name, seconds, peak_mb))
+
+    def index(self, sql):
+        """Defer a CREATE INDEX until build_indexes() / finish()."""
+        self.pending.append(sql)
+
+    def cluster(self, table, order_by):
+        """Rewrite `table` with its rows in `order_by` order, so rowid order
+        follows that key. Call it after the table is loaded and before
+        build_indexes(); the copy has no indexes to carry."""
+        sql = self.db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+            [table]).fetchone()[0]
+        staged = f"_{table}_unsorted"
+        self.db.execute(f"ALTER TABLE [{table}] RENAME TO [{staged}]")
+        self.db.execute(sql)
+        self.db.execute(f"INSERT INTO [{table}] SELECT * FROM [{staged}] ORDER BY {order_by}")
+        self.db.execute(f"DROP TABLE [{staged}]")
+        self.db.commit()
+
+    def dedupe(self, table, key, newest='rowid'):
+        """Keep one row per non-NULL `key`: the one with the highest
+        `newest`, then the last loaded. A unique index on `key` can then be
+        deferred like any other. Returns the number of rows deleted."""
+        n = self.db.execute(f"""
+            DELETE FROM [{table}] WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY [{key}] ORDER BY {newest} DESC, rowid DESC) AS rn
+                    FROM [{table}] WHERE [{key}] IS NOT NULL)
+                WHERE rn > 1)
+        """).rowcount
+        self.db.commit()
+        return n
+
+    def build_indexes(self):
+        """Run the deferred CREATE INDEX statements, in the order given."""
+        for sql in self.pending:
+            self.db.execute(sql)
+        self.db.commit()
+        self.pending = []
+
+    def finish(self, analyze=True):
+        """Build deferred indexes, ANALYZE, and restore a durable WAL
+        journal. Ends the running phase."""
+        self.db.commit()
+        self.phase('indexes')
+        self.build_indexes()
+        if analyze:
+            self.phase('analyze')
+            self.db.execute("ANALYZE")
+            self.db.execute("PRAGMA optimize")
+            self.db.commit()
+        self.phase(None)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA journal_mode=WAL")
+
+    def report(self):
+        """Phase timings, with the process's peak RSS as each phase ended.
+        The peak never goes down, so the phase where it jumps is the one
+        that used the memory."""
+        self.log("\n  Phase timings:                       time   peak RSS")
+        for name, secs, peak in self.timings:
+            rss = f"{peak:8.0f} MB" if peak is not None else ''
+            self.log(f"    {name:<30} {secs:8.1f}s {rss}")
+        peak = peak_rss_mb()
+        rss = f"{peak:8.0f} MB" if peak is not None else ''
+        self.log(f"    {'total':<30} {time.time() - self._t0:8.1f}s {rss}")
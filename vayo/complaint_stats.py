@@ -0,0 +1,146 @@
+"""
+Per-BBL HPD complaint rollup.
+
+    complaint_stats_by_bbl (bbl, dim, key, cnt)   WITHOUT ROWID
+
+dim is 'total', 'year', 'category' or 'severity'; key is the year / category
+/ severity value ('' for NULL, and for the single 'total' row). One
+clustered range read per building replaces three GROUP BYs over the 25M-row
+hpd_complaints table.
+
+The rollup remembers the highest hpd_complaints rowid it has counted (in
+_rollup_state), so after new complaints are appended a refresh only
+aggregates the new rows and adds them in. Anything that rewrites or deletes
+existing complaints needs a full rebuild:
+
+    python3 -m vayo.complaint_stats          # incremental
+    python3 -m vayo.complaint_stats --full   # rebuild from scratch
+"""
+
+import sqlite3
+import time
+from datetime import datetime
+
+TABLE = 'complaint_stats_by_bbl'
+
+# dim → expression over hpd_complaints (NULL-free, it's part of the key)
+DIMENSIONS = {
+    'total': "''",
+    'year': "substr(received_date, 1, 4)",
+    'category': "COALESCE(category, '')",
+    'severity': "COALESCE(severity, '')",
+}
+
+
+def ensure_tables(db):
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            bbl INTEGER NOT NULL,
+            dim TEXT NOT NULL,
+            key TEXT NOT NULL,
+            cnt INTEGER NOT NULL,
+            PRIMARY KEY (bbl, dim, key)
+        ) WITHOUT ROWID
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS _rollup_state (
+            name TEXT PRIMARY KEY,
+            max_rowid INTEGER NOT NULL,
+            refreshed_at TEXT
+        )
+    """)
+
+
+def _high_water(db):
+    row = db.execute(
+        "SELECT max_rowid FROM _rollup_state WHERE name = ?", [TABLE]
+    ).fetchone()
+    return row[0] if row else None
+
+
+def refresh_complaint_stats(db, full=False):
+    """Bring complaint_stats_by_bbl up to date with hpd_complaints.
+
+    Returns the number of complaint rows aggregated.
+    """
+    ensure_tables(db)
+    since = None if full else _high_water(db)
+    if since is None:
+        db.execute(f"DELETE FROM {TABLE}")
+        since = 0
+
+    top = db.execute("SELECT COALESCE(MAX(rowid), 0) FROM hpd_complaints").fetchone()[0]
+    if top < since:
+        # Table was rebuilt underneath us; rowids no longer line up.
+        return refresh_complaint_stats(db, full=True)
+
+    new_rows = db.execute(
+        "SELECT COUNT(*) FROM hpd_complaints WHERE rowid > ? AND rowid <= ?", [since, top]
+    ).fetchone()[0]
+
+    for dim, expr in DIMENSIONS.items():
+        null_filter = " AND received_date IS NOT NULL" if dim == 'year' else ""
+        db.execute(f"""
+            INSERT INTO {TABLE} (bbl, dim, key, cnt)
+            SELECT bbl, '{dim}', {expr}, COUNT(*)
+            FROM hpd_complaints
+            WHERE rowid > ? AND rowid <= ?{null_filter}
+            GROUP BY bbl, {expr}
+            ON CONFLICT (bbl, dim, key) DO UPDATE SET cnt = cnt + excluded.cnt
+        """, [since, top])
+
+    db.execute(
+        "INSERT OR REPLACE INTO _rollup_state VALUES (?, ?, ?)",
+        [TABLE, top, datetime.now().isoformat(timespec='seconds')],
+    )
+    db.commit()
+    return new_rows
+
+
+def read_complaint_stats(db, bbl, top_categories=10):
+    """Complaint stats for one building from the rollup, or None if the
+    database has no rollup table."""
+    try:
+        rows = db.execute(
+            f"SELECT dim, key, cnt FROM {TABLE} WHERE bbl = ?", [bbl]
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+
+    total = 0
+    by_year, by_category, by_severity = [], [], []
+    for dim, key, cnt in rows:
+        if dim == 'total':
+            total = cnt
+        elif dim == 'year':
+            by_year.append({"year": key, "cnt": cnt})
+        elif dim == 'category':
+            by_category.append({"category": key or None, "cnt": cnt})
+        elif dim == 'severity':
+            by_severity.append({"severity": key or None, "cnt": cnt})
+
+    by_category.sort(key=lambda r: -r["cnt"])
+    by_severity.sort(key=lambda r: -r["cnt"])
+    return {
+        "total": total,
+        "by_year": by_year,     # already in key order
+        "by_category": by_category[:top_categories],
+        "by_severity": by_severity,
+    }
+
+
+def main():
+    import sys
+    from . import MAIN_DB
+
+    full = '--full' in sys.argv
+    db = sqlite3.connect(str(MAIN_DB))
+    t = time.time()
+    n = refresh_complaint_stats(db, full=full)
+    db.close()
+    print(f"  {TABLE}: {n:,} complaints aggregated "
+          f"({'full' if full else 'incremental'}, {time.time()-t:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
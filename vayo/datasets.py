@@ -0,0 +1,295 @@
+"""
+Socrata dataset records → rows of the canonical vayo_clean.db tables.
+
+    DATASETS[name]  table, its columns, the natural key, and row(rec, valid_bbls)
+    dataset_row(name, rec, valid_bbls)   one API record → tuple, or None to skip
+    upsert(db, name, records, valid_bbls)
+
+build_vayo_db uses these to load data_cache/<name>/, and pull_datasets.py
+--sync uses them to apply changed records straight to vayo_clean.db. Both
+paths build rows the same way.
+
+A dataset with a natural key (HPD violation id, DOB NOW job filing number,
+...) gets a unique index on it, plus the record's :updated_at as
+updated_at. A full pull can hold two versions of a record, and the build
+keeps the newer one. upsert() writes each record with
+INSERT OR REPLACE, so a record that changed upstream replaces its old row.
+None of these tables feed vayo.features or vayo.scoring, so a sync doesn't
+make any building rescore. A dataset without a usable key (rolling sales, tax
+liens, subway stations) is small, and a sync replaces its whole table.
+
+vayo.ingest stages rows before the build has its buildings table, so it
+passes ANY_BBL for valid_bbls, and the build filters the staged rows of
+datasets flagged 'valid_bbls' against PLUTO itself.
+
+_sync_state keeps a watermark for each dataset: the highest Socrata
+:updated_at it has applied. The build records the watermark of the cache
+it loaded, and each sync advances it.
+"""
+
+from datetime import datetime
+
+
+def parse_float(val):
+    """Safely parse a float from any value."""
+    if val is None:
+        return 0.0
+    try:
+        return float(val)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def parse_int(val):
+    """Safely parse an int from any value."""
+    if val is None:
+        return 0
+    try:
+        return int(float(val))
+    except (ValueError, TypeError):
+        return 0
+
+
+def normalize_date(val):
+    """Normalize various date formats to ISO YYYY-MM-DD."""
+    if not val:
+        return None
+    val = str(val).strip()
+    # Already ISO
+    if len(val) >= 10 and val[4] == '-':
+        return val[:10]
+    # YYYYMMDD format (ECB violations use this)
+    if len(val) == 8 and val.isdigit():
+        return f"{val[:4]}-{val[4:6]}-{val[6:8]}"
+    # MM/DD/YYYY
+    if '/' in val:
+        parts = val.split('/')
+        if len(parts) == 3:
+            m, d, y = parts
+            if len(y) == 4:
+                return f"{y}-{m.zfill(2)}-{d.zfill(2)}"
+    return val[:10] if len(val) >= 10 else val
+
+
+def make_bbl(boro, block, lot):
+    """Construct BBL from boro, block, lot strings."""
+    try:
+        b = str(int(boro))
+        bl = str(int(block)).zfill(5)
+        lt = str(int(lot)).zfill(4)
+        return int(f"{b}{bl}{lt}")
+    except (ValueError, TypeError):
+        return None
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Row builders — one per dataset, record → table row (None = skip)
+# ══════════════════════════════════════════════════════════════════════════
+
+class _AnyBBL:
+    """valid_bbls that holds every BBL."""
+
+    def __contains__(self, bbl):
+        return True
+
+
+ANY_BBL = _AnyBBL()
+
+
+def hpd_violation_row(rec, valid_bbls):
+    bbl = make_bbl(rec.get('boroid', ''), rec.get('block', ''), rec.get('lot', ''))
+    if not bbl or bbl not in valid_bbls:
+        return None
+    return (
+        bbl,
+        rec.get('apartment', ''),
+        rec.get('class', ''),
+        (rec.get('inspectiondate') or '')[:10],
+        (rec.get('approveddate') or '')[:10],
+        rec.get('novdescription', ''),
+        rec.get('currentstatus', ''),
+        (rec.get('currentstatusdate') or '')[:10],
+        rec.get('violationstatus', ''),
+        rec.get('novtype', ''),
+        rec.get('rentimpairing', ''),
+        rec.get('violationid'),
+        rec.get(':updated_at'),
+    )
+
+
+def rolling_sale_row(rec, valid_bbls):
+    bbl = make_bbl(rec.get('borough', ''), rec.get('block', ''), rec.get('lot', ''))
+    if not bbl:
+        return None
+    return (
+        bbl,
+        rec.get('address', ''),
+        rec.get('zip_code', ''),
+        parse_int(rec.get('residential_units')),
+        rec.get('building_class_at_present', ''),
+        parse_int(rec.get('year_built')),
+        parse_int(rec.get('gross_square_feet')),
+        parse_float(rec.get('sale_price')),
+        (rec.get('sale_date') or '')[:10],
+    )
+
+
+def tax_lien_row(rec, valid_bbls):
+    bbl = make_bbl(rec.get('borough', ''), rec.get('block', ''), rec.get('lot', ''))
+    if not bbl:
+        return None
+    addr_parts = [rec.get('house_number', ''), rec.get('street_name', '')]
+    addr = ' '.join(p for p in addr_parts if p).strip()
+    return (
+        bbl,
+        rec.get('tax_class_code', ''),
+        rec.get('building_class', ''),
+        addr,
+        rec.get('zip_code', ''),
+        rec.get('water_debt_only', ''),
+        rec.get('cycle', ''),
+    )
+
+
+def dob_now_job_row(rec, valid_bbls):
+    bbl_str = rec.get('bbl', '')
+    bbl = None
+    if bbl_str:
+        try:
+            bbl = int(bbl_str)
+        except (ValueError, TypeError):
+            pass
+    if bbl is None:
+        bbl = make_bbl(rec.get('borough', ''), rec.get('block', ''), rec.get('lot', ''))
+    if not bbl:
+        return None
+    return (
+        bbl,
+        rec.get('job_type', ''),
+        rec.get('filing_status', ''),
+        parse_float(rec.get('initial_cost')),
+        parse_int(rec.get('existing_dwelling_units')),
+        parse_int(rec.get('proposed_dwelling_units')),
+        (rec.get('filing_date') or '')[:10],
+        (rec.get('current_status_date') or '')[:10],
+        (rec.get('first_permit_date') or '')[:10],
+        parse_float(rec.get('latitude')),
+        parse_float(rec.get('longitude')),
+        rec.get('job_filing_number'),
+        rec.get(':updated_at'),
+    )
+
+
+def vacate_order_row(rec, valid_bbls):
+    bbl_str = rec.get('bbl', '')
+    try:
+        bbl = int(bbl_str) if bbl_str else None
+    except (ValueError, TypeError):
+        bbl = None
+    if not bbl:
+        return None
+    return (
+        bbl,
+        rec.get('primary_vacate_reason', ''),
+        rec.get('vacate_type', ''),
+        (rec.get('vacate_effective_date') or '')[:10],
+        (rec.get('actual_rescind_date') or '')[:10],
+        parse_int(rec.get('number_of_vacated_units')),
+        parse_float(rec.get('latitude')),
+        parse_float(rec.get('longitude')),
+        rec.get('vacate_order_number'),
+        rec.get(':updated_at'),
+    )
+
+
+def subway_station_row(rec, valid_bbls):
+    return (
+        parse_int(rec.get('station_id')),
+        parse_int(rec.get('complex_id')),
+        rec.get('stop_name', ''),
+        rec.get('borough', ''),
+        rec.get('daytime_routes', ''),
+        rec.get('structure', ''),
+        parse_float(rec.get('gtfs_latitude')),
+        parse_float(rec.get('gtfs_longitude')),
+        parse_int(rec.get('ada')),
+    )
+
+
+# name → table, its column count, the natural key column (None: a sync
+# replaces the whole table), the row builder, and whether the builder drops
+# BBLs outside PLUTO (valid_bbls).
+DATASETS = {
+    'hpd_violations': {'table': 'hpd_violations', 'columns': 13,
+                       'key': 'violation_id', 'row': hpd_violation_row,
+                       'valid_bbls': True},
+    'rolling_sales': {'table': 'rolling_sales', 'columns': 9,
+                      'key': None, 'row': rolling_sale_row},
+    'tax_liens': {'table': 'tax_liens', 'columns': 7,
+                  'key': None, 'row': tax_lien_row},
+    'dob_now_jobs': {'table': 'dob_now_jobs', 'columns': 13,
+                     'key': 'job_filing_number', 'row': dob_now_job_row},
+    'vacate_orders': {'table': 'vacate_orders', 'columns': 10,
+                      'key': 'vacate_order_number', 'row': vacate_order_row},
+    'subway_stations': {'table': 'subway_stations', 'columns': 9,
+                        'key': None, 'row': subway_station_row},
+}
+
+
+def dataset_row(name, rec, valid_bbls):
+    return DATASETS[name]['row'](rec, valid_bbls)
+
+
+def insert_sql(name, replace=False):
+    spec = DATASETS[name]
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    return f"{verb} INTO {spec['table']} VALUES ({','.join('?' * spec['columns'])})"
+
+
+def upsert(db, name, records, valid_bbls):
+    """Write records into the dataset's table, replacing rows with the same
+    natural key. Returns the number of rows written. Doesn't commit."""
+    rows = [r for r in (dataset_row(name, rec, valid_bbls) for rec in records)
+            if r is not None]
+    if rows:
+        db.executemany(insert_sql(name, replace=True), rows)
+    return len(rows)
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Sync watermarks
+# ══════════════════════════════════════════════════════════════════════════
+
+def ensure_sync_state(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS _sync_state (
+            name TEXT PRIMARY KEY,
+            watermark TEXT,
+            synced_at TEXT,
+            rows INTEGER
+        )
+    """)
+
+
+def get_watermark(db, name):
+    """Highest :updated_at applied for `name`, or None if unknown."""
+    ensure_sync_state(db)
+    row = db.execute("SELECT watermark FROM _sync_state WHERE name = ?", [name]).fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(db, name, watermark, rows):
+    """Record the watermark reached and the rows written to get there."""
+    ensure_sync_state(db)
+    db.execute("INSERT OR REPLACE INTO _sync_state VALUES (?, ?, ?, ?)",
+               [name, watermark, datetime.now().isoformat(timespec='seconds'), rows])
+
+
+def cache_watermark(cache):
+    """Highest :updated_at in a BatchCache keyed on it, from its manifest;
+    None for a cache pulled without :updated_at."""
+    manifest = cache.manifest()
+    if manifest.get('key') != ':updated_at':
+        return None
+    top = [s['max_key'] for s in manifest['segments'].values() if s.get('max_key')]
+    return max(top) if top else None
@@ -0,0 +1,116 @@
+"""
+Per-BBL event dates in CSR form, for bulk "did X happen within N days?"
+questions.
+
+    EventIndex
+        bbl      sorted unique int64 BBLs
+        offsets  int64, len(bbl) + 1 — events of bbl[i] are days[offsets[i]:offsets[i+1]]
+        days     int32 day numbers (date.toordinal()), sorted within each BBL
+
+Every query takes arrays of (bbl, window start, window end) and answers all
+of them with two np.searchsorted calls over one composite key: the BBL's
+segment number in the high 32 bits, the day in the low 32. Segments are
+contiguous and sorted, so "first event on or after `start` for this BBL"
+is a single binary search, the same as it would be within one BBL's list.
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def iso_days(values):
+    """ISO date strings → int32 day numbers; -1 where a value isn't a date
+    (only the first 10 characters are read)."""
+    values = [v[:10] if isinstance(v, str) else '' for v in values]
+    out = np.full(len(values), -1, dtype=np.int32)
+    # Zero-padded YYYY-MM-DD goes through numpy in one call; anything else
+    # ("2022-1-5") is left to strptime below.
+    padded = [v if len(v) == 10 and v[4] == '-' else '' for v in values]
+    try:
+        parsed = np.array(padded, dtype='datetime64[D]')
+        ok = ~np.isnat(parsed)
+        out[ok] = parsed[ok].astype(np.int64) + EPOCH_ORDINAL
+        rest = [i for i, v in enumerate(values) if v and not padded[i]]
+    except ValueError:
+        rest = [i for i, v in enumerate(values) if v]
+    for i in rest:
+        try:
+            out[i] = datetime.strptime(values[i], '%Y-%m-%d').toordinal()
+        except ValueError:
+            pass
+    return out
+
+
+def to_days(dates):
+    """datetime.date objects → int32 day numbers."""
+    return np.fromiter((d.toordinal() for d in dates), dtype=np.int32)
+
+
+class EventIndex:
+    """Sorted event days per BBL. Build with from_pairs() or load_events()."""
+
+    def __init__(self, bbl, offsets, days):
+        self.bbl = bbl
+        self.offsets = offsets
+        self.days = days
+        seg = np.repeat(np.arange(len(bbl), dtype=np.int64), np.diff(offsets))
+        self._keys = (seg << 32) | days.astype(np.int64)
+
+    @classmethod
+    def from_pairs(cls, bbls, days):
+        bbls = np.asarray(bbls, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int32)
+        keep = days >= 0
+        bbls, days = bbls[keep], days[keep]
+        order = np.lexsort((days, bbls))
+        bbls, days = bbls[order], days[order]
+        uniq, starts = np.unique(bbls, return_index=True)
+        offsets = np.append(starts, len(bbls)).astype(np.int64)
+        return cls(uniq, offsets, days)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def bbl_count(self):
+        return len(self.bbl)
+
+    def _segments(self, bbls):
+        bbls = np.asarray(bbls, dtype=np.int64)
+        seg = np.searchsorted(self.bbl, bbls)
+        seg[seg == len(self.bbl)] = 0
+        found = self.bbl[seg] == bbls if len(self.bbl) else np.zeros(len(bbls), bool)
+        return seg.astype(np.int64), found
+
+    def count_between(self, bbls, start, end):
+        """Events per query with start <= day < end. `start` / `end` are day
+        numbers, scalars or arrays aligned with `bbls`."""
+        seg, found = self._segments(bbls)
+        start = np.broadcast_to(np.asarray(start, dtype=np.int64), seg.shape)
+        end = np.broadcast_to(np.asarray(end, dtype=np.int64), seg.shape)
+        lo = np.searchsorted(self._keys, (seg << 32) | np.maximum(start, 0))
+        hi = np.searchsorted(self._keys, (seg << 32) | np.maximum(end, 0))
+        return np.where(found, hi - lo, 0)
+
+    def any_between(self, bbls, start, end):
+        """Bool per query: any event with start <= day < end."""
+        return self.count_between(bbls, start, end) > 0
+
+    def any_within(self, bbls, start, days):
+        """Bool per query: any event on or after `start` and at most `days`
+        days after it (both ends inclusive)."""
+        start = np.asarray(start, dtype=np.int64)
+        return self.any_between(bbls, start, start + days + 1)
+
+
+def load_events(conn, sql, params=()):
+    """EventIndex from a query returning (bbl, ISO date) rows. Rows with no
+    BBL, or whose date doesn't parse, are dropped."""
+    rows = [r for r in conn.execute(sql, params) if r[0] is not None]
+    if not rows:
+        return EventIndex.from_pairs([], [])
+    bbls, dates = zip(*rows)
+    return EventIndex.from_pairs(bbls, iso_days(d or '' for d in dates))
@@ -0,0 +1,104 @@
+"""
+External merge sort and merge join for record streams too big for memory.
+
+    with ExternalSort(key=itemgetter(0), tmpdir=...) as legals:
+        for rec in feed:
+            legals.add(rec)
+        for doc_id, (m, l, p) in merge_join(itemgetter(0), master, legals, parties):
+            ...
+
+add() buffers records until run_size of them are held. It then sorts them
+and writes them to a temp file as a run of pickled chunks. Iterating the
+sorter merges its runs with heapq.merge, which keeps one chunk per run in
+memory. Memory is bounded by run_size records while adding, and by
+runs × CHUNK records while merging, however long the feed is. Both list.sort
+and heapq.merge are stable, so records with equal keys come out in the
+order they were added.
+
+merge_join() walks several key-sorted streams in step and yields each key
+with the records every stream has for it, so a join never holds more than
+one key's records.
+"""
+
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from itertools import groupby
+
+RUN_SIZE = 1_000_000
+CHUNK = 10_000
+
+
+class ExternalSort:
+    """Sorted iteration over any number of added records, spilling sorted
+    runs to disk. Use as a context manager so the runs are removed."""
+
+    def __init__(self, key, run_size=RUN_SIZE, tmpdir=None):
+        self.key = key
+        self.run_size = run_size
+        self.dir = tempfile.mkdtemp(prefix='extsort_', dir=tmpdir)
+        self.runs = []
+        self.count = 0
+        self._buffer = []
+
+    def add(self, rec):
+        self._buffer.append(rec)
+        self.count += 1
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self):
+        if not self._buffer:
+            return
+        self._buffer.sort(key=self.key)
+        path = os.path.join(self.dir, f"run_{len(self.runs):05d}.pkl")
+        with open(path, 'wb') as fh:
+            for i in range(0, len(self._buffer), CHUNK):
+                pickle.dump(self._buffer[i:i + CHUNK], fh, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self._buffer = []
+
+    def __iter__(self):
+        self._spill()
+        return heapq.merge(*(_read_run(p) for p in self.runs), key=self.key)
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.runs = []
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_run(path):
+    with open(path, 'rb') as fh:
+        while True:
+            try:
+                chunk = pickle.load(fh)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def _tag(stream, key, i):
+    for rec in stream:
+        yield key(rec), i, rec
+
+
+def merge_join(key, *streams):
+    """(key, [records of stream 0], [records of stream 1], ...) for every
+    key in any of `streams`, in key order. Each stream must already be
+    sorted by `key`; within a key, records keep their stream order."""
+    merged = heapq.merge(*(_tag(s, key, i) for i, s in enumerate(streams)),
+                         key=lambda t: t[:2])
+    for k, group in groupby(merged, key=lambda t: t[0]):
+        out = [[] for _ in streams]
+        for _, i, rec in group:
+            out[i].append(rec)
+        yield k, out
@@ -0,0 +1,496 @@
+"""
+Columnar per-BBL feature store for the scoring engine.
+
+Every signal the Gem / Availability scores read is aggregated once per
+building, with SQL GROUP BYs inside SQLite instead of Python loops over
+raw rows, and written as one .npy array per column:
+
+    vayo_features/
+        meta.json          cutoff, source versions, vocabularies, row count
+        bbl.npy            sorted int64 BBLs — row i of every column is bbl[i]
+        complaints_total.npy
+        ...
+
+Arrays load memory-mapped, so opening the store costs milliseconds no
+matter how many buildings it holds.
+
+"Recent" features count rows on or after the cutoff date (the lookback
+window start). A snapshot is only valid for the cutoff it was built with
+and for the database contents it was built from; `source` in meta.json
+records MAX(rowid) of every input table, and ensure_features() rebuilds
+when either has moved.
+
+    python3 -m vayo.features            # build if stale
+    python3 -m vayo.features --rebuild  # always rebuild
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from . import PROJECT_DIR, MAIN_DB
+from .sr_types import CATEGORIES, in_list, is_encoded, type_ids
+
+FORMAT_VERSION = 1
+STORE_DIR = PROJECT_DIR / "vayo_features"
+LOOKBACK_MONTHS = 24
+
+SOURCE_TABLES = [
+    'buildings', 'hpd_complaints', 'service_requests', 'rent_stabilization',
+    'sales', 'permits', 'litigation', 'violations', 'evictions', 'contacts',
+]
+
+BOROUGHS = ['MN', 'BX', 'BK', 'QN', 'SI']
+
+# Scoped builds up to this many BBLs inline them as an IN list, which also
+# works on query_only connections; larger sets go through a temp table.
+INLINE_BBLS = 500
+
+# column → dtype. Absent data is 0 everywhere.
+COLUMNS = {
+    'bbl': np.int64,
+    # building attributes
+    'units': np.int32,
+    'avg_sqft': np.float64,
+    'year_built': np.int32,
+    'num_floors': np.int32,
+    'borough': np.int8,             # index into BOROUGHS, -1 unknown
+    'zipcode': np.int32,
+    # HPD complaints
+    'complaints_total': np.int32,
+    'complaints_recent': np.int32,
+    # 311
+    'noise_total': np.int32,
+    'distress_recent': np.int32,
+    # rent stabilization
+    'stab_units': np.int32,
+    'has_421a': np.int8,
+    'has_j51': np.int8,
+    # ACRIS, recent window
+    'deeds': np.int32,
+    'mortgages': np.int32,
+    'satisfactions': np.int32,
+    'agreements': np.int32,
+    'estate_deeds': np.int32,
+    'llc_deeds': np.int32,
+    'units_traded': np.int32,
+    'last_sale_date': np.int32,     # YYYYMMDD
+    'last_sale_amt': np.float64,
+    # DOB permits, since dob_cutoff
+    'permit_count': np.int32,
+    'permit_max_cost': np.float64,
+    'permit_has_alteration': np.int8,
+    # HPD litigation, recent window
+    'lit_count': np.int32,
+    'lit_types': np.uint64,         # bitmask over meta['lit_types']
+    # ECB violations, recent window
+    'ecb_count': np.int32,
+    'ecb_unpaid': np.float64,
+    # marshal evictions, recent window
+    'evictions_recent': np.int32,
+    # distinct corporate owner names ever registered with HPD
+    'owner_names': np.int32,
+}
+
+ESTATE_WORDS = ['ESTATE', 'EXECUTOR', 'ADMINISTRATOR']
+
+
+def default_cutoff(months=LOOKBACK_MONTHS):
+    return (datetime.now() - timedelta(days=months * 30)).strftime('%Y-%m-%d')
+
+
+def iso_to_int(d):
+    """'2024-03-15' → 20240315; 0 for anything that isn't an ISO date."""
+    try:
+        return int(d[:10].replace('-', '')) if d and d[4] == '-' else 0
+    except (ValueError, IndexError, TypeError):
+        return 0
+
+
+def int_to_iso(n):
+    n = int(n)
+    if not n:
+        return None
+    return f"{n // 10000:04d}-{n // 100 % 100:02d}-{n % 100:02d}"
+
+
+def source_version(db):
+    """MAX(rowid) of every input table — changes whenever rows are appended
+    or the database is rebuilt."""
+    version = {}
+    for table in SOURCE_TABLES:
+        try:
+            version[table] = db.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            version[table] = None
+    return version
+
+
+# Date column each windowed feature counts from. When the cutoff moves
+# forward, rows dated between the old and new cutoff drop out of "recent".
+WINDOW_DATES = {
+    'hpd_complaints': 'received_date',
+    'service_requests': 'created_date',
+    'sales': 'recorded_date',
+    'permits': 'action_date',
+    'litigation': 'opened_date',
+    'violations': 'issue_date',
+    'evictions': 'executed_date',
+}
+
+
+def changed_bbls(db, prev, cutoff):
+    """BBLs whose features may differ from an earlier build.
+
+    prev: the earlier build's meta (needs 'source', 'cutoff', 'dob_cutoff').
+    That is every BBL with rows appended since (rowid above the recorded
+    high-water mark) plus every BBL with rows that aged out of the window
+    as the cutoff moved to `cutoff`. Returns None when the difference can't
+    be worked out incrementally (tables rebuilt, cutoff moved backwards,
+    permit fallback window switched) and everything must be recomputed.
+    """
+    old_cutoff = prev['cutoff']
+    if cutoff < old_cutoff:
+        return None
+    now = source_version(db)
+    touched = set()
+    for table in SOURCE_TABLES:
+        hwm, top = prev['source'].get(table), now[table]
+        if hwm is None or top is None or top < hwm:
+            return None
+        if top > hwm:
+            touched.update(r[0] for r in db.execute(
+                f"SELECT DISTINCT bbl FROM {table} WHERE rowid > ?", [hwm]))
+
+    dob_max = db.execute("SELECT MAX(action_date) FROM permits").fetchone()[0] or ''
+    dob_cutoff = cutoff if dob_max >= cutoff else '2000-01-01'
+    if (dob_cutoff == cutoff) != (prev['dob_cutoff'] == old_cutoff):
+        return None
+    if cutoff > old_cutoff:
+        for table, col in WINDOW_DATES.items():
+            if table == 'permits' and dob_cutoff != cutoff:
+                continue    # counting all permits; nothing ages out
+            touched.update(r[0] for r in db.execute(
+                f"SELECT DISTINCT bbl FROM {table} WHERE {col} >= ? AND {col} < ?",
+                [old_cutoff, cutoff]))
+    touched.discard(None)
+    return touched
+
+
+# ── Build ────────────────────────────────────────────────────────────────
+
+class _Builder:
+    """Fills column arrays from (bbl, value...) query results."""
+
+    def __init__(self, bbls):
+        self.bbl = bbls
+        self.cols = {'bbl': bbls}
+        for name, dtype in COLUMNS.items():
+            if name != 'bbl':
+                self.cols[name] = np.zeros(len(bbls), dtype=dtype)
+
+    def _index(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        idx = np.searchsorted(self.bbl, keys)
+        idx[idx == len(self.bbl)] = 0
+        hit = self.bbl[idx] == keys if len(self.bbl) else np.zeros(len(keys), bool)
+        return idx[hit], hit
+
+    def fill(self, rows, names):
+        """rows: [(bbl, v1, v2, ...)] → columns `names` (one per value)."""
+        if not rows:
+            return
+        table = list(zip(*rows))
+        idx, hit = self._index(table[0])
+        for name, values in zip(names, table[1:]):
+            col = self.cols[name]
+            vals = np.asarray([0 if v is None else v for v in values], dtype=np.float64)
+            col[idx] = vals[hit].astype(col.dtype)
+
+
+def build_features(db, cutoff=None, log=print, bbls=None, bbl_range=None):
+    """Aggregate every scoring feature per BBL. Returns (columns, meta).
+
+    With `bbls`, only those buildings are aggregated: every query is
+    restricted to them through the bbl indexes, via an inline IN list for
+    a handful of BBLs or a temp table for more. `bbl_range` = (lo, hi)
+    restricts to lo <= bbl < hi the same way (one shard of a parallel run).
+    """
+    cutoff = cutoff or default_cutoff()
+    t0 = time.time()
+
+    def step(label):
+        log(f"  {label:<28} {time.time() - t0:6.1f}s")
+
+    scope = ""
+    temp = bbls is not None and len(bbls) > INLINE_BBLS
+    if bbls is not None and not temp:
+        scope = f" AND bbl IN ({','.join(str(int(b)) for b in bbls)})"
+    elif temp:
+        db.execute("DROP TABLE IF EXISTS temp._feature_bbls")
+        db.execute("CREATE TEMP TABLE _feature_bbls (bbl INTEGER PRIMARY KEY)")
+        db.executemany("INSERT OR IGNORE INTO temp._feature_bbls VALUES (?)",
+                       ((int(b),) for b in bbls))
+        scope = " AND bbl IN (SELECT bbl FROM temp._feature_bbls)"
+    if bbl_range is not None:
+        lo, hi = bbl_range
+        scope += f" AND bbl >= {int(lo)} AND bbl < {int(hi)}"
+
+    bbls = np.array([r[0] for r in db.execute(f"""
+        SELECT bbl FROM buildings
+        WHERE units_residential > 0 AND residential_area > 0{scope}
+        ORDER BY bbl
+    """)], dtype=np.int64)
+    b = _Builder(bbls)
+
+    boro_code = {name: i for i, name in enumerate(BOROUGHS)}
+    rows = []
+    for bbl, units, sqft, yr, floors, boro, zipcode in db.execute(f"""
+        SELECT bbl, units_residential, avg_unit_sqft, year_built, num_floors,
+               borough, zipcode
+        FROM buildings
+        WHERE units_residential > 0 AND residential_area > 0{scope}
+    """):
+        try:
+            z = int(zipcode)
+        except (TypeError, ValueError):
+            z = 0
+        rows.append((bbl, units, sqft, yr, floors, boro_code.get(boro, -1), z))
+    b.fill(rows, ['units', 'avg_sqft', 'year_built', 'num_floors', 'borough', 'zipcode'])
+    step(f"buildings ({len(bbls):,})")
+
+    b.fill(db.execute(f"""
+        SELECT bbl, COUNT(*), SUM(received_date >= ?)
+        FROM hpd_complaints WHERE 1{scope} GROUP BY bbl
+    """, [cutoff]).fetchall(), ['complaints_total', 'complaints_recent'])
+    step("hpd_complaints")
+
+    # Integer type codes when the table is dictionary-encoded (vayo.sr_types),
+    # otherwise the same classification as string matches on every row.
+    if is_encoded(db):
+        noise = f"type_id IN ({in_list(type_ids(db, 'noise'))})"
+        distress = f"type_id IN ({in_list(type_ids(db, 'distress'))})"
+    else:
+        noise, distress = CATEGORIES['noise'], CATEGORIES['distress']
+    b.fill(db.execute(f"""
+        SELECT bbl,
+               SUM({noise}),
+               SUM(created_date >= ? AND ({distress}))
+        FROM service_requests WHERE bbl IS NOT NULL{scope} GROUP BY bbl
+    """, [cutoff]).fetchall(), ['noise_total', 'distress_recent'])
+    step("service_requests")
+
+    b.fill(db.execute(f"""
+        SELECT bbl, MAX(stabilized_units), MAX(has_421a), MAX(has_j51)
+        FROM rent_stabilization WHERE 1{scope} GROUP BY bbl
+    """).fetchall(), ['stab_units', 'has_421a', 'has_j51'])
+    step("rent_stabilization")
+
+    estate = ' OR '.join(
+        f"instr(upper(COALESCE({who}, '')), '{w}') > 0"
+        for w in ESTATE_WORDS for who in ('buyer', 'seller')
+    )
+    rows = db.execute(f"""
+        SELECT bbl,
+               SUM(doc_type = 'DEED'), SUM(doc_type = 'MTGE'),
+               SUM(doc_type = 'SAT'), SUM(doc_type = 'AGMT'),
+               SUM(doc_type = 'DEED' AND ({estate})),
+               SUM(doc_type = 'DEED' AND instr(upper(COALESCE(buyer, '')), 'LLC') > 0),
+               COUNT(DISTINCT CASE WHEN doc_type = 'DEED' AND unit <> '' THEN unit END)
+        FROM sales WHERE recorded_date >= ?{scope} GROUP BY bbl
+    """, [cutoff]).fetchall()
+    b.fill(rows, ['deeds', 'mortgages', 'satisfactions', 'agreements',
+                  'estate_deeds', 'llc_deeds', 'units_traded'])
+    # Last deed: latest recorded_date, first in table order on ties.
+    last = {}
+    for bbl, rec, amt in db.execute(f"""
+        SELECT s.bbl, s.recorded_date, s.amount
+        FROM sales s
+        JOIN (SELECT bbl, MAX(recorded_date) AS d FROM sales
+              WHERE doc_type = 'DEED' AND recorded_date >= ?{scope} GROUP BY bbl) m
+          ON s.bbl = m.bbl AND s.recorded_date = m.d
+        WHERE s.doc_type = 'DEED'
+        ORDER BY s.rowid
+    """, [cutoff]):
+        if bbl not in last:
+            last[bbl] = (bbl, iso_to_int(rec), amt or 0)
+    b.fill(list(last.values()), ['last_sale_date', 'last_sale_amt'])
+    step("sales")
+
+    # Permit data lags; fall back to all permits when it stops before the window.
+    dob_max = db.execute("SELECT MAX(action_date) FROM permits").fetchone()[0] or ''
+    dob_cutoff = cutoff if dob_max >= cutoff else '2000-01-01'
+    b.fill(db.execute(f"""
+        SELECT bbl, COUNT(*),
+               MAX(COALESCE(MAX(estimated_cost), 0), 0),
+               MAX(instr(upper(COALESCE(job_type, '')), 'A') > 0)
+        FROM permits WHERE action_date >= ?{scope} GROUP BY bbl
+    """, [dob_cutoff]).fetchall(), ['permit_count', 'permit_max_cost', 'permit_has_alteration'])
+    step("permits")
+
+    lit_types = sorted(r[0] for r in db.execute(
+        f"SELECT DISTINCT case_type FROM litigation WHERE case_type IS NOT NULL AND case_type <> ''{scope}"))
+    if len(lit_types) > 64:
+        raise ValueError(f"{len(lit_types)} litigation case types don't fit the 64-bit mask")
+    type_bit = {t: 1 << i for i, t in enumerate(lit_types)}
+    lit = {}
+    for bbl, case_type, cnt in db.execute(f"""
+        SELECT bbl, case_type, COUNT(*) FROM litigation
+        WHERE opened_date >= ?{scope} GROUP BY bbl, case_type
+    """, [cutoff]):
+        count, mask = lit.get(bbl, (0, 0))
+        lit[bbl] = (count + cnt, mask | type_bit.get(case_type, 0))
+    if lit:
+        idx, hit = b._index(list(lit))
+        vals = list(lit.values())
+        b.cols['lit_count'][idx] = np.array([v[0] for v in vals], dtype=np.int32)[hit]
+        b.cols['lit_types'][idx] = np.array([v[1] for v in vals], dtype=np.uint64)[hit]
+    step("litigation")
+
+    b.fill(db.execute(f"""
+        SELECT bbl, COUNT(*), COALESCE(SUM(balance_due), 0)
+        FROM violations WHERE issue_date >= ?{scope} GROUP BY bbl
+    """, [cutoff]).fetchall(), ['ecb_count', 'ecb_unpaid'])
+    step("violations")
+
+    b.fill(db.execute(f"""
+        SELECT bbl, COUNT(*) FROM evictions
+        WHERE executed_date >= ?{scope} GROUP BY bbl
+    """, [cutoff]).fetchall(), ['evictions_recent'])
+    step("evictions")
+
+    b.fill(db.execute(f"""
+        SELECT bbl, COUNT(DISTINCT upper(trim(company))) FROM contacts
+        WHERE role = 'owner' AND company IS NOT NULL AND trim(company) <> ''{scope}
+        GROUP BY bbl
+    """).fetchall(), ['owner_names'])
+    step("contacts")
+
+    if temp:
+        db.execute("DROP TABLE IF EXISTS temp._feature_bbls")
+
+    meta = {
+        'format': FORMAT_VERSION,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'cutoff': cutoff,
+        'dob_cutoff': dob_cutoff,
+        'rows': int(len(bbls)),
+        'source': source_version(db),
+        'boroughs': BOROUGHS,
+        'lit_types': lit_types,
+        'columns': {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+    }
+    return b.cols, meta
+
+
+def save_features(cols, meta, path=STORE_DIR):
+    """Write the store to `path`, replacing any previous snapshot atomically."""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    for name, arr in cols.items():
+        np.save(tmp / f"{name}.npy", arr)
+    with open(tmp / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    old = path.with_name(path.name + '.old')
+    if path.exists():
+        if old.exists():
+            shutil.rmtree(old)
+        os.rename(path, old)
+    os.rename(tmp, path)
+    if old.exists():
+        shutil.rmtree(old)
+
+
+# ── Load ─────────────────────────────────────────────────────────────────
+
+class FeatureStore:
+    """Read-only view over a saved snapshot. Columns are attributes
+    (`fs.complaints_total`) and `fs.row(bbl)` finds a building's row."""
+
+    def __init__(self, cols, meta):
+        self.meta = meta
+        self.cols = cols
+        self.bbl = cols['bbl']
+        self.lit_vocab = meta['lit_types']
+
+    def __len__(self):
+        return len(self.bbl)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['cols'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def rows(self, bbls):
+        """Row indices for `bbls` (BBLs not in the store are dropped)."""
+        keys = np.asarray(list(bbls), dtype=np.int64)
+        idx = np.searchsorted(self.bbl, keys)
+        idx = idx[idx < len(self.bbl)]
+        return idx[np.isin(self.bbl[idx], keys)] if len(idx) else idx
+
+    def row(self, bbl):
+        i = int(np.searchsorted(self.bbl, bbl))
+        if i < len(self.bbl) and self.bbl[i] == bbl:
+            return i
+        return None
+
+    def lit_type_names(self, mask):
+        mask = int(mask)
+        return {t for i, t in enumerate(self.lit_vocab) if mask >> i & 1}
+
+    def is_current(self, db, cutoff=None):
+        return (self.meta.get('format') == FORMAT_VERSION
+                and self.meta['cutoff'] == (cutoff or default_cutoff())
+                and self.meta['source'] == source_version(db))
+
+
+def load_features(path=STORE_DIR, mmap=True):
+    """Open a saved snapshot, or return None if there isn't one."""
+    path = Path(path)
+    try:
+        with open(path / 'meta.json') as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    mode = 'r' if mmap else None
+    cols = {name: np.load(path / f"{name}.npy", mmap_mode=mode) for name in meta['columns']}
+    return FeatureStore(cols, meta)
+
+
+def ensure_features(db, cutoff=None, path=STORE_DIR, rebuild=False, log=print):
+    """Load the snapshot at `path`, rebuilding it first if it is missing or
+    out of date for `cutoff` / the current database contents."""
+    cutoff = cutoff or default_cutoff()
+    if not rebuild:
+        fs = load_features(path)
+        if fs is not None and fs.is_current(db, cutoff):
+            return fs
+    cols, meta = build_features(db, cutoff, log=log)
+    save_features(cols, meta, path)
+    return load_features(path)
+
+
+def main():
+    import sys
+
+    db = sqlite3.connect(f"file:{MAIN_DB}?mode=ro", uri=True)
+    t = time.time()
+    fs = ensure_features(db, rebuild='--rebuild' in sys.argv)
+    db.close()
+    print(f"  {len(fs):,} buildings, cutoff {fs.meta['cutoff']}, "
+          f"built {fs.meta['built_at']} ({time.time() - t:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Streaming ingest: Socrata pages → vayo.datasets rows → staging tables in
+data_staging.db, with no JSON cache in between.
+
+    with StagingWriter(STAGING_DB) as writer:
+        await stream_dataset(client, writer, name, url, params, batch=BATCH)
+
+    staged(STAGING_DB, name)          # {'rows', 'watermark', 'staged_at'} or None
+    staged_rows(STAGING_DB, name)     # the rows, for build_vayo_db
+
+Pages go to a writer thread over a bounded queue. The thread turns each
+record into its table row with the same row builder the build and --sync
+use (BBL, normalize_date, parse_float ...), and executemany()s the page
+into stage_<name>_new, committing it together with the pull's progress
+(offset reached, rows, highest :updated_at). While it writes one page the
+event loop is already downloading the next, and the queue holds the
+downloads back if the writer falls behind. A pull that dies resumes at its
+last committed page. The last page is followed by a swap: stage_<name>_new
+becomes stage_<name> in the transaction that records it as staged, so the
+build only ever reads a finished pull.
+
+Rows are staged before the build has its buildings table, so row builders
+that drop BBLs outside PLUTO get ANY_BBL here, and the build filters the
+staged rows of those datasets (DATASETS[name]['valid_bbls']) itself.
+
+Pass a BatchCache as `cache` to keep the raw pages as well, for audit.
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+from .datasets import ANY_BBL, DATASETS, dataset_row
+
+QUEUE_PAGES = 4          # pages waiting for the writer before downloads wait
+_STOP = object()
+
+
+def _table(name, new=False):
+    return f"stage_{DATASETS[name]['table']}" + ('_new' if new else '')
+
+
+def _ensure_state(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS _staging_state (
+            name TEXT PRIMARY KEY,
+            pull_offset INTEGER,      -- records consumed by the pull in progress
+            pull_rows INTEGER,
+            pull_watermark TEXT,
+            staged_rows INTEGER,      -- the finished stage_<name> table
+            staged_watermark TEXT,
+            staged_at TEXT
+        )
+    """)
+
+
+def _state(db, name):
+    db.row_factory = sqlite3.Row
+    try:
+        return db.execute("SELECT * FROM _staging_state WHERE name = ?", [name]).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+
+class StagingWriter:
+    """Owns the staging DB's write connection on a thread of its own. The
+    async methods queue work for it; an error on the thread is raised by
+    the next call (and by leaving the with block)."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.queue = queue.Queue(maxsize=QUEUE_PAGES)
+        self.error = None
+
+    def __enter__(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        _ensure_state(db)
+        db.commit()
+        db.close()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.queue.put(_STOP)
+        self._thread.join()
+        if self.error and exc[0] is None:
+            raise self.error
+
+    def _run(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA synchronous=NORMAL")
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    return
+                if self.error:
+                    continue        # keep draining so producers never block
+                op, args = item
+                try:
+                    op(db, *args)
+                except Exception as e:
+                    db.rollback()
+                    self.error = e
+        finally:
+            db.close()
+
+    async def _submit(self, op, *args):
+        if self.error:
+            raise self.error
+        await asyncio.to_thread(self.queue.put, (op, args))
+
+    async def start(self, name, resume=False):
+        """Begin pulling `name`; returns the offset to page from. With
+        `resume`, carries on with an unfinished pull, and returns None if
+        the last pull finished."""
+        db = sqlite3.connect(self.path)
+        try:
+            state = _state(db, name)
+        finally:
+            db.close()
+        if resume and state:
+            if state['pull_offset'] is not None:
+                return state['pull_offset']
+            if state['staged_at'] is not None:
+                return None
+        await self._submit(self._start, name)
+        return 0
+
+    async def page(self, name, end_offset, records):
+        """Stage one page; `end_offset` is the offset just past it."""
+        await self._submit(self._page, name, end_offset, records)
+
+    async def finish(self, name):
+        await self._submit(self._finish, name)
+
+    @staticmethod
+    def _start(db, name):
+        new = _table(name, new=True)
+        db.execute(f"DROP TABLE IF EXISTS {new}")
+        db.execute(f"CREATE TABLE {new} "
+                   f"({', '.join(f'c{i}' for i in range(DATASETS[name]['columns']))})")
+        db.execute("""
+            INSERT INTO _staging_state (name, pull_offset, pull_rows) VALUES (?, 0, 0)
+            ON CONFLICT(name) DO UPDATE
+            SET pull_offset = 0, pull_rows = 0, pull_watermark = NULL
+        """, [name])
+        db.commit()
+
+    @staticmethod
+    def _page(db, name, end_offset, records):
+        rows = [r for r in (dataset_row(name, rec, ANY_BBL) for rec in records)
+                if r is not None]
+        stamps = [rec[':updated_at'] for rec in records if rec.get(':updated_at')]
+        if rows:
+            db.executemany(f"INSERT INTO {_table(name, new=True)} "
+                           f"VALUES ({','.join('?' * DATASETS[name]['columns'])})", rows)
+        db.execute("""
+            UPDATE _staging_state
+            SET pull_offset = ?, pull_rows = pull_rows + ?,
+                pull_watermark = MAX(COALESCE(pull_watermark, ''), ?)
+            WHERE name = ?
+        """, [end_offset, len(rows), max(stamps, default=''), name])
+        db.commit()
+
+    @staticmethod
+    def _finish(db, name):
+        db.execute("BEGIN")
+        db.execute(f"DROP TABLE IF EXISTS {_table(name)}")
+        db.execute(f"ALTER TABLE {_table(name, new=True)} RENAME TO {_table(name)}")
+        db.execute("""
+            UPDATE _staging_state
+            SET staged_rows = pull_rows, staged_watermark = NULLIF(pull_watermark, ''),
+                staged_at = ?, pull_offset = NULL, pull_rows = NULL, pull_watermark = NULL
+            WHERE name = ?
+        """, [datetime.now().isoformat(), name])
+        db.commit()
+
+
+async def stream_dataset(client, writer, name, url, params, batch, resume=False,
+                         cache=None, log=print):
+    """Pull a dataset page by page into its staging table (and `cache`, if
+    given). Returns the records pulled; FetchError leaves the pull
+    resumable."""
+    start = await writer.start(name, resume)
+    if start is None:
+        log(f"  [{name}] already staged")
+        return 0
+    if start:
+        log(f"  [{name}] resuming at offset {start:,}")
+    total = 0
+    async for offset, records in client.pages(url, params, batch=batch, start=start, label=name):
+        if cache is not None and records:
+            await asyncio.to_thread(cache.write, offset // batch, records)
+        await writer.page(name, offset + len(records), records)
+        total += len(records)
+        log(f"  [{name}] offset {offset:,}: {len(records):,} records staged")
+    await writer.finish(name)
+    return total
+
+
+def staged(path, name):
+    """The finished staging table of `name`: its rows, :updated_at
+    watermark and when it was staged, or None."""
+    try:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return None
+    try:
+        state = _state(db, name)
+    finally:
+        db.close()
+    if not state or state['staged_at'] is None:
+        return None
+    return {'rows': state['staged_rows'], 'watermark': state['staged_watermark'],
+            'staged_at': state['staged_at']}
+
+
+def staged_rows(path, name):
+    """Every row of `name`'s finished staging table, in pull order."""
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        yield from db.execute(f"SELECT * FROM {_table(name)} ORDER BY rowid")
+    finally:
+        db.close()
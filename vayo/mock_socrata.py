@@ -0,0 +1,534 @@
+"""
+Local stand-in for the Socrata API, for exercising and benchmarking the
+pullers without touching data.cityofnewyork.us.
+
+    python3 -m vayo.mock_socrata --port 8765 --rows 200000 --throttle 0.02
+    SOCRATA_BASE=http://127.0.0.1:8765 python3 scripts/pull_datasets.py rolling_sales
+
+    with MockSocrata(rows=50_000, latency=0.01) as server:   # in-process
+        os.environ['SOCRATA_BASE'] = server.url
+        ...
+        server.faults.update(outage_after=20)
+
+It serves GET /resource/<id>.json for any dataset id. A dataset is either
+recorded (the records of a BatchCache directory, e.g. data_cache/
+hpd_violations) or synthetic: `rows` rows whose values are generated from
+the column name, so any $select works. Synthetic values are deterministic
+per (dataset, column), ACRIS document_ids line up across master, legals
+and parties, and the key spaces are skewed the way the real ones are.
+
+The query subset is what the pullers send:
+
+    $select   columns, or count(*) [AS n]; all columns when absent
+    $where    = != <> < <= > >= IS [NOT] NULL IN (...) AND OR NOT ( )
+    $order    col [ASC|DESC], ...; ties break on row order, like :id
+    $limit, $offset
+
+Values compare as strings, or as numbers against a numeric literal, and a
+trailing Z on a timestamp is ignored, as the pullers' :updated_at
+watermarks need. Anything else is a 400 with Socrata's error shape.
+
+Faults are injected per request, in this order: `latency` seconds of
+delay, an outage (every request after the first `outage_after` is a 503
+until the faults are cleared), `throttle` (fraction of 429s, with a
+Retry-After of `retry_after` seconds), `errors` (fraction of 503s) and
+`truncate` (fraction of responses cut off half way). `stats` counts what
+was served.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+from .batchcache import BatchCache
+
+ROWS = 100_000
+PORT = 8765
+QUERY_CACHE = 64             # filtered + ordered row lists kept per dataset
+
+# Columns returned when a synthetic dataset is read without a $select.
+SCHEMAS = {
+    'bnx9-e6tj': ['document_id', 'doc_type', 'document_date', 'document_amt',
+                  'recorded_datetime'],                                      # ACRIS master
+    '8h5j-fqxa': ['document_id', 'borough', 'block', 'lot', 'unit',
+                  'good_through_date'],                                      # ACRIS legals
+    '636b-3b5g': ['document_id', 'party_type', 'name', 'good_through_date'],  # ACRIS parties
+    'w9ak-ipjd': ['job_filing_number', 'bbl', 'bin', 'borough', 'block', 'lot',
+                  'house_no', 'street_name', 'job_type', 'filing_status',
+                  'initial_cost', 'existing_dwelling_units', 'proposed_dwelling_units',
+                  'filing_date', 'current_status_date'],                     # DOB NOW
+    'ic3t-wcy2': ['job__', 'borough', 'block', 'lot', 'job_type', 'job_description',
+                  'job_status', 'latest_action_date', 'initial_cost',
+                  'existing_dwelling_units', 'proposed_dwelling_units'],     # DOB legacy
+}
+DEFAULT_SCHEMA = ['name', 'borough', 'block', 'lot', 'created_date']
+
+# Rows per document_id, so legals and parties join to master.
+DOC_MULTIPLICITY = {'8h5j-fqxa': 1, '636b-3b5g': 2}
+
+BOROUGH_WEIGHTS = [24, 11, 33, 31, 1]
+DOC_TYPES = ['DEED', 'MTGE', 'SAT', 'AGMT', 'LPNS', 'AL&R', 'ASST', 'RPTT', 'MISC']
+WORDS = ['MAIN', 'PARK', 'OCEAN', 'BROADWAY', 'ELM', 'HILL', 'RIVER', 'GRAND', 'KINGS']
+EPOCH = datetime(2000, 1, 1)
+DAYS = 9650                  # through mid-2026
+
+
+class SoQLError(ValueError):
+    """A query the stand-in can't (or Socrata wouldn't) answer."""
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Datasets
+# ══════════════════════════════════════════════════════════════════════════
+
+def document_id(k):
+    """The k-th ACRIS document id: mostly dated numeric ids, then FT_ and
+    BK_ ids, so a document_id range split has real skew to deal with."""
+    c = (k * 7919) % 100
+    if c < 60:
+        return f"{2000 + k % 26:04d}{(k * 31) % 12 + 1:02d}{(k * 17) % 28 + 1:02d}{k:08d}"
+    if c < 95:
+        return f"FT_{1 + k % 4}{k:011d}"
+    return f"BK_{k:013d}"
+
+
+def _timestamp(rng, first=0):
+    ts = EPOCH + timedelta(days=rng.randrange(first, DAYS), seconds=rng.randrange(86400))
+    return ts.strftime('%Y-%m-%dT%H:%M:%S.000')
+
+
+class SyntheticDataset:
+    """`rows` generated rows; each column is built on first use."""
+
+    def __init__(self, resource, rows=ROWS):
+        self.resource = resource
+        self.rows = rows
+        self.schema = SCHEMAS.get(resource, DEFAULT_SCHEMA)
+        self._columns = {}
+        self.queries = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self._generate(name)
+        return self._columns[name]
+
+    def _generate(self, name):
+        n = self.rows
+        rng = random.Random(f"{self.resource}/{name}")
+        if name == ':id':
+            return [f"row-{i:09d}" for i in range(n)]
+        if name == ':updated_at':
+            return [_timestamp(rng, first=DAYS - 2000) for _ in range(n)]
+        if name == 'document_id':
+            per = DOC_MULTIPLICITY.get(self.resource, 1)
+            return [document_id(i // per) for i in range(n)]
+        if name in ('borough', 'boroid', 'boro'):
+            return [str(b) for b in rng.choices(range(1, 6), BOROUGH_WEIGHTS, k=n)]
+        if name == 'block':
+            return [str(rng.randint(1, 2000)) for _ in range(n)]
+        if name == 'lot':
+            return [str(rng.choice((rng.randint(1, 150), rng.randint(1001, 1060))))
+                    for _ in range(n)]
+        if name == 'bbl':
+            boro, block, lot = self.column('borough'), self.column('block'), self.column('lot')
+            return [f"{b}{int(bl):05d}{int(lt):04d}" for b, bl, lt in zip(boro, block, lot)]
+        if name == 'doc_type':
+            return rng.choices(DOC_TYPES, [30, 30, 15, 5, 3, 5, 5, 4, 3], k=n)
+        if name == 'party_type':
+            return [str(1 + i % 2) for i in range(n)]
+        if name.endswith(('date', 'datetime')):
+            return [None if rng.random() < 0.05 else _timestamp(rng) for _ in range(n)]
+        if name in ('latitude', 'gtfs_latitude'):
+            return [f"{40.5 + rng.random() * 0.4:.6f}" for _ in range(n)]
+        if name in ('longitude', 'gtfs_longitude'):
+            return [f"{-74.25 + rng.random() * 0.55:.6f}" for _ in range(n)]
+        if name.endswith('units'):
+            return [str(rng.randint(0, 400)) for _ in range(n)]
+        if name.endswith(('amt', 'amount', 'price', 'cost', 'feet')):
+            return [str(rng.randint(0, 2_000_000)) for _ in range(n)]
+        if name.endswith(('id', 'number', '__', 'bin')) or name == 'cycle':
+            return [str(1_000_000 + i) for i in range(n)]
+        if name in ('unit', 'apartment'):
+            return [None if rng.random() < 0.5 else f"{rng.randint(1, 30)}{rng.choice('ABCDEF')}"
+                    for _ in range(n)]
+        if name.startswith(('zip', 'year')):
+            lo, hi = (10001, 11697) if name.startswith('zip') else (1850, 2024)
+            return [str(rng.randint(lo, hi)) for _ in range(n)]
+        if name in ('name', 'address', 'street_name', 'stop_name', 'house_no', 'house_number'):
+            return [f"{rng.randint(1, 999)} {rng.choice(WORDS)}" for _ in range(n)]
+        return [f"{name.upper()}_{rng.randint(1, 8)}" for _ in range(n)]
+
+
+class RecordedDataset(SyntheticDataset):
+    """The records of a BatchCache directory. Columns the records don't
+    carry are null, except :id and :updated_at, which are synthesized if
+    missing."""
+
+    def __init__(self, resource, path):
+        records = list(BatchCache(path))
+        super().__init__(resource, len(records))
+        self.records = records
+        self.schema = sorted({k for r in records for k in r if not k.startswith(':')})
+
+    def _generate(self, name):
+        if name in (':id', ':updated_at') and self.records and name not in self.records[0]:
+            return super()._generate(name)
+        return [r.get(name) for r in self.records]
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Queries
+# ══════════════════════════════════════════════════════════════════════════
+
+_TOKEN = re.compile(r"""\s*(?:
+      (?P<str>'(?:[^']|'')*')
+    | (?P<num>-?\d+(?:\.\d+)?)
+    | (?P<op><>|!=|<=|>=|=|<|>|\(|\)|,|\*)
+    | (?P<word>:?[A-Za-z_][A-Za-z0-9_]*)
+)""", re.X)
+
+
+def _tokens(text):
+    pos, out = 0, []
+    text = text.strip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m or m.end() == pos:
+            raise SoQLError(f"could not parse at: {text[pos:pos + 40]!r}")
+        kind = m.lastgroup
+        val = m.group(kind)
+        if kind == 'str':
+            val = val[1:-1].replace("''", "'")
+        elif kind == 'word' and val.upper() in ('AND', 'OR', 'NOT', 'IS', 'NULL', 'IN'):
+            kind, val = 'kw', val.upper()
+        out.append((kind, val))
+        pos = m.end()
+    return out
+
+
+def _comparable(v):
+    # '2024-03-05T17:20:11.000Z' and '2024-03-05T17:20:11.000' are one instant.
+    if len(v) >= 19 and v[10:11] == 'T' and v.endswith('Z'):
+        return v[:-1]
+    return v
+
+
+def _compare(op, value, literal):
+    if value is None:
+        return False
+    if isinstance(literal, float):
+        try:
+            a = float(value)
+        except ValueError:
+            return False
+        b = literal
+    else:
+        a, b = _comparable(str(value)), _comparable(literal)
+    return {'=': a == b, '!=': a != b, '<>': a != b, '<': a < b,
+            '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+
+
+class _Where:
+    """Recursive-descent parser turning a $where into a predicate over row
+    indexes of a dataset."""
+
+    def __init__(self, text, dataset):
+        self.toks = _tokens(text)
+        self.pos = 0
+        self.ds = dataset
+
+    def parse(self):
+        pred = self.expr()
+        if self.pos != len(self.toks):
+            raise SoQLError(f"unexpected {self.toks[self.pos][1]!r}")
+        return pred
+
+    def peek(self, *values):
+        return self.pos < len(self.toks) and self.toks[self.pos][1] in values
+
+    def take(self, kind=None):
+        if self.pos >= len(self.toks):
+            raise SoQLError("unexpected end of $where")
+        tok = self.toks[self.pos]
+        if kind and tok[0] != kind:
+            raise SoQLError(f"expected {kind}, got {tok[1]!r}")
+        self.pos += 1
+        return tok
+
+    def expr(self):
+        terms = [self.term()]
+        while self.peek('OR'):
+            self.take()
+            terms.append(self.term())
+        return terms[0] if len(terms) == 1 else (lambda i: any(t(i) for t in terms))
+
+    def term(self):
+        factors = [self.factor()]
+        while self.peek('AND'):
+            self.take()
+            factors.append(self.factor())
+        return factors[0] if len(factors) == 1 else (lambda i: all(f(i) for f in factors))
+
+    def factor(self):
+        if self.peek('NOT'):
+            self.take()
+            inner = self.factor()
+            return lambda i: not inner(i)
+        if self.peek('('):
+            self.take()
+            inner = self.expr()
+            if self.take()[1] != ')':
+                raise SoQLError("missing )")
+            return inner
+        col = self.ds.column(self.take('word')[1])
+        if self.peek('IS'):
+            self.take()
+            negate = self.peek('NOT') and self.take()
+            if self.take('kw')[1] != 'NULL':
+                raise SoQLError("expected NULL")
+            return (lambda i: col[i] is not None) if negate else (lambda i: col[i] is None)
+        if self.peek('IN'):
+            self.take()
+            if self.take()[1] != '(':
+                raise SoQLError("expected ( after IN")
+            values = [self.literal()]
+            while self.peek(','):
+                self.take()
+                values.append(self.literal())
+            if self.take()[1] != ')':
+                raise SoQLError("missing ) after IN list")
+            return lambda i: any(_compare('=', col[i], v) for v in values)
+        op = self.take('op')[1]
+        if op not in ('=', '!=', '<>', '<', '<=', '>', '>='):
+            raise SoQLError(f"unsupported operator {op!r}")
+        lit = self.literal()
+        return lambda i: _compare(op, col[i], lit)
+
+    def literal(self):
+        kind, val = self.take()
+        if kind == 'str':
+            return val
+        if kind == 'num':
+            return float(val)
+        raise SoQLError(f"expected a literal, got {val!r}")
+
+
+def _order_key(v):
+    return (v is None, _comparable(v) if isinstance(v, str) else v)
+
+
+def _parse_order(text):
+    order = []
+    for part in text.split(','):
+        words = part.split()
+        if not words or len(words) > 2 or (len(words) == 2 and words[1].upper() not in ('ASC', 'DESC')):
+            raise SoQLError(f"bad $order term {part.strip()!r}")
+        order.append((words[0], len(words) == 2 and words[1].upper() == 'DESC'))
+    return order
+
+
+def _parse_select(text, schema):
+    if not text or text.strip() == '*':
+        return schema, None
+    text = text.strip()
+    m = re.fullmatch(r'count\(\s*\*\s*\)(?:\s+AS\s+(\w+))?', text, re.I)
+    if m:
+        return None, m.group(1) or 'count'
+    cols = [c.strip() for c in text.split(',')]
+    if not all(re.fullmatch(r':?[A-Za-z_][A-Za-z0-9_]*', c) for c in cols):
+        raise SoQLError(f"unsupported $select {text!r}")
+    return cols, None
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, default))
+    except ValueError:
+        raise SoQLError(f"{name} must be an integer")
+
+
+def query(dataset, params):
+    """The records a Socrata query of `dataset` returns."""
+    cols, count_as = _parse_select(params.get('$select'), dataset.schema)
+    where, order = params.get('$where') or '', params.get('$order') or ''
+    key = (where, order if count_as is None else '')
+    rows = dataset.queries.get(key)
+    if rows is None:
+        rows = range(dataset.rows)
+        if where:
+            pred = _Where(where, dataset).parse()
+            rows = [i for i in rows if pred(i)]
+        rows = list(rows)
+        if order and count_as is None:
+            for name, desc in reversed(_parse_order(order)):
+                col = dataset.column(name)
+                rows.sort(key=lambda i: _order_key(col[i]), reverse=desc)
+        if len(dataset.queries) >= QUERY_CACHE:
+            dataset.queries.pop(next(iter(dataset.queries)))
+        dataset.queries[key] = rows
+    if count_as is not None:
+        return [{count_as: str(len(rows))}]
+    offset = _int_param(params, '$offset', 0)
+    limit = _int_param(params, '$limit', 1000)
+    columns = [(c, dataset.column(c)) for c in cols]
+    out = []
+    for i in rows[offset:offset + limit]:
+        rec = {}
+        for name, col in columns:
+            v = col[i]
+            if v is not None:
+                rec[name] = v + 'Z' if name == ':updated_at' and not v.endswith('Z') else v
+        out.append(rec)
+    return out
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Server
+# ══════════════════════════════════════════════════════════════════════════
+
+FAULTS = {'latency': 0.0, 'outage_after': None, 'throttle': 0.0,
+          'retry_after': 1.0, 'errors': 0.0, 'truncate': 0.0}
+
+
+def new_stats():
+    return {'requests': 0, 'ok': 0, 'rows': 0, 'bytes': 0, 'throttled': 0,
+            'errors': 0, 'truncated': 0, 'bad_queries': 0}
+
+
+class MockSocrata:
+    """The stand-in server, run on its own thread. `datasets` maps dataset
+    ids to datasets; any other id is synthesized with `rows` rows."""
+
+    def __init__(self, datasets=None, rows=ROWS, host='127.0.0.1', port=0, seed=0, **faults):
+        self.datasets = dict(datasets or {})
+        self.rows = rows
+        self.host = host
+        self.port = port
+        self.faults = {**FAULTS, **faults}
+        self.stats = new_stats()
+        self.url = None
+        self._rng = random.Random(seed)
+
+    def dataset(self, resource):
+        if resource not in self.datasets:
+            self.datasets[resource] = SyntheticDataset(resource, self.rows)
+        return self.datasets[resource]
+
+    def expected(self, url, params):
+        """What a query of `url` returns, unpaged: the reference a pull's
+        output is checked against."""
+        resource = url.rsplit('/', 1)[-1].removesuffix('.json')
+        return query(self.dataset(resource), {**params, '$limit': self.dataset(resource).rows})
+
+    def clear_faults(self):
+        self.faults = dict(FAULTS)
+
+    def reset_stats(self):
+        self.stats = new_stats()
+
+    async def handle(self, request):
+        faults, stats = self.faults, self.stats
+        stats['requests'] += 1
+        if faults['latency']:
+            await asyncio.sleep(faults['latency'])
+        if faults['outage_after'] is not None and stats['requests'] > faults['outage_after']:
+            stats['errors'] += 1
+            return web.json_response({'error': True, 'message': 'outage'}, status=503)
+        roll = self._rng.random()
+        if roll < faults['throttle']:
+            stats['throttled'] += 1
+            return web.json_response({'error': True, 'message': 'Too Many Requests'}, status=429,
+                                     headers={'Retry-After': str(faults['retry_after'])})
+        roll -= faults['throttle']
+        if roll < faults['errors']:
+            stats['errors'] += 1
+            return web.json_response({'error': True, 'message': 'unavailable'}, status=503)
+        roll -= faults['errors']
+
+        try:
+            records = query(self.dataset(request.match_info['resource']), request.query)
+        except SoQLError as e:
+            stats['bad_queries'] += 1
+            return web.json_response({'error': True, 'code': 'query.compiler.malformed',
+                                      'message': str(e)}, status=400)
+        body = json.dumps(records).encode()
+
+        if roll < faults['truncate']:
+            stats['truncated'] += 1
+            resp = web.StreamResponse(headers={'Content-Type': 'application/json'})
+            resp.content_length = len(body)
+            await resp.prepare(request)
+            await resp.write(body[:len(body) // 2])
+            request.transport.close()
+            return resp
+
+        stats['ok'] += 1
+        stats['rows'] += len(records)
+        stats['bytes'] += len(body)
+        resp = web.Response(body=body, content_type='application/json')
+        resp.enable_compression()
+        return resp
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/resource/{resource}.json', self.handle)
+        return app
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        self.url = f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Socrata stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--rows', type=int, default=ROWS, help="rows per synthetic dataset")
+    parser.add_argument('--record', action='append', default=[], metavar='ID=DIR',
+                        help="serve dataset ID from the BatchCache in DIR")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--throttle', type=float, default=0.0, help="fraction of 429s")
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--errors', type=float, default=0.0, help="fraction of 503s")
+    parser.add_argument('--truncate', type=float, default=0.0, help="fraction of cut-off bodies")
+    args = parser.parse_args()
+
+    datasets = {}
+    for spec in args.record:
+        resource, _, path = spec.partition('=')
+        datasets[resource] = RecordedDataset(resource, path)
+        print(f"  {resource}: {datasets[resource].rows:,} recorded rows from {path}")
+
+    server = MockSocrata(datasets, rows=args.rows, host=args.host, port=args.port,
+                         latency=args.latency, throttle=args.throttle,
+                         retry_after=args.retry_after, errors=args.errors,
+                         truncate=args.truncate)
+    web.run_app(server.app(), host=args.host, port=args.port, access_log=None,
+                print=lambda _: print(f"  serving on http://{args.host}:{args.port}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Adaptive key-range partitioning of a Socrata dataset for parallel pulls.
+
+    chunks = await plan(client, url, 'document_id', seeds, target=1_000_000)
+    results = await drain(chunks, pull_chunk, workers=6)
+
+plan() cuts each seed (a $where filter, e.g. one borough, or None for the
+whole dataset) into ranges of the key column holding at most `target` rows.
+It probes count(*) over a range and, while a range holds too many rows,
+splits it at a key midway between its bounds and counts the left half (the
+right half is the difference). Skewed key spaces simply recurse deeper on
+the heavy side. Neighbouring ranges whose rows fit in one chunk are merged
+back afterwards, so empty stretches of key space don't become chunks of
+their own. A seed's chunks always tile its whole key range, whatever the
+counts said, so rows added upstream after planning still land in a chunk.
+
+Chunks are plain dicts, JSON-safe so a pull can save its plan and resume
+against the same chunk names:
+
+    {'name': 'boro_1_003', 'where': "(borough='1') AND document_id>='2009' AND ...",
+     'lo': '2009', 'hi': '2012', 'count': 812_004}
+
+drain() runs them through `workers` coroutines sharing one queue, largest
+first: each worker takes the next chunk as soon as it finishes one, so the
+pull ends with every worker on a small chunk rather than one worker on a
+giant partition.
+"""
+
+import asyncio
+import json
+from bisect import bisect_left
+from pathlib import Path
+
+# Sorted as ASCII, so a key built from these compares the same on the server.
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_'
+BASE = len(ALPHABET)
+MAX_WIDTH = 32           # longest split key tried before a range counts as unsplittable
+TARGET = 1_000_000       # rows per chunk
+
+
+def _code(key, width):
+    """`key` as a base-BASE number of `width` digits (characters outside the
+    alphabet are rounded to their neighbour; only the split quality suffers)."""
+    n = 0
+    for ch in key.ljust(width, ALPHABET[0])[:width]:
+        n = n * BASE + min(bisect_left(ALPHABET, ch), BASE - 1)
+    return n
+
+
+def _key(n, width):
+    chars = []
+    for _ in range(width):
+        n, d = divmod(n, BASE)
+        chars.append(ALPHABET[d])
+    return ''.join(reversed(chars))
+
+
+def midpoint(lo, hi):
+    """A key strictly between `lo` and `hi` (None: unbounded), or None when
+    there is no room left."""
+    for width in range(max(len(lo), len(hi or ''), 1), MAX_WIDTH + 1):
+        a = _code(lo, width)
+        b = BASE ** width if hi is None else _code(hi, width)
+        if b - a < 2:
+            continue
+        mid = _key((a + b) // 2, width)
+        if lo < mid and (hi is None or mid < hi):
+            return mid
+    return None
+
+
+def _quote(s):
+    return "'" + s.replace("'", "''") + "'"
+
+
+def range_where(where, key, lo, hi):
+    """SoQL filter for `where` restricted to lo <= key < hi."""
+    clauses = [f"({where})"] if where else []
+    if lo:
+        clauses.append(f"{key}>={_quote(lo)}")
+    if hi is not None:
+        clauses.append(f"{key}<{_quote(hi)}")
+    return ' AND '.join(clauses) or None
+
+
+def _merge(ranges, target):
+    """Join neighbouring (lo, hi, count) ranges while they fit in `target`."""
+    out = []
+    for lo, hi, n in ranges:
+        if out and out[-1][2] + n <= target:
+            out[-1] = (out[-1][0], hi, out[-1][2] + n)
+        else:
+            out.append((lo, hi, n))
+    return out
+
+
+async def plan(client, url, key, seeds, target=TARGET, log=print):
+    """Chunks of at most ~`target` rows covering every seed, in key order.
+    `seeds` is a list of {'name', 'where'} dicts."""
+
+    async def split(where, lo, hi, n):
+        if n <= target:
+            return [(lo, hi, n)]
+        mid = midpoint(lo, hi)
+        if mid is None:
+            return [(lo, hi, n)]
+        left = await client.count(url, range_where(where, key, lo, mid))
+        halves = await asyncio.gather(split(where, lo, mid, left),
+                                      split(where, mid, hi, max(0, n - left)))
+        return halves[0] + halves[1]
+
+    async def plan_seed(seed):
+        n = await client.count(url, seed['where'])
+        ranges = _merge(await split(seed['where'], '', None, n), target)
+        log(f"  [{seed['name']}] {n:,} rows → {len(ranges)} chunks")
+        return [{'name': f"{seed['name']}_{i:03d}",
+                 'where': range_where(seed['where'], key, lo, hi),
+                 'lo': lo, 'hi': hi, 'count': count}
+                for i, (lo, hi, count) in enumerate(ranges)]
+
+    per_seed = await asyncio.gather(*(plan_seed(s) for s in seeds))
+    return [chunk for chunks in per_seed for chunk in chunks]
+
+
+async def drain(chunks, work, workers):
+    """Run `await work(chunk)` for every chunk on `workers` coroutines,
+    largest chunk first. Returns {name: result}; a chunk whose work raised
+    maps to the exception, as with gather(return_exceptions=True)."""
+    queue = asyncio.Queue()
+    for chunk in sorted(chunks, key=lambda c: -c['count']):
+        queue.put_nowait(chunk)
+    results = {}
+
+    async def worker():
+        while not queue.empty():
+            chunk = queue.get_nowait()
+            try:
+                results[chunk['name']] = await work(chunk)
+            except Exception as e:
+                results[chunk['name']] = e
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return results
+
+
+def load_plan(path):
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_plan(path, chunks):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(chunks, fh, indent=1)
+    tmp.replace(path)
@@ -0,0 +1,193 @@
+"""
+The building_scores table: schema, writes, and versioning.
+
+building_scores carries copies of borough / zipcode / units_residential
+from buildings so the explorer's filter + sort combinations can be served
+straight off composite indexes on building_scores, without first joining
+every candidate row to buildings. bbl is the INTEGER PRIMARY KEY (the
+rowid), so every index below already ends in bbl and doubles as the
+(sort column, bbl) keyset index.
+
+Every write appends a row to score_runs. Its run_id is the "scores
+version" readers key caches on (the API's cached result counts). The run
+also records the feature cutoff and per-table rowid high-water marks it
+scored from, which is what incremental runs diff against, and each
+building whose scores changed gets a row in building_scores_history.
+"""
+
+import json
+import sqlite3
+from datetime import datetime
+
+SCORE_SORTS = ('gem_score', 'avail_score', 'combined')
+
+# Parts of the feature-build meta a run keeps, for incremental diffs
+# ('lifts': version of the lift weights scored with, if the caller adds it).
+RUN_FEATURE_KEYS = ('cutoff', 'dob_cutoff', 'source', 'lifts')
+
+SCORE_COLUMNS = [
+    'bbl', 'gem_score', 'avail_score', 'combined', 'signal_count',
+    'convergence', 'rent_stabilized', 'stab_units', 'signals',
+    'complaints_per_unit', 'units_traded', 'turnover_pct',
+    'last_sale_date', 'last_sale_amt',
+    'borough', 'zipcode', 'units_residential',
+]
+
+# Denormalized from buildings; backfilled when added to an older table.
+_BUILDING_COLUMNS = [
+    ('borough', 'TEXT'),
+    ('zipcode', 'TEXT'),
+    ('units_residential', 'INTEGER'),
+]
+
+
+def ensure_scores_table(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS building_scores (
+            bbl INTEGER PRIMARY KEY,
+            gem_score INTEGER NOT NULL,
+            avail_score INTEGER NOT NULL,
+            combined INTEGER NOT NULL,
+            signal_count INTEGER NOT NULL,
+            convergence TEXT,
+            rent_stabilized INTEGER NOT NULL DEFAULT 0,
+            stab_units INTEGER NOT NULL DEFAULT 0,
+            signals TEXT,
+            complaints_per_unit REAL,
+            units_traded INTEGER,
+            turnover_pct REAL,
+            last_sale_date TEXT,
+            last_sale_amt REAL,
+            scored_at TEXT DEFAULT (datetime('now')),
+            borough TEXT,
+            zipcode TEXT,
+            units_residential INTEGER
+        )
+    """)
+    have = {r[1] for r in db.execute("PRAGMA table_info(building_scores)")}
+    for name, typ in _BUILDING_COLUMNS:
+        if name not in have:
+            db.execute(f"ALTER TABLE building_scores ADD COLUMN {name} {typ}")
+            db.execute(f"""
+                UPDATE building_scores SET {name} =
+                    (SELECT b.{name} FROM buildings b WHERE b.bbl = building_scores.bbl)
+            """)
+
+    db.execute("CREATE INDEX IF NOT EXISTS idx_scores_rs ON building_scores(rent_stabilized)")
+    for col in SCORE_SORTS:
+        short = col.split('_')[0]
+        db.execute(f"CREATE INDEX IF NOT EXISTS idx_scores_{short} ON building_scores({col})")
+        db.execute(f"CREATE INDEX IF NOT EXISTS idx_scores_boro_{short} ON building_scores(borough, {col})")
+        db.execute(f"CREATE INDEX IF NOT EXISTS idx_scores_zip_{short} ON building_scores(zipcode, {col})")
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS score_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            finished_at TEXT NOT NULL,
+            rows_written INTEGER NOT NULL,
+            scope TEXT,
+            mode TEXT,
+            features TEXT
+        )
+    """)
+    have = {r[1] for r in db.execute("PRAGMA table_info(score_runs)")}
+    for name in ('mode', 'features'):
+        if name not in have:
+            db.execute(f"ALTER TABLE score_runs ADD COLUMN {name} TEXT")
+
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS building_scores_history (
+            bbl INTEGER NOT NULL,
+            run_id INTEGER NOT NULL,
+            scored_at TEXT NOT NULL,
+            gem_score INTEGER NOT NULL,
+            avail_score INTEGER NOT NULL,
+            combined INTEGER NOT NULL,
+            signal_count INTEGER NOT NULL,
+            convergence TEXT,
+            PRIMARY KEY (bbl, run_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def write_scores(db, scored, scope=None, features=None, mode='full'):
+    """INSERT OR REPLACE scored buildings and record the run.
+
+    `scored` holds apartment_finder-style result dicts; `features` is the
+    meta of the feature build they were scored from. Buildings that are new
+    or whose scores moved are appended to building_scores_history.
+    Returns the run_id.
+    """
+    ensure_scores_table(db)
+    now = datetime.now().isoformat(timespec='seconds')
+    run_id = db.execute(
+        "INSERT INTO score_runs (finished_at, rows_written, scope, mode, features) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [now, len(scored), scope, mode,
+         json.dumps({k: features.get(k) for k in RUN_FEATURE_KEYS}) if features else None],
+    ).lastrowid
+
+    batch = []
+    for s in scored:
+        batch.append((
+            s['bbl'], s['gem_score'], s['avail_score'], s['combined'],
+            s['signal_count'], s['convergence'],
+            1 if s['rent_stabilized'] else 0,
+            s.get('stab_units', 0),
+            json.dumps(s['signals']) if s['signals'] else None,
+            s.get('complaints_per_unit', 0),
+            s.get('units_traded', 0),
+            s.get('turnover_pct', 0),
+            s.get('last_sale_date'),
+            s.get('last_sale_amt', 0),
+            s.get('borough'),
+            s.get('zip'),
+            s.get('units'),
+        ))
+
+    db.execute("DROP TABLE IF EXISTS temp._new_scores")
+    db.execute("CREATE TEMP TABLE _new_scores AS SELECT * FROM building_scores WHERE 0")
+    db.executemany(f"""
+        INSERT INTO temp._new_scores ({', '.join(SCORE_COLUMNS)}, scored_at)
+        VALUES ({', '.join('?' * len(SCORE_COLUMNS))}, ?)
+    """, [row + (now,) for row in batch])
+
+    db.execute("""
+        INSERT OR REPLACE INTO building_scores_history
+        SELECT n.bbl, ?, n.scored_at, n.gem_score, n.avail_score, n.combined,
+               n.signal_count, n.convergence
+        FROM temp._new_scores n
+        LEFT JOIN building_scores s ON s.bbl = n.bbl
+        WHERE s.bbl IS NULL
+           OR s.gem_score != n.gem_score OR s.avail_score != n.avail_score
+           OR s.signal_count != n.signal_count
+    """, [run_id])
+    db.execute(f"""
+        INSERT OR REPLACE INTO building_scores ({', '.join(SCORE_COLUMNS)}, scored_at)
+        SELECT {', '.join(SCORE_COLUMNS)}, scored_at FROM temp._new_scores
+    """)
+    db.execute("DROP TABLE temp._new_scores")
+    db.commit()
+    return run_id
+
+
+def last_run(db, scope):
+    """Feature meta of the latest run over `scope`, or None if there is no
+    run with recorded features to diff against."""
+    try:
+        row = db.execute(
+            "SELECT features FROM score_runs WHERE scope = ? AND features IS NOT NULL "
+            "ORDER BY run_id DESC LIMIT 1", [scope],
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def scores_version(db):
+    """Latest score run id, or None for databases scored before score_runs."""
+    try:
+        row = db.execute("SELECT MAX(run_id) FROM score_runs").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0]
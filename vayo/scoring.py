@@ -0,0 +1,485 @@
+"""
+Vectorized Gem / Availability scoring over feature-store columns.
+
+score() takes per-BBL feature arrays (see vayo.features) and returns score
+arrays. Thresholds become np.select / np.digitize lookups, the availability
+signals become an (n × 8) lift matrix, and "sum of the three strongest
+lifts" is a sort along axis 1. It produces exactly the numbers the
+per-building loop in apartment_finder produced, including float rounding.
+
+Human-readable signal lists are only built on request (signals_for), one
+building at a time, since most callers only need them for the rows they
+display or store.
+
+Every consumer (apartment_finder, concierge, the API) goes through one of
+three entry points, which differ only in how features are loaded:
+
+    score_all(db)         batch: every BBL, from the saved feature snapshot
+    score_bbls(db, bbls)  targeted: aggregates just those BBLs
+    score_one(db, bbl)    one building, LRU-cached per database version
+    score_sharded(path)   batch across worker processes, one BBL range each
+
+results() turns score() output into the per-building dicts they print,
+store and serve.
+
+Signal lifts come from the backtest's lift table (signal_lifts.json, see
+vayo.backtest) when there is one, per kind, falling back to the LIFTS
+defaults for any kind the table doesn't cover. Every entry point also
+takes an explicit `lifts` mapping.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .backtest import LIFT_TABLE, lift_lookup, load_lift_table
+from .features import (FeatureStore, build_features, default_cutoff, ensure_features,
+                       int_to_iso, source_version)
+
+# ── Gem thresholds ───────────────────────────────────────────────────────
+
+SQFT_BINS = [600, 800, 1000, 1200, 1500, 2000]
+SQFT_POINTS = np.array([0, 5, 10, 15, 18, 22, 25])
+
+# ── Availability signals ─────────────────────────────────────────────────
+# One slot per signal category, in the order signals are listed. Each slot
+# has a "kind" per building (0 = not firing) and a lift per kind.
+
+SLOTS = ['permit', 'litigation', 'distress', 'eviction', 'ecb',
+         'agreement', 'satisfaction', 'owner']
+
+LIFTS = {
+    'permit': [0.0, 17.7, 10.2, 10.5, 16.4, 8.0],
+    'litigation': [0.0, 8.3, 6.4, 6.4],
+    'distress': [0.0, 7.9, 7.6],
+    'eviction': [0.0, 6.3],
+    'ecb': [0.0, 5.0],
+    'agreement': [0.0, 4.1],
+    'satisfaction': [0.0, 3.0],
+    'owner': [0.0, 3.3],
+}
+
+# The backtest signal (vayo.backtest.SIGNALS) measuring each kind's lift.
+KIND_SIGNALS = {
+    'permit': [None, 'permit_200k', 'permit_50k', 'permit_under_10k',
+               'permit_alteration', 'permit'],
+    'litigation': [None, 'litigation_tenant_action', 'litigation_typed', 'litigation'],
+    'distress': [None, 'distress_311_heavy', 'distress_311'],
+    'eviction': [None, 'eviction'],
+    'ecb': [None, 'ecb_unpaid'],
+    'agreement': [None, 'acris_agreement'],
+    'satisfaction': [None, 'mortgage_satisfaction'],
+    'owner': [None, 'owner_change'],
+}
+LIFT_WINDOW = 12    # months; the availability horizon the scores stand for
+LIFT_MIN_BBLS = 100  # fewer signal buildings than this and the measured lift is noise
+
+CONVERGENCE = ['none', 'single', 'moderate', 'strong']
+MULTIPLIERS = np.array([1.0, 1.0, 1.2, 1.5])
+
+FEATURES = [
+    'units', 'avg_sqft', 'year_built', 'num_floors',
+    'complaints_total', 'complaints_recent', 'noise_total', 'distress_recent',
+    'stab_units', 'agreements', 'satisfactions',
+    'permit_count', 'permit_max_cost', 'permit_has_alteration',
+    'lit_count', 'lit_types', 'ecb_unpaid', 'evictions_recent', 'owner_names',
+]
+
+
+def _per_unit(count, units):
+    out = np.zeros(len(units), dtype=np.float64)
+    np.divide(count, units, out=out, where=units > 0)
+    return out
+
+
+def lifts_from_table(table, window=LIFT_WINDOW):
+    """LIFTS-shaped mapping from a backtest lift table; kinds the table
+    has no lift for (or measured on too few buildings) keep their default."""
+    measured = lift_lookup(table, window, min_bbls=LIFT_MIN_BBLS) if table else {}
+    return {slot: [0.0] + [round(measured[name], 1) if name in measured else LIFTS[slot][k]
+                           for k, name in enumerate(KIND_SIGNALS[slot]) if k]
+            for slot in SLOTS}
+
+
+_lifts_cache = {}
+_lifts_lock = threading.Lock()
+
+
+def current_lifts(path=LIFT_TABLE):
+    """Lifts from the lift table at `path`, or LIFTS if there is none.
+    Re-read whenever the file changes."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return LIFTS
+    with _lifts_lock:
+        hit = _lifts_cache.get(str(path))
+        if hit and hit[0] == mtime:
+            return hit[1]
+    lifts = lifts_from_table(load_lift_table(path))
+    with _lifts_lock:
+        _lifts_cache[str(path)] = (mtime, lifts)
+    return lifts
+
+
+def lifts_version(lifts):
+    """Short hash of a lifts mapping, for cache keys and score run meta."""
+    return hashlib.sha1(json.dumps(lifts, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def score(cols, rows=None, lit_types=(), lifts=None):
+    """Score buildings.
+
+    cols: mapping of feature name → array (a FeatureStore's .cols works).
+    rows: optional row indices to score; all rows otherwise.
+    lit_types: the litigation case-type vocabulary the lit_types bitmask
+        refers to (FeatureStore.lit_vocab).
+    lifts: slot → per-kind lifts, like LIFTS; current_lifts() by default.
+
+    Returns a dict of arrays aligned with `rows`.
+    """
+    f = {name: np.asarray(cols[name] if rows is None else cols[name][rows])
+         for name in FEATURES}
+    units = f['units'].astype(np.float64)
+    sqft = f['avg_sqft'].astype(np.float64)
+
+    # ── Gem ──────────────────────────────────────────────────────────
+    gem = SQFT_POINTS[np.digitize(sqft, SQFT_BINS)].copy()
+
+    cpr = _per_unit(f['complaints_total'], units)
+    rcpr = _per_unit(f['complaints_recent'], units)
+    gem += np.select(
+        [cpr == 0, cpr < 1, cpr < 3, cpr < 5, cpr < 10], [25, 22, 18, 12, 5], 0)
+    gem += np.where(rcpr == 0, 5, 0)
+
+    npr = _per_unit(f['noise_total'], units)
+    gem += np.select([npr == 0, npr < 0.5, npr < 1], [15, 10, 5], 0)
+
+    yr = f['year_built']
+    gem += np.select([(yr >= 1880) & (yr <= 1945), yr >= 2015], [8, 6], 0)
+    gem += np.where((units >= 6) & (units <= 30), 4, 0)
+    gem += np.where(f['num_floors'] >= 6, 3, 0)
+
+    is_stab = f['stab_units'] > 0
+    gem += np.where(is_stab, 10, 0)
+    gem += np.where(is_stab & (sqft >= 1000), 5, 0)
+    gem = np.minimum(gem, 100)
+
+    # ── Availability ─────────────────────────────────────────────────
+    kinds = {}
+
+    pc, cost = f['permit_count'] > 0, f['permit_max_cost']
+    kinds['permit'] = np.select(
+        [pc & (cost >= 200000), pc & (cost >= 50000), pc & (cost < 10000) & (cost > 0),
+         pc & (f['permit_has_alteration'] > 0), pc],
+        [1, 2, 3, 4, 5], 0)
+
+    lc, types = f['lit_count'] > 0, f['lit_types'].astype(np.uint64)
+    tenant = np.zeros(len(types), dtype=bool)
+    if 'TENANT ACTION' in lit_types:
+        bit = np.uint64(1 << list(lit_types).index('TENANT ACTION'))
+        tenant = (types & bit) != 0
+    kinds['litigation'] = np.select([lc & tenant, lc & (types != 0), lc], [1, 2, 3], 0)
+
+    dc = f['distress_recent']
+    dpu = _per_unit(dc, units)
+    kinds['distress'] = np.select(
+        [(dc >= 5) & (dpu >= 0.1), (dc >= 3) & (dpu >= 0.05)], [1, 2], 0)
+
+    kinds['eviction'] = (f['evictions_recent'] > 0).astype(np.int8)
+    kinds['ecb'] = (f['ecb_unpaid'] > 0).astype(np.int8)
+    kinds['agreement'] = (f['agreements'] > 0).astype(np.int8)
+    kinds['satisfaction'] = (f['satisfactions'] > 0).astype(np.int8)
+    kinds['owner'] = (f['owner_names'] >= 2).astype(np.int8)
+
+    lifts = lifts or current_lifts()
+    lifts = np.column_stack([np.asarray(lifts[s])[kinds[s]] for s in SLOTS])
+    # Counted from the kinds, not the lifts: a measured lift can round to 0.0.
+    fired = np.column_stack([kinds[s] for s in SLOTS])
+    signal_count = (fired != 0).sum(axis=1)
+
+    # Three strongest lifts, added strongest first (same float result as
+    # summing a descending-sorted list).
+    top = np.sort(lifts, axis=1)[:, ::-1]
+    raw_lift = top[:, 0] + top[:, 1] + top[:, 2]
+
+    convergence = np.minimum(signal_count, 3)
+    multiplier = MULTIPLIERS[convergence]
+    avail = np.minimum(100, np.round((raw_lift * multiplier / 50) * 100)).astype(np.int64)
+
+    return {
+        'gem_score': gem.astype(np.int64),
+        'avail_score': avail,
+        'combined': gem.astype(np.int64) + avail,
+        'signal_count': signal_count,
+        'convergence': convergence,
+        'is_stab': is_stab,
+        'complaints_per_unit': cpr,
+        'recent_complaints_per_unit': rcpr,
+        'noise_per_unit': npr,
+        'distress_per_unit': dpu,
+        'kinds': fired,
+        'lifts': lifts,
+    }
+
+
+def signals_for(fs, row, kinds, lifts):
+    """[(name, lift, detail)] for one building, strongest first.
+
+    fs: FeatureStore; row: the building's row in it; kinds, lifts: that
+    row of score()['kinds'] and score()['lifts'].
+    """
+    sig = []
+    for slot, kind, lift in zip(SLOTS, kinds, lifts):
+        kind, lift = int(kind), float(lift)
+        if not kind:
+            continue
+        if slot == 'permit':
+            cost, count = float(fs.permit_max_cost[row]), int(fs.permit_count[row])
+            sig.append([
+                ('DOB permit ($200K+)', f"${cost:,.0f} max cost"),
+                ('DOB permit ($50-200K)', f"${cost:,.0f} max cost"),
+                ('DOB permit (<$10K)', f"${cost:,.0f} — cosmetic pre-sale?"),
+                ('DOB alteration', f"{count} permits"),
+                ('DOB permit', f"{count} permits"),
+            ][kind - 1] + (lift,))
+        elif slot == 'litigation':
+            count = int(fs.lit_count[row])
+            if kind == 1:
+                sig.append(('HPD tenant action', f"{count} cases", lift))
+            elif kind == 2:
+                types = ', '.join(sorted(fs.lit_type_names(fs.lit_types[row])))
+                sig.append(('HPD litigation', types, lift))
+            else:
+                sig.append(('HPD litigation', f"{count} cases", lift))
+        elif slot == 'distress':
+            dc, units = int(fs.distress_recent[row]), int(fs.units[row])
+            dpu = dc / units if units > 0 else 0
+            name = '311 distress (heavy)' if kind == 1 else '311 distress'
+            sig.append((name, f"{dc} complaints ({dpu:.1f}/unit)", lift))
+        elif slot == 'eviction':
+            sig.append(('Marshal eviction', f"{int(fs.evictions_recent[row])} evictions", lift))
+        elif slot == 'ecb':
+            sig.append(('ECB unpaid fines', f"${float(fs.ecb_unpaid[row]):,.0f} owed", lift))
+        elif slot == 'agreement':
+            sig.append(('ACRIS agreement', f"{int(fs.agreements[row])} agreements", lift))
+        elif slot == 'satisfaction':
+            sig.append(('Mortgage satisfaction', f"{int(fs.satisfactions[row])} payoffs", lift))
+        elif slot == 'owner':
+            sig.append(('Owner changed', 'corporate owner name differs in HPD records', lift))
+    # (name, detail, lift) → (name, lift, detail), sorted stably by lift
+    return sorted(((n, l, d) for n, d, l in sig), key=lambda s: s[1], reverse=True)
+
+
+def gem_reasons(fs, row):
+    """Plain-English reasons behind a building's Gem score."""
+    reasons = []
+    units = int(fs.units[row])
+    sqft = float(fs.avg_sqft[row])
+    sqft = int(sqft) if sqft.is_integer() else sqft
+    for floor, label in ((2000, ' — very spacious'), (1500, ' — spacious'),
+                         (1200, ' — good size'), (1000, ' — decent'), (800, '')):
+        if sqft >= floor:
+            reasons.append(f"{sqft:,} sqft avg{label}")
+            break
+
+    cpr = int(fs.complaints_total[row]) / units if units > 0 else 0
+    if cpr == 0:
+        reasons.append("zero complaints ever")
+    elif cpr < 1:
+        reasons.append(f"very clean record ({cpr:.1f} complaints/unit)")
+    elif cpr < 3:
+        reasons.append(f"good maintenance ({cpr:.1f} complaints/unit)")
+
+    npr = int(fs.noise_total[row]) / units if units > 0 else 0
+    if npr == 0:
+        reasons.append("zero noise complaints")
+    elif npr < 0.5:
+        reasons.append("quiet building")
+
+    yr = int(fs.year_built[row])
+    if 1880 <= yr <= 1945:
+        reasons.append(f"prewar ({yr})")
+    elif yr >= 2015:
+        reasons.append(f"new construction ({yr})")
+    if 6 <= units <= 30:
+        reasons.append(f"boutique ({units} units)")
+    stab = int(fs.stab_units[row])
+    if stab > 0:
+        reasons.append(f"rent stabilized ({stab} units)")
+    return reasons
+
+
+# ── Entry points ─────────────────────────────────────────────────────────
+
+def score_all(db, cutoff=None, bbls=None, log=print, lifts=None):
+    """Batch mode: every building in the feature snapshot (rebuilt if stale),
+    or just the snapshot rows for `bbls`, in their order.
+    Returns (fs, rows, score output)."""
+    fs = ensure_features(db, cutoff, log=log)
+    rows = np.arange(len(fs)) if bbls is None else fs.rows(bbls)
+    return fs, rows, score(fs.cols, rows, fs.lit_vocab, lifts)
+
+
+def score_bbls(db, bbls, cutoff=None, log=None, lifts=None):
+    """Targeted mode: aggregate and score just `bbls`, straight from the
+    source tables. Returns (fs, rows, score output); BBLs that aren't
+    residential buildings are absent."""
+    cols, meta = build_features(db, cutoff, log=log or (lambda *a: None), bbls=bbls)
+    fs = FeatureStore(cols, meta)
+    rows = np.arange(len(fs))
+    return fs, rows, score(fs.cols, rows, fs.lit_vocab, lifts)
+
+
+def results(fs, rows, res, reasons=False):
+    """One dict per scored building, aligned with `rows`."""
+    r = {name: col.tolist() for name, col in res.items() if name not in ('kinds', 'lifts')}
+    out = []
+    for i, row in enumerate(np.asarray(rows).tolist()):
+        units = int(fs.units[row])
+        signals = (signals_for(fs, row, res['kinds'][i], res['lifts'][i])
+                   if r['signal_count'][i] else [])
+        traded = int(fs.units_traded[row])
+        s = {
+            'bbl': int(fs.bbl[row]),
+            # gem components
+            'complaints_per_unit': round(r['complaints_per_unit'][i], 1),
+            'recent_complaints_per_unit': round(r['recent_complaints_per_unit'][i], 1),
+            'noise_per_unit': round(r['noise_per_unit'][i], 1),
+            'rent_stabilized': r['is_stab'][i],
+            'stab_units': int(fs.stab_units[row]),
+            # availability components
+            'signal_count': r['signal_count'][i],
+            'convergence': CONVERGENCE[r['convergence'][i]],
+            'signals': [(sig[0], sig[2]) for sig in signals],
+            'units_traded': traded,
+            'turnover_pct': round(traded / units * 100, 1) if units > 0 else 0,
+            'last_sale_date': int_to_iso(fs.last_sale_date[row]),
+            'last_sale_amt': float(fs.last_sale_amt[row]),
+            # scores
+            'gem_score': r['gem_score'][i],
+            'avail_score': r['avail_score'][i],
+            'combined': r['combined'][i],
+        }
+        if reasons:
+            s['gem_reasons'] = gem_reasons(fs, row)
+        out.append(s)
+    return out
+
+
+ONE_CACHE_SIZE = 4096
+_one_cache = OrderedDict()
+_one_cache_lock = threading.Lock()
+
+
+def score_one(db, bbl, cutoff=None, lifts=None):
+    """Single-BBL mode: results() dict for one building (with gem_reasons),
+    or None if it isn't a residential building.
+
+    Cached per (bbl, cutoff, source tables' MAX(rowid), lifts), so a hit
+    costs a handful of index lookups and any load into the database or new
+    lift table invalidates it.
+    """
+    cutoff = cutoff or default_cutoff()
+    lifts = lifts or current_lifts()
+    key = (int(bbl), cutoff, tuple(source_version(db).values()), lifts_version(lifts))
+    with _one_cache_lock:
+        if key in _one_cache:
+            _one_cache.move_to_end(key)
+            return _one_cache[key]
+
+    fs, rows, res = score_bbls(db, [bbl], cutoff, lifts=lifts)
+    result = results(fs, rows, res, reasons=True)[0] if len(rows) else None
+
+    with _one_cache_lock:
+        _one_cache[key] = result
+        if len(_one_cache) > ONE_CACHE_SIZE:
+            _one_cache.popitem(last=False)
+    return result
+
+
+# ── Parallel batch ───────────────────────────────────────────────────────
+# BBL = borough (1 digit) · block (5) · lot (4), so a BBL range is a run of
+# whole blocks and every source table's bbl index serves it as one range scan.
+
+BLOCK = 10_000
+BOROUGH = 1_000_000_000
+
+
+def shard_ranges(bbls, shards, by='block'):
+    """Split sorted BBLs into (lo, hi) half-open ranges.
+
+    by='borough': one range per borough present.
+    by='block': `shards` ranges of about equal building count, cut on block
+    boundaries so a block never straddles two shards.
+    """
+    bbls = sorted(int(b) for b in bbls)
+    if not bbls:
+        return []
+    if by == 'borough':
+        return [(b * BOROUGH, (b + 1) * BOROUGH) for b in sorted({x // BOROUGH for x in bbls})]
+    if by != 'block':
+        raise ValueError(f"unknown shard key: {by}")
+
+    cuts = []
+    step = max(1, -(-len(bbls) // shards))
+    for i in range(step, len(bbls), step):
+        cut = bbls[i] // BLOCK * BLOCK
+        if cut > (cuts[-1] if cuts else bbls[0]):
+            cuts.append(cut)
+    bounds = [bbls[0] // BLOCK * BLOCK] + cuts + [bbls[-1] // BLOCK * BLOCK + BLOCK]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _score_shard(path, bbl_range, cutoff, lifts):
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        cols, meta = build_features(db, cutoff, log=lambda *a: None, bbl_range=bbl_range)
+    finally:
+        db.close()
+    fs = FeatureStore(cols, meta)
+    rows = np.arange(len(fs))
+    return results(fs, rows, score(fs.cols, rows, fs.lit_vocab, lifts)), meta
+
+
+def score_sharded(path, cutoff=None, bbls=None, workers=None, by='block', log=print,
+                  lifts=None):
+    """Parallel batch mode: score BBL ranges in worker processes.
+
+    Each worker opens its own read-only connection to the database at
+    `path` and aggregates only its shard's rows. With `bbls`, shards cover
+    just the ranges those BBLs fall in and other buildings are dropped.
+    Returns (results dicts in BBL order, meta of the first shard).
+    """
+    cutoff = cutoff or default_cutoff()
+    lifts = lifts or current_lifts()    # resolved once so every shard agrees
+    workers = workers or os.cpu_count()
+    if bbls is None:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        bbls = [r[0] for r in db.execute(
+            "SELECT bbl FROM buildings WHERE units_residential > 0 AND residential_area > 0")]
+        db.close()
+    wanted = set(int(b) for b in bbls)
+    # A few shards per worker so one slow range doesn't hold up the pool.
+    ranges = shard_ranges(wanted, workers * 4, by=by)
+    log(f"  {len(ranges)} shards ({by}) over {workers} workers")
+
+    # fork where the platform has it: workers need nothing from __main__,
+    # and spawn would re-run module-level scripts in every worker.
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    out, meta = [], None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [pool.submit(_score_shard, str(path), r, cutoff, lifts) for r in ranges]
+        for fut in futures:
+            shard, shard_meta = fut.result()
+            out.extend(s for s in shard if s['bbl'] in wanted)
+            meta = meta or shard_meta
+    return out, meta
@@ -0,0 +1,374 @@
+"""
+Shared HTTP client for the NYC Open Data (Socrata) pullers.
+
+    async with SocrataClient(concurrency=8, rate=4) as client:
+        n = await client.count(url, "borough='1'")
+        rows = await client.get(url, {'$select': ..., '$where': ...})
+        async for offset, page in client.pages(url, {'$select': ..., '$order': ...}):
+            await asyncio.to_thread(cache.write, offset // BATCH, page)
+
+    with SyncClient() as client:          # the same client, for blocking code
+        for offset, page in client.pages(url, params):
+            db.executemany(...)
+
+One aiohttp session per client keeps its connections alive and asks for
+gzip, so a page costs one request on a warm TLS connection rather than a
+curl process and a fresh handshake. A semaphore bounds the requests in
+flight. A token bucket shared by every request of the client bounds the
+request rate, however many partitions or datasets are paging at once.
+A 429 pauses the whole bucket, so every task backs off, not only the one
+that was told to.
+
+Failed requests (connection errors, timeouts, 429, 5xx, a truncated body)
+are retried with exponential backoff and jitter, honouring Retry-After.
+A request Socrata rejects outright (400, 403, 404: a bad query, a wrong
+dataset id) is not retried. Either way get() raises FetchError when it
+gives up, and the pullers stop there and resume from their caches.
+
+Response bodies are decoded as they arrive (ArrayDecoder): each record is
+parsed out of the JSON array once its bytes are in, so a 50K-row page is
+never held as one large string next to its parsed records.
+
+pages() pages a query by $offset and keeps `prefetch` pages in flight, so
+the next pages download while the caller writes this one. Pages are
+yielded in offset order, and a failure stops the generator, so callers
+never see a gap.
+
+Set SOCRATA_APP_TOKEN to send an app token, which raises Socrata's
+throttling limits. Set SOCRATA_BASE (e.g. http://127.0.0.1:8765) to send
+every request to that host instead, keeping the /resource/... path: that
+is how the pullers are pointed at vayo.mock_socrata. The tuning defaults
+below are read when a client is created, so a harness can change them.
+"""
+
+import asyncio
+import codecs
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import aiohttp
+
+BATCH = 50000
+CONCURRENCY = 8          # requests in flight per client
+RATE = 4.0               # requests per second, averaged by the token bucket
+BURST = 8
+PREFETCH = 2             # pages in flight per pages() stream
+RETRIES = 8
+BACKOFF = 5.0            # seconds before the first retry; doubles each time
+BACKOFF_CAP = 120.0
+RATE_LIMIT_WAIT = 30.0   # 429 without a Retry-After header
+TIMEOUT = 600            # seconds without a byte before a read gives up
+CHUNK = 1 << 16
+
+# Statuses that mean "try again later"; anything else outside 2xx is final.
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """A Socrata request failed for good (after retries, or rejected)."""
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Streaming JSON
+# ══════════════════════════════════════════════════════════════════════════
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class ArrayDecoder:
+    """Incremental decoder for a JSON array of records.
+
+        decoder = ArrayDecoder()
+        for text in chunks:
+            records.extend(decoder.feed(text))
+        decoder.close()     # ValueError if the array never ended
+    """
+
+    def __init__(self):
+        self._decode = json.JSONDecoder().raw_decode
+        self.buf = ''
+        self.started = False
+        self.done = False
+
+    def feed(self, text):
+        """Records completed by `text`, in order."""
+        buf = self.buf + text
+        pos, n, out = 0, len(buf), []
+        while not self.done:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos >= n:
+                break
+            if not self.started:
+                if buf[pos] != '[':
+                    # Socrata reports errors as an object, not an array.
+                    raise ValueError(f"not a JSON array: {buf[pos:pos + 200]!r}")
+                self.started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                self.done = True
+                pos += 1
+                break
+            try:
+                rec, pos = self._decode(buf, pos)
+            except json.JSONDecodeError:
+                break       # the record continues in the next chunk
+            out.append(rec)
+        self.buf = buf[pos:]
+        return out
+
+    def close(self):
+        if not self.done:
+            raise ValueError(f"truncated JSON array: {self.buf[:200]!r}")
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Rate limiting
+# ══════════════════════════════════════════════════════════════════════════
+
+class TokenBucket:
+    """`rate` requests per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Hold every request for `seconds` (the server answered 429)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Client
+# ══════════════════════════════════════════════════════════════════════════
+
+class SocrataClient:
+    """Pooled, rate-limited, retrying Socrata client. Use as an async
+    context manager; one per process is enough."""
+
+    def __init__(self, concurrency=None, rate=None, burst=None,
+                 retries=None, backoff=None, timeout=None,
+                 app_token=None, log=print):
+        self.concurrency = concurrency or CONCURRENCY
+        self.rate = RATE if rate is None else rate
+        self.burst = burst or BURST
+        self.retries = retries or RETRIES
+        self.backoff = BACKOFF if backoff is None else backoff
+        self.timeout = timeout or TIMEOUT
+        self.app_token = app_token or os.environ.get('SOCRATA_APP_TOKEN')
+        self.base = os.environ.get('SOCRATA_BASE', '').rstrip('/')
+        self.log = log
+        self.session = None
+        # requests sent, retries, records and (decompressed) bytes received
+        self.stats = {'requests': 0, 'retries': 0, 'rows': 0, 'bytes': 0}
+
+    async def __aenter__(self):
+        headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        if self.app_token:
+            headers['X-App-Token'] = self.app_token
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency,
+                                           keepalive_timeout=60, ttl_dns_cache=300),
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30,
+                                          sock_read=self.timeout),
+        )
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._bucket = TokenBucket(self.rate, self.burst)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _route(self, url):
+        if not self.base:
+            return url
+        parts = urlsplit(url)
+        return self.base + parts.path + (f"?{parts.query}" if parts.query else '')
+
+    def _wait(self, attempt):
+        return min(BACKOFF_CAP, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _read(self, resp):
+        records, size = [], 0
+        text = codecs.getincrementaldecoder('utf-8')()
+        decoder = ArrayDecoder()
+        async for chunk in resp.content.iter_chunked(CHUNK):
+            size += len(chunk)
+            records.extend(decoder.feed(text.decode(chunk)))
+        records.extend(decoder.feed(text.decode(b'', final=True)))
+        decoder.close()
+        self.stats['bytes'] += size
+        return records
+
+    async def get(self, url, params=None, label=''):
+        """Records returned by one query. Raises FetchError once retries
+        are exhausted or the query is rejected."""
+        label = label or url
+        url = self._route(url)
+        reason = None
+        for attempt in range(self.retries):
+            await self._bucket.acquire()
+            wait = None
+            async with self._sem:
+                self.stats['requests'] += 1
+                try:
+                    async with self.session.get(url, params=params) as resp:
+                        if resp.status == 200:
+                            records = await self._read(resp)
+                            self.stats['rows'] += len(records)
+                            return records
+                        body = (await resp.text())[:200]
+                        reason = f"HTTP {resp.status}"
+                        if resp.status not in RETRY_STATUS:
+                            raise FetchError(f"{label}: {reason}: {body}")
+                        wait = _retry_after(resp)
+                        if resp.status == 429:
+                            wait = wait or max(RATE_LIMIT_WAIT, self._wait(attempt))
+                            self._bucket.pause(wait)
+                            reason = "rate limited"
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    reason = f"{type(e).__name__}: {str(e)[:120]}"
+            if attempt + 1 == self.retries:
+                break
+            wait = wait or self._wait(attempt)
+            self.stats['retries'] += 1
+            self.log(f"    [{label}] {reason}, retry {attempt + 1}/{self.retries - 1} "
+                     f"(wait {wait:.0f}s)...")
+            await asyncio.sleep(wait)
+        raise FetchError(f"{label}: gave up after {self.retries} attempts ({reason})")
+
+    async def count(self, url, where=None, label=''):
+        """count(*) of a dataset, optionally under a $where filter."""
+        params = {'$select': 'count(*) AS n'}
+        if where:
+            params['$where'] = where
+        rows = await self.get(url, params, label=label)
+        return int(rows[0]['n']) if rows else 0
+
+    async def pages(self, url, params, batch=BATCH, start=0, prefetch=PREFETCH, label=''):
+        """(offset, records) for each $offset page of a query, from offset
+        `start`, ending after the first short page. `params` should carry an
+        $order so the pages are stable. Up to `prefetch` pages are requested
+        ahead of the one being handled."""
+        params = {**params, '$limit': batch}
+        label = label or url
+        pending = deque()
+        next_offset = start
+
+        def launch():
+            nonlocal next_offset
+            task = asyncio.ensure_future(self.get(
+                url, {**params, '$offset': next_offset}, label=f"{label} @{next_offset:,}"))
+            pending.append((next_offset, task))
+            next_offset += batch
+
+        try:
+            for _ in range(max(1, prefetch)):
+                launch()
+            while pending:
+                offset, task = pending.popleft()
+                records = await task
+                if len(records) < batch:
+                    yield offset, records
+                    return
+                launch()
+                yield offset, records
+        finally:
+            for _, task in pending:
+                task.cancel()
+            await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+
+
+# ══════════════════════════════════════════════════════════════════════════
+# Blocking facade
+# ══════════════════════════════════════════════════════════════════════════
+
+_END = object()
+
+
+async def _next(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+class SyncClient:
+    """SocrataClient for blocking code (scripts that write SQLite as pages
+    arrive). The client runs on an event loop in a background thread, so
+    pages() keeps prefetching while the caller works on the current page."""
+
+    def __init__(self, **kwargs):
+        self.client = SocrataClient(**kwargs)
+        self.stats = self.client.stats
+        self.loop = None
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._call(self.client.__aenter__())
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._call(self.client.__aexit__(*exc))
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def get(self, url, params=None, label=''):
+        return self._call(self.client.get(url, params, label=label))
+
+    def count(self, url, where=None, label=''):
+        return self._call(self.client.count(url, where, label=label))
+
+    def pages(self, url, params, **kwargs):
+        agen = self.client.pages(url, params, **kwargs)
+        try:
+            while True:
+                item = self._call(_next(agen))
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self._call(agen.aclose())
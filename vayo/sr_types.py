@@ -0,0 +1,121 @@
+"""
+Dictionary encoding for 311 complaint types.
+
+    sr_types (type_id, complaint_type, descriptor, is_noise, is_distress, ...)
+    service_requests.type_id  → sr_types.type_id, indexed
+
+There are a few thousand distinct (complaint_type, descriptor) pairs across
+15M service requests. Each pair is classified once, with the same LIKE
+predicates the scorer used to run per row, and the result is stored as 0/1
+flags on its sr_types row. Callers then filter service_requests on an
+integer IN list (type_ids(db, 'noise')) that idx_sr_type_id can serve,
+instead of a '%...%' string scan no index can.
+
+Only rows with type_id IS NULL get encoded, so after new requests are
+appended a refresh touches just those:
+
+    python3 -m vayo.sr_types
+"""
+
+import sqlite3
+import time
+
+DISTRESS_TYPES = ['HEAT', 'WATER', 'PLUMBING', 'UNSANITARY', 'PAINT', 'PLASTER']
+
+# category → SQL predicate over an sr_types row. '' stands for NULL.
+CATEGORIES = {
+    'noise': "complaint_type LIKE '%Noise%'",
+    'distress': ' OR '.join(f"complaint_type LIKE '%{t}%'" for t in DISTRESS_TYPES),
+    'heat': "complaint_type LIKE '%HEAT%'",
+    'rodent': "complaint_type LIKE '%Rodent%'",
+}
+
+
+def ensure_tables(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS sr_types (
+            type_id INTEGER PRIMARY KEY,
+            complaint_type TEXT NOT NULL,
+            descriptor TEXT NOT NULL,
+            UNIQUE (complaint_type, descriptor)
+        )
+    """)
+    have = {r[1] for r in db.execute("PRAGMA table_info(sr_types)")}
+    for name in CATEGORIES:
+        if f"is_{name}" not in have:
+            # New category: classify every existing type for it.
+            db.execute(f"ALTER TABLE sr_types ADD COLUMN is_{name} INTEGER NOT NULL DEFAULT 0")
+            db.execute(f"UPDATE sr_types SET is_{name} = ({CATEGORIES[name]})")
+
+    have = {r[1] for r in db.execute("PRAGMA table_info(service_requests)")}
+    if 'type_id' not in have:
+        db.execute("ALTER TABLE service_requests ADD COLUMN type_id INTEGER")
+
+
+def refresh_sr_types(db):
+    """Encode every service request that has no type_id yet.
+
+    Returns the number of rows encoded.
+    """
+    ensure_tables(db)
+    db.execute("""
+        INSERT OR IGNORE INTO sr_types (complaint_type, descriptor)
+        SELECT DISTINCT COALESCE(complaint_type, ''), COALESCE(descriptor, '')
+        FROM service_requests WHERE type_id IS NULL
+    """)
+    # Reclassify every type: a few thousand rows, and picks up edited predicates.
+    flags = ', '.join(f"is_{name} = ({pred})" for name, pred in CATEGORIES.items())
+    db.execute(f"UPDATE sr_types SET {flags}")
+
+    n = db.execute("""
+        UPDATE service_requests SET type_id = (
+            SELECT t.type_id FROM sr_types t
+            WHERE t.complaint_type = COALESCE(service_requests.complaint_type, '')
+              AND t.descriptor = COALESCE(service_requests.descriptor, '')
+        )
+        WHERE type_id IS NULL
+    """).rowcount
+    # Built after the first encode so the bulk UPDATE doesn't maintain it.
+    db.execute("CREATE INDEX IF NOT EXISTS idx_sr_type_id ON service_requests(type_id)")
+    db.commit()
+    return n
+
+
+def is_encoded(db):
+    """True if every service request has a type_id to filter on."""
+    try:
+        pending = db.execute(
+            "SELECT 1 FROM service_requests WHERE type_id IS NULL LIMIT 1").fetchone()
+        db.execute("SELECT type_id FROM sr_types LIMIT 0")
+    except sqlite3.OperationalError:
+        return False
+    return pending is None
+
+
+def type_ids(db, category):
+    """Sorted type_ids flagged with `category`."""
+    if category not in CATEGORIES:
+        raise ValueError(f"unknown 311 category: {category}")
+    return [r[0] for r in db.execute(
+        f"SELECT type_id FROM sr_types WHERE is_{category} ORDER BY type_id")]
+
+
+def in_list(ids):
+    """Inline SQL list for an integer IN (...) filter."""
+    return ','.join(str(int(i)) for i in ids) or 'NULL'
+
+
+def main():
+    from . import MAIN_DB
+
+    db = sqlite3.connect(str(MAIN_DB))
+    t = time.time()
+    n = refresh_sr_types(db)
+    types = db.execute("SELECT COUNT(*) FROM sr_types").fetchone()[0]
+    db.close()
+    print(f"  sr_types: {n:,} service requests encoded, "
+          f"{types:,} distinct types ({time.time()-t:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
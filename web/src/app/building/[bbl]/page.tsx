@@ -14,6 +14,7 @@ import {
   Violation,
   Contact,
   Litigation,
+  Dossier,
   BOROUGH_MAP,
 } from "@/lib/types";
 import { ScoreCard } from "@/components/ScoreCard";
@@ -58,16 +59,15 @@ export default function BuildingDossier() {
   useEffect(() => {
     if (!bblNum) return;
     setLoading(true);
-    Promise.all([
-      apiFetch<Building>(`/api/buildings/${bblNum}`),
-      apiFetch<BuildingScore>(`/api/buildings/${bblNum}/score`),
-      apiFetch<ComplaintStats>(`/api/buildings/${bblNum}/complaint-stats`),
-    ]).then(([b, s, cs]) => {
-      setBuilding(b);
-      setScore("gem_score" in s ? s : null);
-      setComplaintStats(cs);
-      setLoading(false);
-    });
+    apiFetch<Dossier>(
+      `/api/buildings/${bblNum}/dossier?sections=score,complaint_stats`
+    )
+      .then((d) => {
+        setBuilding(d.building);
+        setScore(d.score ?? null);
+        setComplaintStats(d.complaint_stats ?? null);
+      })
+      .finally(() => setLoading(false));
   }, [bblNum]);
 
   useEffect(() => {
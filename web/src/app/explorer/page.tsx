@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { useRouter } from "next/navigation";
 import { apiFetch } from "@/lib/api";
 import { BOROUGH_MAP } from "@/lib/types";
@@ -49,6 +49,8 @@ export default function ExplorerPage() {
   const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(false);
   const [page, setPage] = useState(0);
+  // cursors[n] is the keyset cursor that fetches page n (null = use offset)
+  const cursors = useRef<(string | null)[]>([null]);
   const limit = 100;
 
   const fetchBuildings = useCallback(async () => {
@@ -62,14 +64,19 @@ export default function ExplorerPage() {
     params.set("sort", filters.sort);
     params.set("dir", filters.dir);
     params.set("limit", String(limit));
-    params.set("offset", String(page * limit));
+    const cursor = cursors.current[page];
+    if (cursor) params.set("cursor", cursor);
+    else params.set("offset", String(page * limit));
 
     try {
-      const data = await apiFetch<{ total: number; buildings: BuildingRow[] }>(
-        `/api/buildings?${params}`
-      );
+      const data = await apiFetch<{
+        total: number;
+        buildings: BuildingRow[];
+        next_cursor: string | null;
+      }>(`/api/buildings?${params}`);
       setBuildings(data.buildings);
       setTotal(data.total);
+      cursors.current[page + 1] = data.next_cursor;
     } catch {
       setBuildings([]);
     } finally {
@@ -82,6 +89,7 @@ export default function ExplorerPage() {
   }, [fetchBuildings]);
 
   function updateFilter(key: keyof FilterState, value: string | number | boolean) {
+    cursors.current = [null];
     setPage(0);
     setFilters((prev) => ({ ...prev, [key]: value }));
   }
@@ -29,6 +29,7 @@ export interface BuildingScore {
   rent_stabilized: boolean | number;
   stab_units: number;
   signals: string | null;
+  gem_reasons?: string[];
 }
 
 export interface Complaint {
@@ -44,6 +45,7 @@ export interface ComplaintStats {
   total: number;
   by_year: { year: string; cnt: number }[];
   by_category: { category: string | null; cnt: number }[];
+  by_severity: { severity: string | null; cnt: number }[];
 }
 
 export interface Sale {
@@ -91,6 +93,22 @@ export interface Litigation {
   status: string | null;
 }
 
+export interface Dossier {
+  building: Building;
+  score?: BuildingScore | null;
+  complaint_stats?: ComplaintStats;
+  complaints?: Complaint[];
+  sales?: Sale[];
+  permits?: Permit[];
+  violations?: Violation[];
+  contacts?: Contact[];
+  litigation?: Litigation[];
+  listings?: {
+    elliman: EllimanListing[];
+    streeteasy: { building: unknown; units: unknown[] };
+  };
+}
+
 export interface WatchlistItem {
   bbl: number;
   added_at: string | null;